@@ -2,43 +2,48 @@
 Nova Chatbot – Backend (app.py)
 ================================
 
+Konfiguration, Memories, Sitzungs‑Cookies und Antwortaufbereitung teilt sich
+app.py mit asgi.py über chat_service.py; hier stehen nur die synchronen
+Cosmos‑Aufrufe und die Routen.
+
 1.  Standard‑ & Drittanbieter‑Importe
-2.  Konfiguration & Logging
+2.  Logging
 3.  Cosmos DB (Client, Datenbank, Container)
-4.  Large‑Language‑Model (Azure OpenAI) & Memory‑Store
-5.  Flask‑Anwendung
-6.  Routen / Endpoints
-    6.1  GET  /                    – index
-    6.2  POST /start-session       – start_session
-    6.3  POST /chat                – chat
-    6.4  POST /end-session         – end_session
-    6.5  GET  /get-sessions        – get_sessions
-    6.6  GET  /get-session/<id>    – get_session
-    6.7  POST /select-session/<id> – select_session
-7.  main‑Guard (Entwicklungs‑Server)
+4.  Flask‑Anwendung
+5.  Routen / Endpoints
+    5.1  GET  /                    – index
+    5.2  POST /start-session       – start_session
+    5.3  POST /chat                – chat
+    5.3b POST /chat/stream         – chat_stream (Server‑Sent Events)
+    5.4  POST /end-session         – end_session
+    5.5  GET  /get-sessions        – get_sessions
+    5.6  GET  /get-session/<id>    – get_session
+    5.7  POST /select-session/<id> – select_session
+6.  main‑Guard (Entwicklungs‑Server)
 """
 
 # ==========================================================
 # 1) Standard- und Drittanbieter‑Importe
 # ==========================================================
-import os
-import uuid
-import datetime
 import logging
-import traceback
-import json
 import openai
 
-from flask import Flask, render_template, request, jsonify, session
-from azure.cosmos import CosmosClient, PartitionKey
-from langchain.schema import HumanMessage
-from langchain.memory import ConversationBufferWindowMemory, ConversationSummaryBufferMemory
-from langchain_openai import AzureChatOpenAI
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context
+from azure.cosmos import CosmosClient
 
-from orchestration.orchestrator import dispatch  # Zentrale Entscheidungslogik
+from orchestration.orchestrator import dispatch, dispatch_stream  # Zentrale Entscheidungslogik
+from chat_store import (  # Append-only-Persistenz & Sitzungsindex pro Nutzer
+    append_exchange, email_from_chat_id, list_sessions, new_chat_document, read_chat_document, read_session_index, update_session_index
+)
+from chat_service import (  # Gemeinsame Logik von app.py und asgi.py
+    ANONYMOUS, COSMOS_DATABASE, COSMOS_ENDPOINT, COSMOS_KEY, CONTAINER_OPTIONS, GENERIC_ERROR_MESSAGE, SECRET_KEY,
+    SSE_HEADERS, STATIC_DIR, TEMPLATE_DIR, bind_chat, bind_session, chat_document_response, claim_document,
+    claimed_chat_id, clear_session, commit_message_count, content_filter_message, done_event, exchange_payload,
+    generate_chat_id, indexed, memory_store, parse_chat_request, select_email, session_email, sse_event, user_message
+)
 
 # ==========================================================
-# 2) Konfiguration & Logging
+# 2) Logging
 # ==========================================================
 # Azure‑SDKs erzeugen sehr viele Log‑Einträge – wir reduzieren das auf ERROR
 logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(logging.ERROR)
@@ -46,198 +51,110 @@ logging.getLogger("azure").setLevel(logging.ERROR)
 logging.basicConfig(level=logging.DEBUG,
                     format='%(asctime)s [%(levelname)s] %(message)s')
 
-# Cosmos DB – Verbindungsparameter aus Umgebungsvariablen (Fallbacks s.u.)
-COSMOS_ENDPOINT  = os.environ.get("COSMOS_ENDPOINT")
-COSMOS_KEY       = os.environ.get("COSMOS_KEY")
-COSMOS_DATABASE  = os.environ.get("COSMOS_DATABASE",  "ChatDB")
-COSMOS_CONTAINER = os.environ.get("COSMOS_CONTAINER", "Chats")
-
 # ==========================================================
 # 3) Cosmos DB (Client, DB, Container)
 # ==========================================================
 client    = CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY)
 database  = client.create_database_if_not_exists(id=COSMOS_DATABASE)
-container = database.create_container_if_not_exists(
-    id=COSMOS_CONTAINER,
-    partition_key=PartitionKey(path="/email")
-)
+container = database.create_container_if_not_exists(**CONTAINER_OPTIONS)
 
 # ==========================================================
-# 4) LLM & Conversation Memories
+# 4) Flask‑App‑Initialisierung
 # ==========================================================
-# summarizer_llm wird ausschließlich für ConversationSummaryBufferMemory
-# verwendet. Deployment‑Namen & Version stammen aus ENV‑Variablen.
-summarizer_llm = AzureChatOpenAI(
-    azure_endpoint      = os.environ["OPENAI_ENDPOINT"],
-    azure_deployment    = os.environ["OPENAI_DEPLOYMENT_NAME_4o"],
-    openai_api_version  = os.environ["OPENAI_API_VERSION"],
-    model_name          = "gpt-4"
-)
-
-# Pro Chat‑ID werden unterschiedliche Memory‑Objekte in diesem Dict geführt
-memory_store: dict[str, dict] = {}
+app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder=STATIC_DIR)
+app.secret_key = SECRET_KEY
 
 # ==========================================================
-# 5) Flask‑App‑Initialisierung
-# ==========================================================
-# Ablagepfade für Frontend‑Dateien (relative zum Projekt‑Root)
-template_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../Interface/frontend'))
-static_dir   = os.path.abspath(os.path.join(os.path.dirname(__file__), '../Interface/static'))
-
-app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
-app.secret_key = 'dein_geheimer_schluessel'  # ⚠ In Produktion durch Secret Manager ersetzen
-
-# ==========================================================
-# 6) Routen / Endpoints
+# 5) Routen / Endpoints
 # ==========================================================
 
 # ----------------------------------------------------------------------
-# 6.1  Index – liefert das Frontend‑HTML (Single‑Page‑App)
+# 5.1  Index – liefert das Frontend‑HTML (Single‑Page‑App)
 # ----------------------------------------------------------------------
 @app.route('/')
 def index():
     return render_template('index.html')
 
 # ----------------------------------------------------------------------
-# 6.2  /start-session – Neue Session anlegen / bestehende übernehmen
+# 5.2  /start-session – Neue Session anlegen / bestehende übernehmen
 # ----------------------------------------------------------------------
 @app.route('/start-session', methods=['POST'])
 def start_session():
-    new_email   = request.form.get('email') or "anonymous"
-    old_email   = session.get('email', 'anonymous')
-    old_chat_id = session.get('chat_id')  # kann None sein
+    new_email   = request.form.get('email') or ANONYMOUS
+    old_chat_id = claimed_chat_id(session, new_email)
 
     # ---------- Sonderfall ------------------------------------------------
     # Ein anonymer Chat wird nachträglich einer konkreten E‑Mail zugeordnet.
-    if old_email == "anonymous" and new_email != "anonymous" and old_chat_id:
-        try:
-            old_doc = container.read_item(item=old_chat_id, partition_key=old_email)
-        except Exception:
-            old_doc = None
-
-        new_chat_id = f"{new_email}-{uuid.uuid4().hex[:8]}"
+    if old_chat_id:
+        old_doc     = read_chat_document(container, old_chat_id, ANONYMOUS)
+        new_chat_id = generate_chat_id(new_email)
 
         if old_doc:
             # Dokument kopieren unter neuer ID + Metadaten anpassen
-            old_doc["id"]        = new_chat_id
-            old_doc["email"]     = new_email
-            old_doc["created_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-            container.create_item(body=old_doc)
-            container.delete_item(item=old_chat_id, partition_key=old_email)
+            new_doc = claim_document(old_doc, new_email, new_chat_id)
+            container.create_item(body=new_doc)
+            container.delete_item(item=old_chat_id, partition_key=ANONYMOUS)
+            if new_doc.get("messages"):
+                update_session_index(container, new_email, new_chat_id, new_doc["messages"], len(new_doc["messages"]))
 
         # Memory‑Eintrag umhängen, falls vorhanden
-        if old_chat_id in memory_store:
-            memory_store[new_chat_id] = memory_store.pop(old_chat_id)
-
-        # Session‑Cookies aktualisieren
-        session['email']   = new_email
-        session['chat_id'] = new_chat_id
+        memory_store.rename(old_chat_id, new_chat_id)
+        bind_session(session, new_chat_id, new_email)
         return jsonify({'chat_id': new_chat_id})
 
     # ---------- Normalfall ------------------------------------------------
     # Neue Session (E‑Mail -> neue Session oder anonymous‐>anonymous Refresh)
-    session_id = f"{new_email}-{uuid.uuid4().hex[:8]}"
-    session['email']   = new_email
-    session['chat_id'] = session_id
+    session_id = generate_chat_id(new_email)
+    bind_session(session, session_id, new_email)
 
     # Conversation Memories anlegen
-    memory_store[session_id] = {
-        "global_buffer": ConversationBufferWindowMemory(memory_key="history", return_messages=False, k=3),
-        "global_summary": ConversationSummaryBufferMemory(
-            memory_key="history",
-            return_messages=False,
-            llm=summarizer_llm,
-            max_token_limit=300
-        )
-    }
+    memory_store.create(session_id)
     return jsonify({'chat_id': session_id})
 
 # ----------------------------------------------------------------------
-# 6.3  /chat – Zentrale Chat‑Logik (Frage → Antwort)
+# Hilfsfunktionen für /chat und /chat/stream
+# ----------------------------------------------------------------------
+def ensure_chat_session(chat_id):
+    """Legt bei Bedarf Chat‑Dokument und Memories an; liefert (chat_id, email, memory)."""
+    chat_id, email, created = bind_chat(session, chat_id)
+    if created:
+        container.create_item(new_chat_document(chat_id, email))
+        return chat_id, email, memory_store.create(chat_id)
+    # Memory‑Dict sicherstellen; ausgelagerte Sitzungen werden per Punkt‑Lesezugriff aus Cosmos wieder aufgebaut
+    return chat_id, email, memory_store.get_or_create(chat_id, lambda chat_id: read_chat_document(container, chat_id, email))
+
+def persist_exchange(chat_id, email, user_message_text, answer, decision, memory):
+    """Hängt Frage und Antwort an den Chat‑Verlauf in Cosmos an und speichert den Memory‑Zustand mit."""
+    messages, memory_state, message_count = exchange_payload(memory, user_message_text, answer, decision)
+    # Ein Patch ohne Vorab‑Lesen
+    append_exchange(container, chat_id, email, messages, memory_state)
+    commit_message_count(memory, message_count)  # erst nach erfolgreichem Schreiben
+    update_session_index(container, email, chat_id, messages, message_count)
+
+# ----------------------------------------------------------------------
+# 5.3  /chat – Zentrale Chat‑Logik (Frage → Antwort)
 # ----------------------------------------------------------------------
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
         # Payload immer als JSON verarbeiten (force=True: ignoriert Content‑Type)
-        data = request.get_json(force=True)
-        user_message_text = data.get('message', '')
-        chat_id          = data.get('chat_id')
-
-        if not user_message_text:
-            return jsonify({'error': 'Nachricht fehlt'}), 400
+        user_message_text, chat_id, error = parse_chat_request(request.get_json(force=True, silent=True))
+        if error:
+            return jsonify({'error': error}), 400
 
-        # -------------------------------------------------------------
-        # Session‑Setup (falls Client noch keine chat_id besitzt)
-        # -------------------------------------------------------------
-        if not chat_id:
-            email  = session.get('email') or "anonymous"
-            chat_id = f"{email}-{uuid.uuid4().hex[:8]}"
-            session['email']   = email
-            session['chat_id'] = chat_id
-            # Drei parallele Memories für unterschiedliche Agenten‑Wege
-            memory_store[chat_id] = {
-                "general":   ConversationBufferWindowMemory(k=10, memory_key="history", return_messages=False),
-                "vector":    ConversationBufferWindowMemory(k=10, memory_key="history", return_messages=False),
-                "database":  ConversationBufferWindowMemory(k=10, memory_key="history", return_messages=False)
-            }
-            chat_document = {
-                "id":         chat_id,
-                "email":      email,
-                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "messages":   []
-            }
-            container.create_item(chat_document)
-        else:
-            # Chat‑ID vorhanden → Email aus Session übernehmen (fallback anonymous)
-            email = session.get('email') or "anonymous"
-            session['chat_id'] = chat_id
-
-        # Memory‑Dict sicherstellen
-        if chat_id not in memory_store:
-            memory_store[chat_id] = {
-                "global_buffer": ConversationBufferWindowMemory(k=3, memory_key="history", return_messages=False),
-                "global_summary": ConversationSummaryBufferMemory(memory_key="history", return_messages=False, llm=summarizer_llm, max_token_limit=300)
-            }
+        chat_id, email, memory_dict = ensure_chat_session(chat_id)
 
         # -------------------------------------------------------------
         # Anfrage an Orchestrator weiterleiten
         # -------------------------------------------------------------
-        user_message = HumanMessage(content=user_message_text)
-        user_message.email = email  # Zusatzattribut für Downstream‑Logik
-
-        memory_dict = memory_store[chat_id]
-        result     = dispatch(user_message, memory=memory_dict)
+        result     = dispatch(user_message(user_message_text, email), memory=memory_dict)
         answer     = result.get("answer")
         decision   = result.get("decision", "general")
-
-        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
-
         # -------------------------------------------------------------
-        # Chat‑Verlauf in Cosmos persistieren
+        # Chat‑Verlauf in Cosmos persistieren (zählt die Nachrichten im Memory mit → danach Store sichern)
         # -------------------------------------------------------------
-        try:
-            chat_doc = container.read_item(item=chat_id, partition_key=email)
-        except Exception:
-            chat_doc = {
-                "id":         chat_id,
-                "email":      email,
-                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "messages":   []
-            }
-            container.create_item(chat_doc)
-
-        chat_doc["messages"].append({
-            "sender":    "user",
-            "content":   user_message_text,
-            "timestamp": timestamp
-        })
-        chat_doc["messages"].append({
-            "sender":    "bot",
-            "content":   answer,
-            "timestamp": timestamp,
-            "agent":     decision
-        })
-        container.replace_item(item=chat_doc["id"], body=chat_doc)
+        persist_exchange(chat_id, email, user_message_text, answer, decision, memory_dict)
+        memory_store.save(chat_id)
 
         return jsonify({'response': answer})
 
@@ -246,117 +163,107 @@ def chat():
     # ---------------------------------------------------------
     except openai.BadRequestError as e:
         logging.exception("OpenAI BadRequestError im /chat Endpoint:")
-        error_str = str(e)
-        short_msg = "Fehler beim Aufruf von Azure OpenAI (400)."
-        try:
-            splitted = error_str.split("Error code: 400 - ")
-            if len(splitted) > 1:
-                error_json = json.loads(splitted[1])
-                short_msg  = error_json["error"]["message"]
-                cf_result  = error_json["error"].get("innererror", {}).get("content_filter_result", {})
-                filtered_cats = [f"{cat} (Severity: {det.get('severity','?')})" for cat, det in cf_result.items() if det.get("filtered")]
-                if filtered_cats:
-                    short_msg += "\nGefilterte Kategorien: " + ", ".join(filtered_cats)
-        except Exception:
-            pass
-        error_message = (
-            "Die Anfrage wurde von Azure OpenAI gefiltert. "
-            f"{short_msg} "
-            "Bitte passe deine Eingabe an oder kontaktiere den Support."
-        ).replace("\n", " ")
-        return jsonify({"error": error_message}), 400
+        return jsonify({"error": content_filter_message(e)}), 400
 
     # ---------------------------------------------------------
     # Generischer Fehlerfang
     # ---------------------------------------------------------
     except Exception as e:
         logging.exception("Allgemeiner Fehler im /chat Endpoint:")
-        error_message = (
-            "Entschuldigung, es ist ein unbekannter Fehler aufgetreten. "
-            "Bitte versuche es später erneut oder kontaktiere den Support."
-        ).replace("\n", " ")
-        return jsonify({"error": error_message}), 500
+        return jsonify({"error": GENERIC_ERROR_MESSAGE}), 500
 
 # ----------------------------------------------------------------------
-# 6.4  /end-session – Server‑seitige Session zurücksetzen
+# 5.3b /chat/stream – wie /chat, aber Routing und Antwort‑Tokens als SSE
+# ----------------------------------------------------------------------
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    user_message_text, chat_id, error = parse_chat_request(request.get_json(force=True, silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+
+    # Session‑Cookie muss vor Beginn des Streams gesetzt sein
+    chat_id, email, memory_dict = ensure_chat_session(chat_id)
+    message = user_message(user_message_text, email)
+
+    def generate():
+        try:
+            for event in dispatch_stream(message, memory=memory_dict):
+                if event["type"] == "done":
+                    persist_exchange(chat_id, email, user_message_text, event["answer"], event["decision"], memory_dict)
+                    memory_store.save(chat_id)
+                    event = done_event(chat_id, event["decision"])
+                yield sse_event(event)
+        except openai.BadRequestError as e:
+            logging.exception("OpenAI BadRequestError im /chat/stream Endpoint:")
+            yield sse_event({"type": "error", "message": content_filter_message(e)})
+        except Exception:
+            logging.exception("Allgemeiner Fehler im /chat/stream Endpoint:")
+            yield sse_event({"type": "error", "message": GENERIC_ERROR_MESSAGE})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+# ----------------------------------------------------------------------
+# 5.4  /end-session – Server‑seitige Session zurücksetzen
 # ----------------------------------------------------------------------
 @app.route('/end-session', methods=['POST'])
 def end_session():
-    session.pop('conversation_history', None)
-    session.pop('email', None)
-    session.pop('chat_id', None)
+    clear_session(session)
     return jsonify({'message': 'Chat-Sitzung wurde beendet.'})
 
 # ----------------------------------------------------------------------
-# 6.5  /get-sessions – Liste früherer Chat‑Sitzungen
+# 5.5  /get-sessions – Liste früherer Chat‑Sitzungen
 # ----------------------------------------------------------------------
 @app.route('/get-sessions', methods=['GET'])
 def get_sessions():
-    email = session.get('email') or "anonymous"
-    if email == "anonymous":
+    email = session_email(session)
+    if email == ANONYMOUS:
         return jsonify([])
-    query = (
-        "SELECT c.id, c.created_at "
-        "FROM c WHERE c.email = @email "
-        "AND ARRAY_LENGTH(c.messages) > 0 "
-        "ORDER BY c.created_at DESC"
-    )
-    parameters = [{"name": "@email", "value": email}]
-    items = list(container.query_items(query=query, parameters=parameters, enable_cross_partition_query=True))
-    return jsonify(items)
+    # Ein Punkt‑Lesezugriff auf den Sitzungsindex statt einer Abfrage über alle Verläufe
+    return jsonify(list_sessions(read_session_index(container, email)))
 
 # ----------------------------------------------------------------------
-# 6.6  /get-session/<id> – Kompletten Verlauf einer Session abrufen
+# 5.6  /get-session/<id> – Kompletten Verlauf einer Session abrufen
 # ----------------------------------------------------------------------
 @app.route('/get-session/<chat_id>', methods=['GET'])
 def get_session(chat_id):
-    email = session.get('email') or "anonymous"
-    if email == "anonymous":
+    email = session_email(session)
+    if email == ANONYMOUS:
         return jsonify({"error": "Anonyme Nutzer können keine Sitzungen abrufen"}), 403
-    try:
-        item = container.read_item(item=chat_id, partition_key=email)
-        return jsonify(item)
-    except Exception:
+    chat_doc = read_chat_document(container, chat_id, email)
+    if chat_doc is None:
         return jsonify({"error": "Session nicht gefunden"}), 404
+    return jsonify(chat_document_response(chat_doc))
 
 # ----------------------------------------------------------------------
-# 6.7  /select-session/<id> – Auf vorhandene Session umschalten
+# 5.7  /select-session/<id> – Auf vorhandene Session umschalten
 # ----------------------------------------------------------------------
 @app.route('/select-session/<chat_id>', methods=['POST'])
 def select_session(chat_id):
-    query = "SELECT * FROM c WHERE c.id = @chat_id"
-    parameters = [{"name": "@chat_id", "value": chat_id}]
-    items = list(container.query_items(query=query, parameters=parameters, enable_cross_partition_query=True))
-    if not items:
+    email = select_email(session, chat_id)
+
+    # Memories im Cache/Backend: Existenz über den kompakten Sitzungsindex prüfen
+    memory = memory_store.get(chat_id)
+    if memory is not None and email != ANONYMOUS and indexed(read_session_index(container, email), chat_id):
+        bind_session(session, chat_id, email)
+        return jsonify({"message": "Session switched"}), 200
+
+    # Sonst Punkt‑Lesezugriff über (id, email); die E‑Mail steckt auch in der Chat‑ID
+    chat_doc = read_chat_document(container, chat_id, email)
+    if chat_doc is None and email != email_from_chat_id(chat_id):
+        chat_doc = read_chat_document(container, chat_id, email_from_chat_id(chat_id))
+    if chat_doc is None:
         return jsonify({"error": "Chat nicht gefunden"}), 404
 
-    chat_doc = items[0]
-    session['chat_id'] = chat_id
-    session['email']   = chat_doc.get("email", "anonymous")
-
-    if chat_id not in memory_store:
-        memory_store[chat_id] = {
-            "global_buffer": ConversationBufferWindowMemory(k=3, memory_key="history", return_messages=False),
-            "global_summary": ConversationSummaryBufferMemory(
-                memory_key="history",
-                return_messages=False,
-                llm=summarizer_llm,
-                max_token_limit=300
-            )
-        }
-    mem_dict = memory_store[chat_id]
-
-    # Vollständigen Verlauf ins Memory übertragen (für Re‑Prompting)
-    messages = chat_doc["messages"]
-    for i, m in enumerate(messages):
-        if i < len(messages) - 3:
-            mem_dict["global_summary"].save_context({"input": m["content"]}, {"output": ""})
-        mem_dict["global_buffer"].save_context({"input": m["content"]}, {"output": ""})
+    bind_session(session, chat_id, chat_doc.get("email", ANONYMOUS))
+
+    # Memories nur neu aufbauen, wenn die Sitzung weder im Cache noch im Backend liegt
+    if memory is None:
+        memory_store.restore(chat_id, chat_doc)
 
     return jsonify({"message": "Session switched"}), 200
 
 # ==========================================================
-# 7) Entwicklungs‑Server starten (nur bei direktem Aufruf)
+# 6) Entwicklungs‑Server starten (nur bei direktem Aufruf)
 # ==========================================================
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,229 @@
+"""
+Nova Chatbot – Backend im ASGI‑Modus (asgi.py)
+==============================================
+
+Asynchrone Variante von app.py mit denselben Routen und demselben Frontend;
+die gemeinsame Logik liegt in chat_service.py.
+Ein Worker hält hier viele Unterhaltungen gleichzeitig offen: Während auf
+Azure OpenAI, Cosmos DB oder die Vektorsuche gewartet wird, blockiert kein
+Thread. Start z.B. mit
+
+    cd backend
+    hypercorn asgi:app --bind 0.0.0.0:5000 --workers 2
+
+1.  Importe & Konfiguration
+2.  Cosmos DB (asynchroner Client, Lebenszyklus)
+3.  Hilfsfunktionen (Cosmos‑Aufrufe, Memory‑Store im Thread)
+4.  Routen / Endpoints (wie app.py)
+5.  main‑Guard (Entwicklungs‑Server)
+"""
+
+# ==========================================================
+# 1) Importe & Konfiguration
+# ==========================================================
+import asyncio
+import logging
+import openai
+
+from quart import Quart, Response, render_template, request, jsonify, session
+from azure.cosmos.aio import CosmosClient
+
+from orchestration.orchestrator import adispatch, adispatch_stream
+from session_store import restorable
+from chat_store import (
+    aappend_exchange, aread_chat_document, aread_session_index, aupdate_session_index, email_from_chat_id,
+    list_sessions, new_chat_document
+)
+from chat_service import (
+    ANONYMOUS, COSMOS_DATABASE, COSMOS_ENDPOINT, COSMOS_KEY, CONTAINER_OPTIONS, GENERIC_ERROR_MESSAGE, SECRET_KEY,
+    SSE_HEADERS, STATIC_DIR, TEMPLATE_DIR, bind_chat, bind_session, chat_document_response, claim_document,
+    claimed_chat_id, clear_session, commit_message_count, content_filter_message, done_event, exchange_payload,
+    generate_chat_id, indexed, memory_store, parse_chat_request, select_email, session_email, sse_event, user_message
+)
+
+logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(logging.ERROR)
+logging.getLogger("azure").setLevel(logging.ERROR)
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s [%(levelname)s] %(message)s')
+
+app = Quart(__name__, template_folder=TEMPLATE_DIR, static_folder=STATIC_DIR)
+app.secret_key = SECRET_KEY
+
+# ==========================================================
+# 2) Cosmos DB – asynchroner Client, wird pro Worker beim Start geöffnet
+# ==========================================================
+cosmos_client = None
+container     = None
+
+@app.before_serving
+async def open_cosmos():
+    global cosmos_client, container
+    cosmos_client = CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY)
+    database  = await cosmos_client.create_database_if_not_exists(id=COSMOS_DATABASE)
+    container = await database.create_container_if_not_exists(**CONTAINER_OPTIONS)
+
+@app.after_serving
+async def close_cosmos():
+    if cosmos_client is not None:
+        await cosmos_client.close()
+
+# ==========================================================
+# 3) Hilfsfunktionen
+# ==========================================================
+# Store‑Operationen können SQLite/Redis oder (beim Wiederaufbau) das LLM aufrufen → im Thread ausführen
+async def ensure_chat_session(chat_id):
+    """Legt bei Bedarf Chat‑Dokument und Memories an; liefert (chat_id, email, memory)."""
+    chat_id, email, created = bind_chat(session, chat_id)
+    if created:
+        await container.create_item(new_chat_document(chat_id, email))
+        return chat_id, email, memory_store.create(chat_id)
+    memory = await asyncio.to_thread(memory_store.get, chat_id)
+    if memory is None:
+        # Ausgelagerte Sitzung: Chat-Dokument aus Cosmos nachladen, sonst leer beginnen
+        chat_doc = await aread_chat_document(container, chat_id, email)
+        if restorable(chat_doc):
+            memory = await asyncio.to_thread(memory_store.restore, chat_id, chat_doc)
+        else:
+            memory = memory_store.create(chat_id)
+    return chat_id, email, memory
+
+async def persist_exchange(chat_id, email, user_message_text, answer, decision, memory):
+    """Hängt Frage und Antwort an den Chat‑Verlauf in Cosmos an und speichert den Memory‑Zustand mit."""
+    messages, memory_state, message_count = exchange_payload(memory, user_message_text, answer, decision)
+    await aappend_exchange(container, chat_id, email, messages, memory_state)
+    commit_message_count(memory, message_count)  # erst nach erfolgreichem Schreiben
+    await aupdate_session_index(container, email, chat_id, messages, message_count)
+
+# ==========================================================
+# 4) Routen / Endpoints
+# ==========================================================
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/start-session', methods=['POST'])
+async def start_session():
+    form        = await request.form
+    new_email   = form.get('email') or ANONYMOUS
+    old_chat_id = claimed_chat_id(session, new_email)
+
+    # Anonymer Chat wird nachträglich einer konkreten E‑Mail zugeordnet
+    if old_chat_id:
+        old_doc     = await aread_chat_document(container, old_chat_id, ANONYMOUS)
+        new_chat_id = generate_chat_id(new_email)
+        if old_doc:
+            new_doc = claim_document(old_doc, new_email, new_chat_id)
+            await container.create_item(body=new_doc)
+            await container.delete_item(item=old_chat_id, partition_key=ANONYMOUS)
+            if new_doc.get("messages"):
+                await aupdate_session_index(container, new_email, new_chat_id, new_doc["messages"], len(new_doc["messages"]))
+
+        await asyncio.to_thread(memory_store.rename, old_chat_id, new_chat_id)
+        bind_session(session, new_chat_id, new_email)
+        return jsonify({'chat_id': new_chat_id})
+
+    session_id = generate_chat_id(new_email)
+    bind_session(session, session_id, new_email)
+    memory_store.create(session_id)
+    return jsonify({'chat_id': session_id})
+
+@app.route('/chat', methods=['POST'])
+async def chat():
+    try:
+        user_message_text, chat_id, error = parse_chat_request(await request.get_json(force=True, silent=True))
+        if error:
+            return jsonify({'error': error}), 400
+
+        chat_id, email, memory_dict = await ensure_chat_session(chat_id)
+        result   = await adispatch(user_message(user_message_text, email), memory=memory_dict)
+        answer   = result.get("answer")
+        decision = result.get("decision", "general")
+        await persist_exchange(chat_id, email, user_message_text, answer, decision, memory_dict)
+        await asyncio.to_thread(memory_store.save, chat_id)
+        return jsonify({'response': answer})
+
+    except openai.BadRequestError as e:
+        logging.exception("OpenAI BadRequestError im /chat Endpoint:")
+        return jsonify({"error": content_filter_message(e)}), 400
+    except Exception:
+        logging.exception("Allgemeiner Fehler im /chat Endpoint:")
+        return jsonify({"error": GENERIC_ERROR_MESSAGE}), 500
+
+@app.route('/chat/stream', methods=['POST'])
+async def chat_stream():
+    user_message_text, chat_id, error = parse_chat_request(await request.get_json(force=True, silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+
+    chat_id, email, memory_dict = await ensure_chat_session(chat_id)
+    message = user_message(user_message_text, email)
+
+    async def generate():
+        try:
+            async for event in adispatch_stream(message, memory=memory_dict):
+                if event["type"] == "done":
+                    await persist_exchange(chat_id, email, user_message_text, event["answer"], event["decision"], memory_dict)
+                    await asyncio.to_thread(memory_store.save, chat_id)
+                    event = done_event(chat_id, event["decision"])
+                yield sse_event(event)
+        except openai.BadRequestError as e:
+            logging.exception("OpenAI BadRequestError im /chat/stream Endpoint:")
+            yield sse_event({"type": "error", "message": content_filter_message(e)})
+        except Exception:
+            logging.exception("Allgemeiner Fehler im /chat/stream Endpoint:")
+            yield sse_event({"type": "error", "message": GENERIC_ERROR_MESSAGE})
+
+    response = Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    response.timeout = None  # Streams dürfen länger laufen als das Standard-Timeout
+    return response
+
+@app.route('/end-session', methods=['POST'])
+async def end_session():
+    clear_session(session)
+    return jsonify({'message': 'Chat-Sitzung wurde beendet.'})
+
+@app.route('/get-sessions', methods=['GET'])
+async def get_sessions():
+    email = session_email(session)
+    if email == ANONYMOUS:
+        return jsonify([])
+    return jsonify(list_sessions(await aread_session_index(container, email)))
+
+@app.route('/get-session/<chat_id>', methods=['GET'])
+async def get_session(chat_id):
+    email = session_email(session)
+    if email == ANONYMOUS:
+        return jsonify({"error": "Anonyme Nutzer können keine Sitzungen abrufen"}), 403
+    chat_doc = await aread_chat_document(container, chat_id, email)
+    if chat_doc is None:
+        return jsonify({"error": "Session nicht gefunden"}), 404
+    return jsonify(chat_document_response(chat_doc))
+
+@app.route('/select-session/<chat_id>', methods=['POST'])
+async def select_session(chat_id):
+    email = select_email(session, chat_id)
+
+    memory = await asyncio.to_thread(memory_store.get, chat_id)
+    if memory is not None and email != ANONYMOUS and indexed(await aread_session_index(container, email), chat_id):
+        bind_session(session, chat_id, email)
+        return jsonify({"message": "Session switched"}), 200
+
+    chat_doc = await aread_chat_document(container, chat_id, email)
+    if chat_doc is None and email != email_from_chat_id(chat_id):
+        chat_doc = await aread_chat_document(container, chat_id, email_from_chat_id(chat_id))
+    if chat_doc is None:
+        return jsonify({"error": "Chat nicht gefunden"}), 404
+
+    bind_session(session, chat_id, chat_doc.get("email", ANONYMOUS))
+
+    # Die Summary-Memory fasst synchron per LLM zusammen → nicht im Event-Loop ausführen
+    if memory is None:
+        await asyncio.to_thread(memory_store.restore, chat_id, chat_doc)
+
+    return jsonify({"message": "Session switched"}), 200
+
+# ==========================================================
+# 5) Entwicklungs‑Server starten (nur bei direktem Aufruf)
+# ==========================================================
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,123 @@
+# Lasttest: gleichzeitige Chat-Sitzungen gegen einen laufenden Server
+#
+# Startet N Sitzungen parallel (je eigene Cookies, eigene Chat-ID), die jeweils
+# M Fragen nacheinander an /chat bzw. /chat/stream schicken. Gemessen werden
+# Latenz (bei --stream zusätzlich die Zeit bis zum ersten Token), Durchsatz und
+# die höchste Zahl gleichzeitig offener Anfragen. Sinnvoll ist der Vergleich
+# desselben Laufs gegen app.py (Flask) und asgi.py (hypercorn, ein Worker).
+#
+# Aufruf:  python -m backend.benchmarks.chat_load_test --url http://localhost:5000 --sessions 200 --messages 3
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aiohttp
+
+QUESTIONS = [
+    "Wie verbinde ich die Bose S1 Pro per Bluetooth?",
+    "Was kostet das teuerste Produkt?",
+    "Danke!",
+    "Wie montiere ich den Subwoofer an der Wand?",
+]
+
+
+class Stats:
+
+    def __init__(self):
+        self.latencies = []
+        self.first_tokens = []
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def started(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(self):
+        self.in_flight -= 1
+
+
+async def ask(http, url, message, chat_id, stream, stats):
+    stats.started()
+    start = time.perf_counter()
+    try:
+        payload = {"message": message, "chat_id": chat_id}
+        if not stream:
+            async with http.post(f"{url}/chat", json=payload) as response:
+                body = await response.json(content_type=None)
+                if response.status != 200 or "error" in body:
+                    stats.errors += 1
+                    return
+        else:
+            first_token = None
+            async with http.post(f"{url}/chat/stream", json=payload) as response:
+                if response.status != 200:
+                    stats.errors += 1
+                    return
+                async for line in response.content:
+                    if not line.startswith(b"data:"):
+                        continue
+                    event = json.loads(line[5:])
+                    if event["type"] == "token" and first_token is None:
+                        first_token = time.perf_counter() - start
+                    elif event["type"] == "error":
+                        stats.errors += 1
+                        return
+            if first_token is not None:
+                stats.first_tokens.append(first_token)
+        stats.latencies.append(time.perf_counter() - start)
+    except aiohttp.ClientError:
+        stats.errors += 1
+    finally:
+        stats.finished()
+
+
+async def run_session(index, args, stats):
+    # Jede Sitzung hat ihren eigenen Cookie-Jar, also eine eigene Server-Session
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=args.timeout)) as http:
+        async with http.post(f"{args.url}/start-session", data={"email": args.email}) as response:
+            chat_id = (await response.json(content_type=None)).get("chat_id")
+        for turn in range(args.messages):
+            message = QUESTIONS[(index + turn) % len(QUESTIONS)]
+            await ask(http, args.url, message, chat_id, args.stream, stats)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def report(label, values):
+    if not values:
+        return
+    print(f"{label:<22} mean={statistics.mean(values):7.2f} s  "
+          f"p50={percentile(values, 0.5):7.2f} s  p95={percentile(values, 0.95):7.2f} s")
+
+
+async def main(args):
+    stats = Stats()
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(index, args, stats) for index in range(args.sessions)))
+    duration = time.perf_counter() - start
+
+    total = args.sessions * args.messages
+    print(f"{args.sessions} Sitzungen x {args.messages} Nachrichten gegen {args.url} ({'stream' if args.stream else 'chat'})")
+    print(f"Dauer {duration:.1f} s, {len(stats.latencies) / duration:.2f} Antworten/s, "
+          f"Fehler {stats.errors}/{total}, max. gleichzeitig offen {stats.max_in_flight}")
+    report("Latenz", stats.latencies)
+    report("Zeit bis erstes Token", stats.first_tokens)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gleichzeitige Chat-Sitzungen gegen einen laufenden Server")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--email", default="anonymous")
+    parser.add_argument("--stream", action="store_true", help="/chat/stream statt /chat verwenden")
+    parser.add_argument("--timeout", type=float, default=300)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+# Vergleich: lokale Keyword-Zuordnung vs. GPT-Keyword-Extraktion
+#
+# Für jede Frage werden die Keyword-Filter beider Varianten erzeugt und gegenübergestellt
+# (exakte Übereinstimmung, Jaccard-Ähnlichkeit, Laufzeit). Zusätzlich wird die Vektorsuche
+# mit beiden Filtern ausgeführt und gemessen, welcher Anteil der mit dem GPT-Filter
+# gefundenen Chunks auch mit dem lokalen Filter gefunden wird (Recall@k).
+#
+# Aufruf aus dem Projekt-Root:
+#   python -m backend.benchmarks.keyword_matcher_eval [fragen.txt]
+# Ohne Datei wird die eingebaute Fragenliste verwendet (eine Frage pro Zeile).
+
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from backend.textprocessing import ChunkerPSQL
+from backend.textprocessing.keyword_matcher import KeywordMatcher
+
+DEFAULT_QUESTIONS = [
+    "Wie verbinde ich Acoustimass 15 mit meinem Fernseher?",
+    "Wie verbinde ich meine QuietComfort 35 per Bluetooth mit dem Handy?",
+    "Wie montiere ich die FreeSpace DS 16F an der Wand?",
+    "Wie richte ich die Smart Soundbar 600 im WLAN ein?",
+    "Wie stelle ich den Bass an der Soundbar 900 ein?",
+    "Welche Impedanz haben die FreeSpace 51 Lautsprecher?",
+    "Wie schließe ich den Subwoofer an die Soundbar an?",
+    "Unterstützt die Smart Ultra Soundbar Dolby Atmos?",
+    "Wie setze ich die SoundLink Revolve zurück?",
+    "Wie aktiviere ich die Geräuschunterdrückung bei den QuietComfort Ultra Earbuds?",
+    "Wie lade ich die SoundSport Kopfhörer auf?",
+    "Wie nutze ich den Equalizer in der Bose App?",
+    "Welchen Frequenzbereich deckt der Acoustimass 15 ab?",
+    "Wie verbinde ich den Music Amplifier mit meinen Lautsprechern?",
+    "Wie koppele ich zwei SoundLink Color II miteinander?",
+]
+
+TOP_K = 3
+
+
+def to_filter(keywords):
+    return "{" + ",".join(keywords) + "}" if keywords else None
+
+
+def chunk_ids(processor, question, keywords):
+    results = processor.search_chunks(question, to_filter(keywords), limit=TOP_K) or []
+    return {row[0] for row in results}
+
+
+def jaccard(a, b):
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def main(questions):
+    processor = ChunkerPSQL.PDFProcessor()
+    matcher = KeywordMatcher(processor.embedding_client)
+
+    exact, jaccard_sum, recall_sum = 0, 0.0, 0.0
+    gpt_ms, local_ms = 0.0, 0.0
+    for question in questions:
+        start = time.perf_counter()
+        gpt_keywords = [k.strip() for k in processor.get_keywords_with_gpt(question).split(",") if k.strip()]
+        gpt_ms += (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        local_keywords = matcher.match(question)
+        local_ms += (time.perf_counter() - start) * 1000
+
+        gpt_ids = chunk_ids(processor, question, gpt_keywords)
+        local_ids = chunk_ids(processor, question, local_keywords)
+        recall = len(gpt_ids & local_ids) / len(gpt_ids) if gpt_ids else 1.0
+
+        exact += set(gpt_keywords) == set(local_keywords)
+        jaccard_sum += jaccard(gpt_keywords, local_keywords)
+        recall_sum += recall
+        print(f"- {question}\n    gpt={gpt_keywords} local={local_keywords} recall@{TOP_K}={recall:.2f}")
+
+    n = len(questions)
+    print(f"\n{n} Fragen")
+    print(f"Exakt gleiche Filter:   {exact / n:.0%}")
+    print(f"Mittlere Jaccard:       {jaccard_sum / n:.2f}")
+    print(f"Mittlerer Recall@{TOP_K}:    {recall_sum / n:.2f}")
+    print(f"Laufzeit GPT:           {gpt_ms / n:.1f} ms/Frage")
+    print(f"Laufzeit lokal:         {local_ms / n:.3f} ms/Frage")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = DEFAULT_QUESTIONS
+    main(questions)
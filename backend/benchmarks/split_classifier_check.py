@@ -0,0 +1,79 @@
+# Offline-Prüfung des lokalen Vor-Klassifikators gegen die LLM-Extraktion
+#
+# Für jede Nachricht wird verglichen, ob split_classifier die LLM-Extraktion für nötig hält
+# und ob extract_questions tatsächlich mehr als eine Frage liefert. Kritisch sind
+# "verpasste Zerlegungen": Der Fast Path wurde genommen, das LLM hätte aber getrennt.
+# Für lokal zugeordnete Einzelfragen wird zusätzlich der Agent mit der LLM-Entscheidung verglichen.
+#
+# Aufruf aus dem Projekt-Root:
+#   python -m backend.benchmarks.split_classifier_check [nachrichten.txt]
+# Ohne Datei wird die eingebaute Liste verwendet (eine Nachricht pro Zeile).
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# orchestrator importiert seine Module als "orchestration.*" (relativ zu backend/)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from orchestration import split_classifier
+from orchestration.orchestrator import extract_questions
+
+DEFAULT_MESSAGES = [
+    "Danke!",
+    "Hallo Nova",
+    "Wie verbinde ich die QuietComfort 35 per Bluetooth?",
+    "Welche Bestellungen habe ich?",
+    "Was kostet das Produkt Mountain-100 Black, 38?",
+    "Was kostet der Mountain-100 und wie verbinde ich meine Soundbar mit dem WLAN?",
+    "Wie montiere ich die FreeSpace DS 16F? Und welche Adresse ist bei mir hinterlegt?",
+    "Wie setze ich die SoundLink Revolve zurück?",
+    "Zeig mir meine letzte Bestellung und sag mir, wie ich den Subwoofer anschließe.",
+    "Wie verbinde ich Kopfhörer und Handy?",
+    "Ich habe eine Soundbar 700 gekauft. Wie richte ich das WLAN ein?",
+    "Welche Produkte kosten mehr als 1000 Euro?",
+    "Preis von QuietComfort 45 und wie verbinde ich die QuietComfort 45?",
+    "Zeig mir meine Bestellungen und wie ich den Subwoofer anschließe",
+    "Wie finde ich die IP-Adresse meiner Soundbar?",
+]
+
+
+def main(messages):
+    agree, missed, unnecessary = 0, 0, 0
+    routed, route_mismatches = 0, 0
+    for message in messages:
+        local_split = split_classifier.needs_extraction(message) and not split_classifier.is_smalltalk(message)
+        extracted = extract_questions(message)
+        llm_split = len(extracted) > 1
+        local_route = "" if local_split else split_classifier.local_decision(message)
+        if local_route and not llm_split:
+            routed += 1
+            if extracted[0]["decision"] and extracted[0]["decision"] != local_route:
+                route_mismatches += 1
+                print(f"!! route local={local_route} llm={extracted[0]['decision']}  {message}")
+        agree += local_split == llm_split
+        missed += llm_split and not local_split
+        unnecessary += local_split and not llm_split
+        marker = "ok " if local_split == llm_split else "!! "
+        print(f"{marker}local={'split' if local_split else 'fast '} llm={'split' if llm_split else 'single'}  {message}")
+
+    n = len(messages)
+    fast = sum(1 for m in messages if split_classifier.is_smalltalk(m) or not split_classifier.needs_extraction(m))
+    print(f"\n{n} Nachrichten")
+    print(f"Fast-Path-Quote:             {fast / n:.0%}")
+    print(f"Übereinstimmung mit LLM:     {agree / n:.0%}")
+    print(f"Verpasste Zerlegungen:       {missed}")
+    print(f"Unnötige LLM-Extraktionen:   {unnecessary}")
+    print(f"Lokal geroutet:              {routed / n:.0%}")
+    print(f"Abweichende lokale Routen:   {route_mismatches}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            messages = [line.strip() for line in f if line.strip()]
+    else:
+        messages = DEFAULT_MESSAGES
+    main(messages)
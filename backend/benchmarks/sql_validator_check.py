@@ -0,0 +1,92 @@
+# Offline-Prüfung der lokalen SQL-Validierung des Datenbank-Agenten
+#
+# Jede Abfrage wird mit sql_validator.check_query geprüft und mit dem erwarteten Urteil
+# verglichen. Kritisch sind Abfragen, die Daten anderer Kunden liefern können und trotzdem
+# "ok" erhalten: Sie würden ohne LLM-Validator ausgeführt.
+#
+# Aufruf aus dem Projekt-Root:
+#   python -m backend.benchmarks.sql_validator_check
+
+import os
+import sys
+import time
+
+# Module werden als "orchestration.*" importiert (relativ zu backend/)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from orchestration import sql_validator
+
+# Kopie von database_structure aus agent_database (dessen Import öffnet die Datenbankverbindung)
+DATABASE_STRUCTURE = """
+SalesLT.Customer(CustomerID, NameStyle, FirstName, MiddleName, LastName, Suffix, CompanyName, SalesPerson, EmailAddress, Phone, PasswordHash, PasswordSalt, rowguid, ModifiedDate), SalesLT.Address(AddressID, AddressLine1, AddressLine2, City, StateProvince, CountryRegion, PostalCode, rowguid, ModifiedDate), SalesLT.CustomerAddress(CustomerID, AddressID, AddressType, rowguid, ModifiedDate), SalesLT.Product(ProductID, Name, ProductNumber, StandardCost, ListPrice, ProductCategoryID, SellStartDate, SellEndDate, DiscontinuedDate, rowguid, ModifiedDate), SalesLT.SalesOrderDetail(SalesOrderID, SalesOrderDetailID, OrderQty, ProductID, UnitPrice, UnitPriceDiscount, LineTotal, rowguid, ModifiedDate), SalesLT.SalesOrderHeader(SalesOrderID, RevisionNumber, OrderDate, DueDate, ShipDate, Status, OnlineOrderFlag, SalesOrderNumber, PurchaseOrderNumber, AccountNumber, CustomerID, ShipToAddressID, BillToAddressID, ShipMethod, CreditCardApprovalCode, SubTotal, TaxAmt, Freight, TotalDue, Comment, rowguid, ModifiedDate)
+"""
+
+EMAIL = "me@x.com"
+
+# (erwartetes Urteil, Abfrage)
+CASES = [
+    ("ok", "SELECT TOP 5 Name, ListPrice FROM SalesLT.Product ORDER BY ListPrice DESC"),
+    ("ok", "SELECT h.SalesOrderNumber, h.TotalDue FROM SalesLT.SalesOrderHeader h "
+           "JOIN SalesLT.Customer c ON c.CustomerID = h.CustomerID WHERE c.EmailAddress = 'me@x.com'"),
+    ("ok", "SELECT p.Name FROM SalesLT.SalesOrderDetail d JOIN SalesLT.Product p ON p.ProductID = d.ProductID "
+           "JOIN SalesLT.SalesOrderHeader h ON h.SalesOrderID = d.SalesOrderID "
+           "JOIN SalesLT.Customer c ON c.CustomerID = h.CustomerID "
+           "WHERE h.OrderDate BETWEEN '2008-01-01' AND '2008-12-31' AND (c.EmailAddress = N'me@x.com') "
+           "AND (p.Name LIKE '%Helmet%' OR p.Name LIKE '%Jersey%')"),
+    ("ok", "SELECT a.City, a.PostalCode FROM SalesLT.Customer c "
+           "INNER JOIN SalesLT.CustomerAddress ca ON ca.CustomerID = c.CustomerID "
+           "INNER JOIN SalesLT.Address a ON a.AddressID = ca.AddressID "
+           "WHERE c.EmailAddress = 'me@x.com' AND ca.AddressType = 'Shipping'"),
+    ("invalid", "SELECT * FROM SalesLT.Customer WHERE EmailAddress = 'other@x.com'"),
+    ("invalid", "SELECT SalesOrderNumber FROM SalesLT.SalesOrderHeader"),
+    ("invalid", "DELETE FROM SalesLT.Product"),
+    ("invalid", "SELECT h.Foo FROM SalesLT.SalesOrderHeader h "
+                "JOIN SalesLT.Customer c ON c.CustomerID = h.CustomerID WHERE c.EmailAddress = 'me@x.com'"),
+    ("fatal", "SELECT * FROM SalesLT.Customer WHERE EmailAddress = 'me@x.com'"),
+    # Der E-Mail-Filter kommt vor, schränkt das äußere SELECT aber nicht ein
+    ("ambiguous", "SELECT c.FirstName, c.Phone FROM SalesLT.Customer c WHERE NOT c.EmailAddress='me@x.com'"),
+    ("ambiguous", "SELECT h.SalesOrderNumber, h.TotalDue FROM SalesLT.SalesOrderHeader h "
+                  "LEFT JOIN SalesLT.Customer c ON c.CustomerID=h.CustomerID AND c.EmailAddress='me@x.com'"),
+    ("ambiguous", "SELECT h.SalesOrderNumber FROM SalesLT.SalesOrderHeader h JOIN SalesLT.Customer c "
+                  "ON c.CustomerID = h.CustomerID "
+                  "WHERE EXISTS (SELECT 1 FROM SalesLT.Customer c2 WHERE c2.EmailAddress='me@x.com')"),
+    ("ambiguous", "SELECT c.FirstName, CASE WHEN c.EmailAddress='me@x.com' THEN 1 ELSE 0 END AS Eigene "
+                  "FROM SalesLT.Customer c"),
+    ("ambiguous", "SELECT * FROM SalesLT.Customer c WHERE c.EmailAddress = 'me@x.com' OR 1 = 1"),
+    # Der E-Mail-Filter trifft den Kunden, weitere Kundentabellen hängen aber nicht über die Schlüssel daran
+    ("ambiguous", "SELECT h.SalesOrderNumber, h.TotalDue FROM SalesLT.SalesOrderHeader h, SalesLT.Customer c "
+                  "WHERE c.EmailAddress='me@x.com'"),
+    ("ambiguous", "SELECT h.SalesOrderNumber, h.TotalDue FROM SalesLT.SalesOrderHeader h "
+                  "CROSS JOIN SalesLT.Customer c WHERE c.EmailAddress='me@x.com'"),
+    ("ambiguous", "SELECT h.SalesOrderNumber, h.TotalDue FROM SalesLT.SalesOrderHeader h "
+                  "JOIN SalesLT.Customer c ON c.CustomerID<>h.CustomerID WHERE c.EmailAddress='me@x.com'"),
+    ("ambiguous", "SELECT c2.Phone FROM SalesLT.Customer c JOIN SalesLT.Customer c2 ON 1=1 "
+                  "WHERE c.EmailAddress='me@x.com'"),
+    ("ambiguous", "SELECT a.AddressLine1, a.City FROM SalesLT.Address a JOIN SalesLT.Customer c ON 1=1 "
+                  "WHERE c.EmailAddress='me@x.com'"),
+    ("ambiguous", "SELECT d.LineTotal FROM SalesLT.SalesOrderDetail d "
+                  "JOIN SalesLT.SalesOrderHeader h ON h.SalesOrderID = d.SalesOrderID OR 1 = 1 "
+                  "JOIN SalesLT.Customer c ON c.CustomerID = h.CustomerID WHERE c.EmailAddress='me@x.com'"),
+]
+
+
+def main():
+    schema = sql_validator.parse_schema(DATABASE_STRUCTURE)
+    failures = 0
+    for expected, query in CASES:
+        email = "" if expected == "fatal" else EMAIL
+        result = sql_validator.check_query(query, email, schema)
+        failures += result.verdict != expected
+        marker = "ok " if result.verdict == expected else "!! "
+        print(f"{marker}{result.verdict:<9} (erwartet {expected:<9}) {query[:90]}")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        sql_validator.check_query(CASES[2][1], EMAIL, schema)
+    print(f"\n{len(CASES)} Abfragen, {failures} Abweichungen")
+    print(f"Dauer pro Prüfung: {(time.perf_counter() - started) * 1000:.0f} µs")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main() else 0)
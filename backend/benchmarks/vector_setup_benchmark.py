@@ -0,0 +1,50 @@
+# Mikrobenchmark: Setup-Kosten des Vector-Pfads pro Anfrage
+#
+# Vergleicht das frühere Verhalten (pro Frage neuer VectorAgent inkl. PDFProcessor
+# und neu kompilierter StateGraph) mit den prozessweit wiederverwendeten Instanzen.
+# Es werden keine LLM-, Embedding- oder Datenbankaufrufe ausgeführt, gemessen wird
+# ausschließlich der Aufbau der Objekte.
+#
+# Aufruf aus dem Projekt-Root:  python -m backend.benchmarks.vector_setup_benchmark
+
+import time
+import statistics
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from backend.orchestration import agent_vector
+
+
+def measure(setup, iterations):
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        setup()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+# Verhalten vor der Änderung: alles wird pro Anfrage neu erzeugt
+def legacy_setup():
+    agent = agent_vector.VectorAgent()
+    agent_vector.build_vector_graph(agent)
+
+
+# Verhalten nach der Änderung: Singleton-Agent und vorkompilierter Graph
+def shared_setup():
+    agent_vector.get_vector_graph()
+
+
+def report(label, durations):
+    print(f"{label:<28} mean={statistics.mean(durations):8.3f} ms  "
+          f"median={statistics.median(durations):8.3f} ms  max={max(durations):8.3f} ms")
+
+
+if __name__ == "__main__":
+    iterations = 50
+    print(f"Setup-Kosten pro Anfrage ({iterations} Iterationen):")
+    report("vorher (pro Anfrage neu)", measure(legacy_setup, iterations))
+    # Der erste Aufruf legt die Instanzen an, danach wird nur noch wiederverwendet
+    report("nachher (erster Aufruf)", measure(shared_setup, 1))
+    report("nachher (wiederverwendet)", measure(shared_setup, iterations))
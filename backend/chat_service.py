@@ -0,0 +1,214 @@
+# Gemeinsame Chat-Logik für app.py (Flask) und asgi.py (Quart)
+#
+# Beide Einstiegspunkte bieten dieselben Routen; hier liegt alles, was nicht von
+# synchroner oder asynchroner Ein-/Ausgabe abhängt: Konfiguration von Cosmos DB,
+# Memories und Memory-Store, Prüfung der Chat-Anfrage, Sitzungs-Cookies, Aufbau
+# der zu speichernden Nachrichten und der Antworten an das Frontend. In app.py und
+# asgi.py bleiben nur die Cosmos-Aufrufe (sync bzw. async) und die Routen.
+
+import datetime
+import json
+import os
+import uuid
+
+from azure.cosmos import PartitionKey
+from langchain.schema import HumanMessage
+from langchain.memory import ConversationBufferWindowMemory, ConversationSummaryBufferMemory
+from langchain_openai import AzureChatOpenAI
+
+from session_store import SessionMemoryStore  # Memories pro Chat-ID mit Eviction & Backend
+from chat_store import INDEXING_POLICY, email_from_chat_id, exchange_messages, is_chat_id, memory_state_for
+
+ANONYMOUS = "anonymous"
+
+# Cosmos DB – Verbindungsparameter aus Umgebungsvariablen
+COSMOS_ENDPOINT  = os.environ.get("COSMOS_ENDPOINT")
+COSMOS_KEY       = os.environ.get("COSMOS_KEY")
+COSMOS_DATABASE  = os.environ.get("COSMOS_DATABASE",  "ChatDB")
+COSMOS_CONTAINER = os.environ.get("COSMOS_CONTAINER", "Chats")
+
+# Argumente für create_container_if_not_exists (sync und async)
+CONTAINER_OPTIONS = {
+    "id": COSMOS_CONTAINER,
+    "partition_key": PartitionKey(path="/email"),
+    "indexing_policy": INDEXING_POLICY,  # Verläufe nicht indexieren (gilt nur für neu angelegte Container)
+}
+
+# Ablagepfade für Frontend‑Dateien (relativ zum Projekt‑Root)
+TEMPLATE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../Interface/frontend'))
+STATIC_DIR   = os.path.abspath(os.path.join(os.path.dirname(__file__), '../Interface/static'))
+SECRET_KEY   = 'dein_geheimer_schluessel'  # ⚠ In Produktion durch Secret Manager ersetzen
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# Interne Felder des Chat-Dokuments, die nicht an das Frontend gehen (Memory-Zustand, Cosmos-Systemfelder)
+PRIVATE_FIELDS = {"memory_state", "_rid", "_self", "_etag", "_attachments", "_ts"}
+
+GENERIC_ERROR_MESSAGE = (
+    "Entschuldigung, es ist ein unbekannter Fehler aufgetreten. "
+    "Bitte versuche es später erneut oder kontaktiere den Support."
+)
+
+# ==========================================================
+# LLM & Conversation Memories
+# ==========================================================
+# summarizer_llm wird ausschließlich für ConversationSummaryBufferMemory
+# verwendet. Deployment‑Namen & Version stammen aus ENV‑Variablen.
+summarizer_llm = AzureChatOpenAI(
+    azure_endpoint      = os.environ["OPENAI_ENDPOINT"],
+    azure_deployment    = os.environ["OPENAI_DEPLOYMENT_NAME_4o"],
+    openai_api_version  = os.environ["OPENAI_API_VERSION"],
+    model_name          = "gpt-4"
+)
+
+
+def new_memory() -> dict:
+    # Memory‑Objekte einer Chat‑Sitzung
+    return {
+        "global_buffer": ConversationBufferWindowMemory(k=3, memory_key="history", return_messages=False),
+        "global_summary": ConversationSummaryBufferMemory(
+            memory_key="history",
+            return_messages=False,
+            llm=summarizer_llm,
+            max_token_limit=300
+        )
+    }
+
+
+# Pro Chat‑ID werden die Memories im Store geführt (LRU/Idle‑TTL, optional SQLite/Redis, siehe session_store.py)
+memory_store = SessionMemoryStore(new_memory)
+
+
+# ==========================================================
+# Sitzungs-Cookies
+# ==========================================================
+def generate_chat_id(email: str) -> str:
+    # Chat-IDs haben das Format "<email>-<8 Hex-Zeichen>" (siehe chat_store.email_from_chat_id)
+    return f"{email}-{uuid.uuid4().hex[:8]}"
+
+
+def session_email(session) -> str:
+    return session.get('email') or ANONYMOUS
+
+
+def bind_session(session, chat_id: str, email: str) -> None:
+    session['email']   = email
+    session['chat_id'] = chat_id
+
+
+def clear_session(session) -> None:
+    session.pop('conversation_history', None)
+    session.pop('email', None)
+    session.pop('chat_id', None)
+
+
+def claimed_chat_id(session, new_email: str):
+    """chat_id eines anonymen Chats, der nachträglich der E-Mail zugeordnet wird, sonst None."""
+    old_email = session.get('email', ANONYMOUS)
+    if old_email == ANONYMOUS and new_email != ANONYMOUS:
+        return session.get('chat_id')
+    return None
+
+
+def claim_document(old_doc: dict, new_email: str, new_chat_id: str) -> dict:
+    """Chat-Dokument eines anonymen Chats unter neuer ID und E-Mail (Kopie, das alte wird gelöscht)."""
+    old_doc["id"]         = new_chat_id
+    old_doc["email"]      = new_email
+    old_doc["created_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    return old_doc
+
+
+def bind_chat(session, chat_id):
+    """
+    Setzt die Cookies für eine Chat-Anfrage: (chat_id, email, neu).
+    Ohne chat_id vom Client wird eine neue Sitzung angelegt (neu=True);
+    Chat-Dokument und Memories legt der Aufrufer an.
+    """
+    email = session_email(session)
+    if not chat_id:
+        chat_id = generate_chat_id(email)
+        bind_session(session, chat_id, email)
+        return chat_id, email, True
+    session['chat_id'] = chat_id
+    return chat_id, email, False
+
+
+def select_email(session, chat_id: str) -> str:
+    # Ohne Cookie steckt die E‑Mail auch in der Chat‑ID
+    return session.get('email') or email_from_chat_id(chat_id)
+
+
+def indexed(index_doc: dict, chat_id: str) -> bool:
+    return chat_id in index_doc.get("sessions", {})
+
+
+# ==========================================================
+# Chat-Anfrage, Persistenz und Antworten
+# ==========================================================
+def parse_chat_request(data):
+    """(Nachricht, chat_id, Fehlermeldung) aus dem JSON-Body von /chat und /chat/stream."""
+    data = data if isinstance(data, dict) else {}
+    user_message_text = data.get('message', '')
+    if not user_message_text or not isinstance(user_message_text, str):
+        return "", None, "Nachricht fehlt"
+    chat_id = data.get('chat_id')
+    if chat_id and not is_chat_id(chat_id):
+        return "", None, "Ungültige chat_id"
+    return user_message_text, chat_id, None
+
+
+def user_message(user_message_text: str, email: str) -> HumanMessage:
+    message = HumanMessage(content=user_message_text)
+    message.email = email  # Zusatzattribut für Downstream‑Logik
+    return message
+
+
+def exchange_payload(memory: dict, user_message_text, answer, decision):
+    """
+    (Nachrichten, memory_state, message_count) für den Append-Patch eines Turns.
+    message_count erst nach erfolgreichem Patch/Create mit commit_message_count übernehmen,
+    sonst zählt das Memory Nachrichten, die nie im Dokument angekommen sind.
+    """
+    messages = exchange_messages(user_message_text, answer, decision)
+    message_count = memory.get("message_count", 0) + len(messages)
+    # Die laufende Zusammenfassung geht mit (select_session fasst nur das Delta zusammen)
+    return messages, memory_state_for(memory, message_count), message_count
+
+
+def commit_message_count(memory: dict, message_count: int) -> None:
+    memory["message_count"] = message_count
+
+
+def chat_document_response(chat_doc: dict) -> dict:
+    """Chat-Dokument für /get-session ohne Memory-Zustand und Cosmos-Systemfelder."""
+    return {key: value for key, value in chat_doc.items() if key not in PRIVATE_FIELDS}
+
+
+def done_event(chat_id: str, decision: str) -> dict:
+    return {"type": "done", "chat_id": chat_id, "decision": decision}
+
+
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def content_filter_message(e) -> str:
+    """Baut aus einem openai.BadRequestError eine kurze, nutzerfreundliche Meldung."""
+    error_str = str(e)
+    short_msg = "Fehler beim Aufruf von Azure OpenAI (400)."
+    try:
+        splitted = error_str.split("Error code: 400 - ")
+        if len(splitted) > 1:
+            error_json = json.loads(splitted[1])
+            short_msg  = error_json["error"]["message"]
+            cf_result  = error_json["error"].get("innererror", {}).get("content_filter_result", {})
+            filtered_cats = [f"{cat} (Severity: {det.get('severity','?')})" for cat, det in cf_result.items() if det.get("filtered")]
+            if filtered_cats:
+                short_msg += " Gefilterte Kategorien: " + ", ".join(filtered_cats)
+    except Exception:
+        pass
+    return (
+        "Die Anfrage wurde von Azure OpenAI gefiltert. "
+        f"{short_msg} "
+        "Bitte passe deine Eingabe an oder kontaktiere den Support."
+    ).replace("\n", " ")
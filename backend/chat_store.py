@@ -0,0 +1,276 @@
+# Append-only-Persistenz der Chat-Verläufe in Cosmos DB
+#
+# Statt das komplette Chat-Dokument zu lesen, zu erweitern und per replace_item
+# zurückzuschreiben, werden Frage und Antwort eines Turns zusammen mit dem
+# Memory-Zustand in einem einzigen Partial-Document-Patch angehängt
+# (`add` auf /messages/-, `set` auf /memory_state). Es gibt keinen Vorab-Lesezugriff;
+# Kosten und Latenz pro Turn hängen nicht mehr von der Länge des Chats ab, und
+# gleichzeitige Schreiber überschreiben sich nicht, weil Cosmos jeden Patch atomar
+# auf den aktuellen Stand anwendet. Existiert das Dokument noch nicht, wird es mit
+# den Nachrichten angelegt; verliert dabei ein paralleler Schreiber das Rennen
+# (Conflict), hängt er seine Nachrichten per Patch an.
+#
+# Pro Nutzer (Partition /email) gibt es zusätzlich ein kompaktes Index-Dokument
+# mit id, created_at, message_count, title und last_activity jeder Sitzung. Es wird
+# beim Schreiben gepflegt; /get-sessions und /select-session lesen nur noch per
+# Punkt-Lesezugriff statt per partitionsübergreifender Abfrage über die Verläufe.
+
+import datetime
+
+from azure.cosmos import exceptions
+
+from session_store import document_memory_state
+
+SESSION_INDEX_ID = "session-index"
+TITLE_MAX_LENGTH = 60
+
+# Nachrichteninhalte, Memory-Zustand und Sitzungsliste werden nie gefiltert → nicht indexieren
+INDEXING_POLICY = {
+    "indexingMode": "consistent",
+    "includedPaths": [{"path": "/*"}],
+    "excludedPaths": [
+        {"path": "/messages/*"},
+        {"path": "/memory_state/*"},
+        {"path": "/sessions/*"},
+        {"path": '/"_etag"/?'},
+    ],
+}
+
+
+def new_chat_document(chat_id, email, messages=None) -> dict:
+    return {
+        "id":         chat_id,
+        "email":      email,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "messages":   messages or []
+    }
+
+
+def exchange_messages(user_message_text, answer, decision) -> list:
+    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    return [
+        {"sender": "user", "content": user_message_text, "timestamp": timestamp},
+        {"sender": "bot", "content": answer, "timestamp": timestamp, "agent": decision},
+    ]
+
+
+def memory_state_for(memory, message_count: int) -> dict:
+    # Die Anzahl der Nachrichten im Dokument wird im Memory mitgezählt (ersetzt len(messages) nach dem Lesen).
+    # Gespeichert wird der Stand nach dem Turn; memory selbst übernimmt ihn erst nach erfolgreichem Schreiben.
+    return document_memory_state({**memory, "message_count": message_count}, message_count)
+
+
+def patch_operations(messages, memory_state) -> list:
+    operations = [{"op": "add", "path": "/messages/-", "value": message} for message in messages]
+    operations.append({"op": "set", "path": "/memory_state", "value": memory_state})
+    return operations
+
+
+def append_exchange(container, chat_id, email, messages, memory_state) -> None:
+    """Hängt die Nachrichten eines Turns ohne Vorab-Lesen an das Chat-Dokument an."""
+    operations = patch_operations(messages, memory_state)
+    try:
+        container.patch_item(item=chat_id, partition_key=email, patch_operations=operations)
+        return
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+    document = new_chat_document(chat_id, email, messages)
+    document["memory_state"] = memory_state
+    try:
+        container.create_item(body=document)
+    except exceptions.CosmosResourceExistsError:
+        container.patch_item(item=chat_id, partition_key=email, patch_operations=operations)
+
+
+async def aappend_exchange(container, chat_id, email, messages, memory_state) -> None:
+    """Wie append_exchange, für den asynchronen Cosmos-Client (azure.cosmos.aio)."""
+    operations = patch_operations(messages, memory_state)
+    try:
+        await container.patch_item(item=chat_id, partition_key=email, patch_operations=operations)
+        return
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+    document = new_chat_document(chat_id, email, messages)
+    document["memory_state"] = memory_state
+    try:
+        await container.create_item(body=document)
+    except exceptions.CosmosResourceExistsError:
+        await container.patch_item(item=chat_id, partition_key=email, patch_operations=operations)
+
+
+# --------------------------------------------------------------------
+# Sitzungsindex pro Nutzer
+# --------------------------------------------------------------------
+def email_from_chat_id(chat_id: str) -> str:
+    # Chat-IDs haben das Format "<email>-<8 Hex-Zeichen>"
+    return chat_id.rsplit("-", 1)[0]
+
+
+def session_title(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= TITLE_MAX_LENGTH else text[:TITLE_MAX_LENGTH - 1].rstrip() + "…"
+
+
+def index_entry(chat_id, created_at, message_count, title, last_activity) -> dict:
+    return {
+        "id":            chat_id,
+        "created_at":    created_at,
+        "message_count": message_count,
+        "title":         title,
+        "last_activity": last_activity,
+    }
+
+
+def _entry_path(chat_id: str) -> str:
+    # JSON-Pointer-Escaping für den Schlüssel im sessions-Objekt
+    return "/sessions/" + chat_id.replace("~", "~0").replace("/", "~1")
+
+
+def new_index_document(email, entries=()) -> dict:
+    return {
+        "id":       SESSION_INDEX_ID,
+        "email":    email,
+        "type":     "session_index",
+        "sessions": {entry["id"]: entry for entry in entries}
+    }
+
+
+def index_operations(chat_id, messages, message_count) -> tuple:
+    """Patch für einen neuen Turn: (Teil-Update, vollständiger Eintrag als Fallback)."""
+    timestamp = messages[-1]["timestamp"]
+    path = _entry_path(chat_id)
+    entry = index_entry(chat_id, messages[0]["timestamp"], message_count, session_title(messages[0]["content"]), timestamp)
+    if message_count == len(messages):
+        # Erster Turn dieser Sitzung: Eintrag anlegen
+        return [{"op": "set", "path": path, "value": entry}], entry
+    update = [
+        {"op": "set", "path": f"{path}/message_count", "value": message_count},
+        {"op": "set", "path": f"{path}/last_activity", "value": timestamp},
+    ]
+    return update, entry
+
+
+def update_session_index(container, email, chat_id, messages, message_count) -> None:
+    """Trägt einen Turn in den Sitzungsindex des Nutzers ein (anonyme Sitzungen werden nicht gelistet)."""
+    if email == "anonymous":
+        return
+    operations, entry = index_operations(chat_id, messages, message_count)
+    try:
+        container.patch_item(item=SESSION_INDEX_ID, partition_key=email, patch_operations=operations)
+        return
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+    except exceptions.CosmosHttpResponseError as e:
+        if e.status_code != 400:
+            raise
+        # Eintrag fehlt (Sitzung von vor dem Index) → vollständig setzen
+        container.patch_item(item=SESSION_INDEX_ID, partition_key=email,
+                             patch_operations=[{"op": "set", "path": _entry_path(chat_id), "value": entry}])
+        return
+    try:
+        container.create_item(body=build_session_index(container, email, extra=entry))
+    except exceptions.CosmosResourceExistsError:
+        update_session_index(container, email, chat_id, messages, message_count)
+
+
+async def aupdate_session_index(container, email, chat_id, messages, message_count) -> None:
+    if email == "anonymous":
+        return
+    operations, entry = index_operations(chat_id, messages, message_count)
+    try:
+        await container.patch_item(item=SESSION_INDEX_ID, partition_key=email, patch_operations=operations)
+        return
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+    except exceptions.CosmosHttpResponseError as e:
+        if e.status_code != 400:
+            raise
+        await container.patch_item(item=SESSION_INDEX_ID, partition_key=email,
+                                   patch_operations=[{"op": "set", "path": _entry_path(chat_id), "value": entry}])
+        return
+    try:
+        await container.create_item(body=await abuild_session_index(container, email, extra=entry))
+    except exceptions.CosmosResourceExistsError:
+        await aupdate_session_index(container, email, chat_id, messages, message_count)
+
+
+# Einmalige Migration: bestehende Chats eines Nutzers in den Index übernehmen (Abfrage innerhalb der Partition)
+LEGACY_SESSIONS_QUERY = (
+    "SELECT c.id, c.created_at, ARRAY_LENGTH(c.messages) AS message_count, "
+    "c.messages[0].content AS title, c.messages[ARRAY_LENGTH(c.messages) - 1].timestamp AS last_activity "
+    "FROM c WHERE IS_DEFINED(c.messages) AND ARRAY_LENGTH(c.messages) > 0"
+)
+
+
+def _legacy_entry(item) -> dict:
+    return index_entry(item["id"], item.get("created_at"), item.get("message_count", 0),
+                       session_title(item.get("title") or ""), item.get("last_activity") or item.get("created_at"))
+
+
+def build_session_index(container, email, extra=None) -> dict:
+    items = container.query_items(query=LEGACY_SESSIONS_QUERY, partition_key=email)
+    entries = [_legacy_entry(item) for item in items]
+    if extra is not None:
+        entries = [entry for entry in entries if entry["id"] != extra["id"]] + [extra]
+    return new_index_document(email, entries)
+
+
+async def abuild_session_index(container, email, extra=None) -> dict:
+    entries = [_legacy_entry(item) async for item in container.query_items(query=LEGACY_SESSIONS_QUERY, partition_key=email)]
+    if extra is not None:
+        entries = [entry for entry in entries if entry["id"] != extra["id"]] + [extra]
+    return new_index_document(email, entries)
+
+
+def list_sessions(index_doc) -> list:
+    """Sitzungen mit Nachrichten, neueste zuerst (Format von /get-sessions)."""
+    entries = [entry for entry in index_doc.get("sessions", {}).values() if entry.get("message_count", 0) > 0]
+    return sorted(entries, key=lambda entry: entry.get("created_at") or "", reverse=True)
+
+
+def read_session_index(container, email) -> dict:
+    try:
+        return container.read_item(item=SESSION_INDEX_ID, partition_key=email)
+    except exceptions.CosmosResourceNotFoundError:
+        index_doc = build_session_index(container, email)
+        try:
+            container.create_item(body=index_doc)
+        except exceptions.CosmosResourceExistsError:
+            return container.read_item(item=SESSION_INDEX_ID, partition_key=email)
+        return index_doc
+
+
+async def aread_session_index(container, email) -> dict:
+    try:
+        return await container.read_item(item=SESSION_INDEX_ID, partition_key=email)
+    except exceptions.CosmosResourceNotFoundError:
+        index_doc = await abuild_session_index(container, email)
+        try:
+            await container.create_item(body=index_doc)
+        except exceptions.CosmosResourceExistsError:
+            return await container.read_item(item=SESSION_INDEX_ID, partition_key=email)
+        return index_doc
+
+
+def is_chat_id(chat_id) -> bool:
+    # Der Sitzungsindex liegt in derselben Partition; seine ID ist keine Chat-ID
+    return isinstance(chat_id, str) and bool(chat_id) and chat_id != SESSION_INDEX_ID
+
+
+def read_chat_document(container, chat_id, email):
+    """Punkt-Lesezugriff über (id, email); None, wenn der Chat nicht existiert."""
+    if not is_chat_id(chat_id):
+        return None
+    try:
+        return container.read_item(item=chat_id, partition_key=email)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+
+
+async def aread_chat_document(container, chat_id, email):
+    if not is_chat_id(chat_id):
+        return None
+    try:
+        return await container.read_item(item=chat_id, partition_key=email)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
@@ -13,10 +13,16 @@ import os  # Für Zugriff auf Umgebungsvariablen
 import requests  # HTTP-Anfragen (in diesem Code nicht genutzt)
 import json  # JSON-Verarbeitung für Ein-/Ausgabe
 import re  # Reguläre Ausdrücke für String-Bereinigung
+import asyncio  # Asynchrone Variante für den ASGI-Modus
 
-# Umgebungsvariablen laden
+# Umgebungsvariablen laden (vor den eigenen Modulen, die ihre Einstellungen beim Import lesen)
 load_dotenv()
 
+from orchestration import sql_templates  # Vorbereitete Abfragen für häufige Anliegen
+from orchestration import sql_validator  # Lokale Vorprüfung generierter Abfragen
+from orchestration import db_agent_policy as policy  # Retry-Budget und Abbruchregeln
+from orchestration.sql_cache import result_cache  # Kurzlebiger Cache für SQL-Ergebnisse
+
 # Anmeldeinformationen aus Umgebungsvariablen beziehen
 USERNAME = os.environ.get("USERNAME_RELDB")
 PASSWORD = os.environ.get("PASSWORD_RELDB")
@@ -45,6 +51,11 @@ class State(TypedDict, total=False):
     global_buffer: str
     query_feedback: str
     query: str
+    query_params: dict
+    use_templates: bool
+    last_valid_query: str
+    budget: object
+    error: str
     result: str
     answer: str
 
@@ -103,6 +114,9 @@ database_structure = """
 SalesLT.Customer(CustomerID, NameStyle, FirstName, MiddleName, LastName, Suffix, CompanyName, SalesPerson, EmailAddress, Phone, PasswordHash, PasswordSalt, rowguid, ModifiedDate), SalesLT.Address(AddressID, AddressLine1, AddressLine2, City, StateProvince, CountryRegion, PostalCode, rowguid, ModifiedDate), SalesLT.CustomerAddress(CustomerID, AddressID, AddressType, rowguid, ModifiedDate), SalesLT.Product(ProductID, Name, ProductNumber, StandardCost, ListPrice, ProductCategoryID, SellStartDate, SellEndDate, DiscontinuedDate, rowguid, ModifiedDate), SalesLT.SalesOrderDetail(SalesOrderID, SalesOrderDetailID, OrderQty, ProductID, UnitPrice, UnitPriceDiscount, LineTotal, rowguid, ModifiedDate), SalesLT.SalesOrderHeader(SalesOrderID, RevisionNumber, OrderDate, DueDate, ShipDate, Status, OnlineOrderFlag, SalesOrderNumber, PurchaseOrderNumber, AccountNumber, CustomerID, ShipToAddressID, BillToAddressID, ShipMethod, CreditCardApprovalCode, SubTotal, TaxAmt, Freight, TotalDue, Comment, rowguid, ModifiedDate)
 """
 
+# Tabellen und Spalten für die lokale Prüfung der generierten Abfragen
+SCHEMA = sql_validator.parse_schema(database_structure)
+
 # Zusammensetzen des PromptTemplates mit allen benötigten Variablen
 prompt = PromptTemplate(
     template=sql_query_prompt,
@@ -120,10 +134,9 @@ def clean_json_response(response_str: str) -> str:
             cleaned = cleaned[start:end+1]
     return cleaned
 
-# Validierung des Outputs durch LLM
-def validate_output(state: State, generated_output: str) -> dict:
-    # Prompt zur Überprüfung, ob Antwort korrekt und vollständig ist
-    output_validation_prompt = f"""
+# Prompt zur Überprüfung, ob Antwort korrekt und vollständig ist
+def output_validation_prompt(state: State, generated_output: str) -> str:
+    return f"""
 Bitte überprüfe das folgende SQL-Ergebnis und die generierte Antwort basierend auf der Frage: "{state["question"]}".
 SQL-Ergebnis und Antwort:
 {generated_output}
@@ -137,9 +150,10 @@ Bitte antworte ausschließlich im folgenden JSON-Format:
     "confidence": "eine Zahl zwischen 0 und 1"
 }}
 """
-    response = llm_process.invoke(output_validation_prompt)
+
+def parse_output_feedback(content: str) -> dict:
     try:
-        cleaned_response = clean_json_response(response.content)
+        cleaned_response = clean_json_response(content)
         if not cleaned_response.startswith("{"):
             raise ValueError("Antwort beginnt nicht mit '{'")
         output_feedback = json.loads(cleaned_response)
@@ -148,8 +162,19 @@ Bitte antworte ausschließlich im folgenden JSON-Format:
         output_feedback = {"decision": "not ok", "rationale": "Kein gültiges Output-Feedback erhalten.", "confidence": 0.0}
     return output_feedback
 
-# Generiert eine SQL-Abfrage anhand des aktuellen Zustands
-def write_query(state: State):
+# Validierung des Outputs durch LLM
+def validate_output(state: State, generated_output: str) -> dict:
+    policy.spend(state)
+    response = llm_process.invoke(output_validation_prompt(state, generated_output))
+    return parse_output_feedback(response.content)
+
+async def avalidate_output(state: State, generated_output: str) -> dict:
+    policy.spend(state)
+    response = await llm_process.ainvoke(output_validation_prompt(state, generated_output))
+    return parse_output_feedback(response.content)
+
+# Füllt den Prompt zur SQL-Generierung anhand des aktuellen Zustands
+def query_prompt(state: State) -> str:
     email = state.get("email", "").strip()
     # E-Mail-Filter für anonym oder konkret
     if email and email.lower() != "anonymous":
@@ -165,7 +190,7 @@ def write_query(state: State):
     if feedback:
         feedback_clause = f"Feedback from previous attempts: {feedback}"
     
-    filled_prompt = prompt.format(
+    return prompt.format(
         dialect=db.dialect,
         input=state["question"],
         email_clause=email_clause,
@@ -174,21 +199,35 @@ def write_query(state: State):
         feedback_clause=feedback_clause,
         database_structure=database_structure
     )
-    
+
+# Generiert eine SQL-Abfrage anhand des aktuellen Zustands
+def write_query(state: State):
     try:
         structured_llm = llm_prompt.with_structured_output(QueryOutput)
-        result = structured_llm.invoke(filled_prompt)
+        policy.spend(state)
+        result = structured_llm.invoke(query_prompt(state))
         return {"query": result["query"]}
     except Exception as e:
         print("Fehler beim Generieren der SQL-Abfrage:", e)
         return None
 
-# Validiert die generierte SQL-Abfrage auf Richtigkeit
-def validate_query(state: State, generated_query: str) -> dict:
-    validation_prompt = f"""
+async def awrite_query(state: State):
+    try:
+        structured_llm = llm_prompt.with_structured_output(QueryOutput)
+        policy.spend(state)
+        result = await structured_llm.ainvoke(query_prompt(state))
+        return {"query": result["query"]}
+    except Exception as e:
+        print("Fehler beim Generieren der SQL-Abfrage:", e)
+        return None
+
+# Prompt zur Prüfung der generierten SQL-Abfrage (nur noch für Fälle, die die lokale Prüfung nicht entscheiden kann)
+def query_validation_prompt(state: State, generated_query: str, hints: str = "") -> str:
+    return f"""
 Bitte überprüfe die folgende SQL-Abfrage basierend auf der Frage: "{state["question"]}".
 Achte dabei auf:
 - Wird die Tabelle Customer, CustomerAddress, SalesOrderDetail oder SalesOrderHeader verwendet, muss eine WHERE-Klausel mit der E-Mail Adresse des Kunden hinzugefügt sein.
+- Offene Punkte der automatischen Prüfung: {hints or "keine"}
 
 Die Datenbankstruktur ist wie folgt:
 {database_structure}
@@ -202,47 +241,157 @@ Bitte antworte ausschließlich im folgenden JSON-Format:
     "confidence": "eine Zahl zwischen 0 und 1"
 }}
 """
-    response = llm_process.invoke(validation_prompt)
-    print("Validierungsoutput:", response.content)
+
+def parse_query_feedback(content: str) -> dict:
+    print("Validierungsoutput:", content)
     
     try:
-        cleaned_response = clean_json_response(response.content)
+        cleaned_response = clean_json_response(content)
         feedback_json = json.loads(cleaned_response)
     except Exception as e:
         print("Fehler beim Parsen des JSON-Feedbacks:", e)
         feedback_json = {"decision": "not ok", "rationale": "", "confidence": 0.0}
     return feedback_json
 
-# Hauptlogik: Chain-of-Thought mit bis zu 3 Versuchen
+# Validiert die generierte SQL-Abfrage auf Richtigkeit
+def validate_query(state: State, generated_query: str, hints: str = "") -> dict:
+    policy.spend(state)
+    response = llm_process.invoke(query_validation_prompt(state, generated_query, hints))
+    return parse_query_feedback(response.content)
+
+async def avalidate_query(state: State, generated_query: str, hints: str = "") -> dict:
+    policy.spend(state)
+    response = await llm_process.ainvoke(query_validation_prompt(state, generated_query, hints))
+    return parse_query_feedback(response.content)
+
+# Führt eine Abfrage genau einmal aus; identische Abfragen desselben Kunden kommen kurz aus dem Cache
+def run_sql(query: str, email: str = "", parameters: dict = None) -> str:
+    key = result_cache.make_key(query, email, parameters)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+    if parameters:
+        result = db.run_no_throw(query, parameters=parameters)
+    else:
+        result = QuerySQLDatabaseTool(db=db).invoke(query)
+    result_cache.put(key, result)
+    return result
+
+# Passende Vorlage direkt ausführen; ohne Treffer oder ohne Ergebnis übernimmt die LLM-Generierung
+def template_query(state: State):
+    if not state.get("use_templates", True):
+        return None
+    # Der Orchestrator stellt der Frage ggf. "Rationale: ..." voran
+    question = state["question"].split("\n")[-1]
+    matched = sql_templates.match_template(question, state.get("email", ""))
+    if matched is None:
+        return None
+    template, params = matched
+    result = run_sql(template.sql, state.get("email", ""), params)
+    if not result or result.startswith("Error:"):
+        return None
+    print(f"SQL-Vorlage verwendet: {template.name}")
+    return {"query": template.sql, "query_params": params, "result": result}
+
+def add_query_feedback(state: State, attempt: int, text: str) -> None:
+    state["query_feedback"] = state.get("query_feedback", "") + f"\nVersuch {attempt+1}: {text}"
+
+# Keine Abfrage wurde freigegeben: nur die bereits erfolgreich ausgeführte Abfrage eines früheren
+# Durchlaufs wiederverwenden; verworfene oder ungeprüfte Abfragen werden nie ausgeführt
+def fallback_query(state: State):
+    query = state.get("last_valid_query")
+    if not query:
+        return {"query": "", "error": "invalid", "query_feedback": state.get("query_feedback", "")}
+    return {"query": query, "query_feedback": state.get("query_feedback", "")}
+
+# Hauptlogik: Chain-of-Thought mit bis zu DB_AGENT_MAX_QUERY_ATTEMPTS Versuchen im Rahmen des Budgets
 def write_query_with_chain_of_thought(state: State):
-    max_attempts = 3
-    last_query = ""
-    for attempt in range(max_attempts):
+    templated = template_query(state)
+    if templated:
+        return templated
+    for attempt in range(policy.DB_AGENT_MAX_QUERY_ATTEMPTS):
+        # Die LLM-Prüfung fällt nur noch bei unklarem lokalem Urteil an
+        if not policy.allows(state, 1):
+            print("Budget des Datenbank-Agenten erschöpft.")
+            break
         print(f"Versuch {attempt+1} der Query-Generierung")
         generated = write_query(state)
         if not generated:
             print("Fehler beim Generieren der Query.")
             continue
         query = generated["query"]
-        last_query = query
-        feedback = validate_query(state, query)
+        check = sql_validator.check_query(query, state.get("email", ""), SCHEMA)
+        if check.fatal:
+            return {"query": "", "error": "anonymous"}
+        if not check.valid:
+            # Lokal verworfen: kein LLM-Validator nötig
+            policy.reject_locally(state)
+            add_query_feedback(state, attempt, check.feedback())
+            continue
+        if check.ok:
+            # Eindeutiges lokales Urteil ersetzt den LLM-Validator
+            policy.accept_locally(state)
+            return {"query": query, "query_feedback": state.get("query_feedback", "")}
+        print(f"Lokale SQL-Prüfung unklar: {check.hints()}")
+        if not policy.allows(state, 1):
+            break
+        feedback = validate_query(state, query, check.hints())
         if feedback.get("decision", "").lower() == "ok":
-            return {"query": query}
-        else:
-            current_feedback = state.get("query_feedback", "")
-            state["query_feedback"] = current_feedback + f"\nVersuch {attempt+1}: {feedback.get('rationale', '')}"
-    return {"query": last_query}
+            return {"query": query, "query_feedback": state.get("query_feedback", "")}
+        add_query_feedback(state, attempt, feedback.get("rationale", ""))
+    return fallback_query(state)
+
+async def awrite_query_with_chain_of_thought(state: State):
+    templated = await asyncio.to_thread(template_query, state)
+    if templated:
+        return templated
+    for attempt in range(policy.DB_AGENT_MAX_QUERY_ATTEMPTS):
+        if not policy.allows(state, 1):
+            print("Budget des Datenbank-Agenten erschöpft.")
+            break
+        print(f"Versuch {attempt+1} der Query-Generierung")
+        generated = await awrite_query(state)
+        if not generated:
+            print("Fehler beim Generieren der Query.")
+            continue
+        query = generated["query"]
+        check = sql_validator.check_query(query, state.get("email", ""), SCHEMA)
+        if check.fatal:
+            return {"query": "", "error": "anonymous"}
+        if not check.valid:
+            policy.reject_locally(state)
+            add_query_feedback(state, attempt, check.feedback())
+            continue
+        if check.ok:
+            policy.accept_locally(state)
+            return {"query": query, "query_feedback": state.get("query_feedback", "")}
+        print(f"Lokale SQL-Prüfung unklar: {check.hints()}")
+        if not policy.allows(state, 1):
+            break
+        feedback = await avalidate_query(state, query, check.hints())
+        if feedback.get("decision", "").lower() == "ok":
+            return {"query": query, "query_feedback": state.get("query_feedback", "")}
+        add_query_feedback(state, attempt, feedback.get("rationale", ""))
+    return fallback_query(state)
 
-# Ausführen der finalen SQL-Abfrage gegen die DB
+# Ausführen der finalen SQL-Abfrage gegen die DB (Vorlagen wurden bereits ausgeführt)
 def execute_query(state: State):
     """Execute SQL query."""
-    execute_query_tool = QuerySQLDatabaseTool(db=db)
+    if state.get("error"):
+        return {"result": ""}
+    if state.get("result"):
+        return {"result": state["result"]}
     print(state["query"])
-    print(execute_query_tool.invoke(state["query"]))
-    return {"result": execute_query_tool.invoke(state["query"])}
+    result = run_sql(state["query"], state.get("email", ""), state.get("query_params"))
+    print(result)
+    return {"result": result, "error": policy.classify_result(result) or ""}
+
+# pyodbc bietet keine asynchrone Schnittstelle: die Abfrage läuft in einem Worker-Thread
+async def aexecute_query(state: State):
+    return await asyncio.to_thread(execute_query, state)
 
 # Generierung der finalen Antwort basierend auf Query-Ergebnis
-def generate_answer(state: State):
+def answer_prompt(state: State) -> str:
     """
     Bitte antworte ausschließlich im folgenden JSON-Format, ohne zusätzlichen Text:
     {
@@ -262,7 +411,22 @@ def generate_answer(state: State):
         f"SQL Query: {state['query']}\n"
         f"SQL Result: {state['result']}\n"
     )
-    response = llm_process.invoke(prompt_text)
+    return prompt_text
+
+def generate_answer(state: State):
+    # Bei Fehlern gibt es nichts zu beantworten; der Aufrufer entscheidet über einen neuen Versuch
+    if state.get("error"):
+        return {"answer": ""}
+    policy.spend(state)
+    response = llm_process.invoke(answer_prompt(state))
+    cleaned_response = clean_json_response(response.content)
+    return {"answer": cleaned_response}
+
+async def agenerate_answer(state: State):
+    if state.get("error"):
+        return {"answer": ""}
+    policy.spend(state)
+    response = await llm_process.ainvoke(answer_prompt(state))
     cleaned_response = clean_json_response(response.content)
     return {"answer": cleaned_response}
 
@@ -273,50 +437,130 @@ graph_builder = StateGraph(State).add_sequence(
 graph_builder.add_edge(START, "write_query_with_chain_of_thought")
 graph = graph_builder.compile()
 
+# Asynchroner Graph für den ASGI-Modus (gleiche Knotennamen wie der synchrone Graph)
+agraph_builder = (
+    StateGraph(State)
+    .add_node("write_query_with_chain_of_thought", awrite_query_with_chain_of_thought)
+    .add_node("execute_query", aexecute_query)
+    .add_node("generate_answer", agenerate_answer)
+    .add_edge("write_query_with_chain_of_thought", "execute_query")
+    .add_edge("execute_query", "generate_answer")
+)
+agraph_builder.add_edge(START, "write_query_with_chain_of_thought")
+agraph = agraph_builder.compile()
+
+def initial_database_state(user_message, email, global_summary, global_buffer, attempt, feedback, last_valid_query, budget) -> dict:
+    return {
+        "question": user_message,
+        "email": email,
+        "global_summary": global_summary,
+        "global_buffer": global_buffer,
+        # Feedback früherer Versuche (Datenbankfehler, verworfene Antworten) fließt in die nächste Query ein
+        "query_feedback": feedback,
+        "query": "",
+        "query_params": {},
+        # Nach einer verworfenen Antwort nicht erneut dieselbe Vorlage verwenden
+        "use_templates": attempt == 1,
+        "last_valid_query": last_valid_query,
+        "budget": budget,
+        "error": "",
+        "result": "",
+        "answer": ""
+    }
+
+# Wertet Fehler eines Graph-Durchlaufs aus: (Antwort bei sofortigem Abbruch, Feedback für den nächsten Versuch)
+def attempt_error(final_state: dict) -> tuple:
+    error = final_state.get("error", "")
+    if error == "anonymous":
+        return policy.ANONYMOUS_MESSAGE, ""
+    if error == "fatal":
+        print(f"Nicht behebbarer Datenbankfehler: {final_state.get('result', '')}")
+        return policy.FAILURE_MESSAGE, ""
+    if error == "sql":
+        # Fehlermeldung der Datenbank direkt als Feedback, ohne Antwort-Generierung und Output-Validierung
+        return None, f"Die Abfrage {final_state.get('query', '')} ist fehlgeschlagen: {final_state.get('result', '')[:300]}"
+    if error == "invalid":
+        return None, "Keine gültige SQL-Abfrage erzeugt."
+    return None, ""
+
+def finish(budget, answer: str, answered: bool, early_exit: bool = False) -> str:
+    policy.stats.record(budget, answered, early_exit)
+    print(f"Datenbank-Agent: {budget.llm_calls} LLM-Aufrufe, {budget.elapsed():.1f}s, beantwortet={answered}")
+    print(f"Datenbank-Agent gesamt: {policy.stats.snapshot()}")
+    print(f"Lokale SQL-Prüfung: {sql_validator.stats}")
+    return answer
+
 # Funktion zur Handhabung einer Benutzerabfrage
 def handle_database_query(user_message: str, email: str = "", global_summary: str = "", global_buffer: str = "") -> str:
-    max_attempts = 3
-    attempt = 0
-    final_answer = ""
-    while attempt < max_attempts:
-        attempt += 1
-        initial_state = {
-            "question": user_message,
-            "email": email,
-            "global_summary": global_summary,
-            "global_buffer": global_buffer,
-            "query_feedback": "",
-            "query": "",
-            "result": "",
-            "answer": ""
-        }
+    budget = policy.RetryBudget()
+    feedback, last_valid_query = "", ""
+    for attempt in range(1, policy.DB_AGENT_MAX_ATTEMPTS + 1):
+        # Mindestens Query, Antwort und Output-Validierung müssen ins Budget passen
+        if not budget.allows(3):
+            print("Budget des Datenbank-Agenten erschöpft.")
+            break
+        initial_state = initial_database_state(user_message, email, global_summary, global_buffer,
+                                               attempt, feedback, last_valid_query, budget)
         try:
-            final_state = {}
-            for step in graph.stream(initial_state, stream_mode="updates"):
-                final_state = step
-
-            # Extrahiere die Antwort aus dem finalen State
-            if "answer" in final_state and final_state["answer"]:
-                final_answer = final_state["answer"]
-            elif "postprocess_node" in final_state and final_state["postprocess_node"].get("processed_output"):
-                final_answer = final_state["postprocess_node"]["processed_output"]
-            elif ("generate_answer" in final_state and 
-                  isinstance(final_state["generate_answer"], dict) and 
-                  "answer" in final_state["generate_answer"]):
-                final_answer = final_state["generate_answer"]["answer"]
-            else:
-                final_answer = ""
-            
+            final_state = graph.invoke(initial_state)
+            early_answer, error_feedback = attempt_error(final_state)
+            if early_answer is not None:
+                return finish(budget, early_answer, answered=False, early_exit=True)
+            if final_state.get("error"):
+                feedback = f"{final_state.get('query_feedback', feedback)}\n{error_feedback}".strip()
+                continue
+            if final_state.get("query") and not final_state.get("query_params"):
+                last_valid_query = final_state["query"]
+
+            final_answer = final_state.get("answer", "")
             print(final_answer)
-            
+            if not budget.allows(1):
+                # Keine Output-Validierung mehr möglich: Antwort aus erfolgreicher Abfrage übernehmen
+                return finish(budget, final_answer, answered=bool(final_answer))
+
             # Validierung des Outputs mithilfe des LLM
             output_feedback = validate_output(initial_state, final_answer)
             print(f"Output-Validierungsfeedback: {output_feedback}")
             if output_feedback.get("decision", "").lower() == "ok":
-                return final_answer
-            else:
-                print(f"Output-Validierung fehlgeschlagen bei Versuch {attempt}. Neue Query wird generiert.")
+                return finish(budget, final_answer, answered=True)
+            print(f"Output-Validierung fehlgeschlagen bei Versuch {attempt}. Neue Query wird generiert.")
+            feedback = f"{feedback}\nAntwort verworfen: {output_feedback.get('rationale', '')}".strip()
         except Exception as e:
             print(f"Fehler in handle_query_database bei Versuch {attempt}: {e}")
-    return "Entschuldigung, es konnte keine gültige Antwort generiert werden. agent_database"
+    return finish(budget, policy.FAILURE_MESSAGE, answered=False)
+
+# Asynchrone Variante von handle_database_query für den ASGI-Modus
+async def ahandle_database_query(user_message: str, email: str = "", global_summary: str = "", global_buffer: str = "") -> str:
+    budget = policy.RetryBudget()
+    feedback, last_valid_query = "", ""
+    for attempt in range(1, policy.DB_AGENT_MAX_ATTEMPTS + 1):
+        if not budget.allows(3):
+            print("Budget des Datenbank-Agenten erschöpft.")
+            break
+        initial_state = initial_database_state(user_message, email, global_summary, global_buffer,
+                                               attempt, feedback, last_valid_query, budget)
+        try:
+            final_state = await agraph.ainvoke(initial_state)
+            early_answer, error_feedback = attempt_error(final_state)
+            if early_answer is not None:
+                return finish(budget, early_answer, answered=False, early_exit=True)
+            if final_state.get("error"):
+                feedback = f"{final_state.get('query_feedback', feedback)}\n{error_feedback}".strip()
+                continue
+            if final_state.get("query") and not final_state.get("query_params"):
+                last_valid_query = final_state["query"]
+
+            final_answer = final_state.get("answer", "")
+            print(final_answer)
+            if not budget.allows(1):
+                return finish(budget, final_answer, answered=bool(final_answer))
 
+            output_feedback = await avalidate_output(initial_state, final_answer)
+            print(f"Output-Validierungsfeedback: {output_feedback}")
+            if output_feedback.get("decision", "").lower() == "ok":
+                return finish(budget, final_answer, answered=True)
+            print(f"Output-Validierung fehlgeschlagen bei Versuch {attempt}. Neue Query wird generiert.")
+            feedback = f"{feedback}\nAntwort verworfen: {output_feedback.get('rationale', '')}".strip()
+        except Exception as e:
+            print(f"Fehler in ahandle_database_query bei Versuch {attempt}: {e}")
+    return finish(budget, policy.FAILURE_MESSAGE, answered=False)
@@ -50,7 +50,7 @@ class GeneralState(TypedDict, total=False):
     global_buffer: str
     answer: str
 
-def general_node(state: GeneralState) -> GeneralState:
+def general_messages(state: GeneralState) -> list:
     summary_clause = ""
     if state.get("global_summary", "").strip():
         summary_clause = state["global_summary"]
@@ -65,10 +65,19 @@ def general_node(state: GeneralState) -> GeneralState:
         buffer_clause=buffer_clause
     )
     
-    response = general_agent.invoke([
+    return [
         SystemMessage(content=filled_prompt),
         HumanMessage(content=state["question"])
-    ])
+    ]
+
+def general_node(state: GeneralState) -> GeneralState:
+    response = general_agent.invoke(general_messages(state))
+    state["answer"] = response.content.strip()
+    return state
+
+# Asynchrone Variante für den ASGI-Modus
+async def ageneral_node(state: GeneralState) -> GeneralState:
+    response = await general_agent.ainvoke(general_messages(state))
     state["answer"] = response.content.strip()
     return state
 
@@ -76,6 +85,10 @@ graph_general = StateGraph(GeneralState).add_sequence([general_node])
 graph_general.add_edge(START, "general_node")
 graph_general = graph_general.compile()
 
+agraph_general = StateGraph(GeneralState).add_node("general_node", ageneral_node)
+agraph_general.add_edge(START, "general_node")
+agraph_general = agraph_general.compile()
+
 def handle_general_query(user_message: str, global_summary: str = "", global_buffer: str = "") -> str:
     """
     Verarbeitet eine allgemeine Benutzeranfrage unter Einbeziehung des bisherigen Gesprächsverlaufs.
@@ -98,3 +111,14 @@ def handle_general_query(user_message: str, global_summary: str = "", global_buf
     for step in graph_general.stream(initial_state, stream_mode="updates"):
         final_state = step
     return final_state.get("answer", "Entschuldigung, ich konnte keine Antwort generieren. agent_general")
+
+async def ahandle_general_query(user_message: str, global_summary: str = "", global_buffer: str = "") -> str:
+    """Asynchrone Variante von handle_general_query für den ASGI-Modus."""
+    initial_state = {
+        "question": user_message,
+        "global_summary": global_summary,
+        "global_buffer": global_buffer,
+        "answer": ""
+    }
+    final_state = await agraph_general.ainvoke(initial_state)
+    return final_state.get("answer") or "Entschuldigung, ich konnte keine Antwort generieren. agent_general"
@@ -1,5 +1,7 @@
 import sys
 import os
+import threading
+import asyncio
 #bestimmt den aktuellen Ordner und das Projekt-Root-Verzeichnis
 aktueller_ordner = os.path.dirname(__file__)
 projekt_root = os.path.abspath(os.path.join(aktueller_ordner, '..', '..'))
@@ -14,6 +16,10 @@ from dotenv import load_dotenv
 from typing_extensions import TypedDict
 from backend.textprocessing import chunker
 from backend.textprocessing import ChunkerPSQL
+from backend.textprocessing.keyword_matcher import KeywordMatcher
+
+# "local" = Keyword-Filter über lokales Alias-Wörterbuch, "gpt" = bisheriger GPT-Aufruf
+KEYWORD_MATCHER_MODE = os.getenv("KEYWORD_MATCHER_MODE", "local").lower()
 
 
 class State(TypedDict, total=False):
@@ -43,22 +49,42 @@ class VectorAgent():
             api_base=os.environ["ADA_ENDPOINT"],
             model= "text-embedding-ada-002"
         )
+        # PDFProcessor (Document Intelligence, Embeddings, DB-Pool) einmalig pro Agent anlegen
+        self.processor = ChunkerPSQL.PDFProcessor()
+        # Lokale Keyword-Zuordnung; Fallback über die (gecachten) Query-Embeddings des Processors
+        self.keyword_matcher = KeywordMatcher(self.processor.embedding_client)
     
-    # Extrahiert Kontext aus der Datenbank basierend auf der Nutzerfrage
-    def retrieve_context(self, state: State) -> State:
-        processor = ChunkerPSQL.PDFProcessor()
+    # Bestimmt den Keyword-Filter für die Suche
+    def keyword_filter(self, question: str):
         #die Keywords müssen noch aus dem User-Input extrahiert werden und als Keyword-Filters an den Chunker übergeben werden
 
-        # keywords holen mit chunkerpsql
-        keywords = "{" + ",".join(processor.get_keywords_with_gpt(state["question"]).split(", ")) + "}"
-        print("Die Keywords für die question sind:" + keywords)
+        # keywords lokal zuordnen (oder wie bisher per GPT)
+        if KEYWORD_MATCHER_MODE == "gpt":
+            keyword_list = self.processor.get_keywords_with_gpt(question).split(", ")
+        else:
+            keyword_list = self.keyword_matcher.match(question)
+        # Ohne Treffer wird ohne Keyword-Filter gesucht
+        keywords = "{" + ",".join(keyword_list) + "}" if keyword_list else None
+        print(f"Die Keywords für die question sind: {keywords}")
+        return keywords
+
+    # Extrahiert Kontext aus der Datenbank basierend auf der Nutzerfrage
+    def retrieve_context(self, state: State) -> State:
+        keywords = self.keyword_filter(state["question"])
         # Sucht relevante Text-Bausteine basierend auf Frage und Schlüsselwörtern
-        results = processor.search_chunks(state["question"], keywords)
+        results = self.processor.search_chunks(state["question"], keywords)
         state["context"] = "\n\n".join([res[1] for res in results])
         return state
 
-    # Generiert eine Antwort basierend auf Kontext und Verlauf
-    def generate_answer(self, state: State) -> State:
+    async def aretrieve_context(self, state: State) -> State:
+        # Keyword-Zuordnung kann Netzwerkaufrufe enthalten (GPT-Modus, Embedding-Fallback)
+        keywords = await asyncio.to_thread(self.keyword_filter, state["question"])
+        results = await self.processor.asearch_chunks(state["question"], keywords)
+        state["context"] = "\n\n".join([res[1] for res in results or []])
+        return state
+
+    # Baut die Nachrichten für die Antwortgenerierung aus Kontext und Verlauf
+    def answer_messages(self, state: State) -> list:
         summary_clause = ""
         if state.get("global_summary", "").strip():
             summary_clause = f"Globale Zusammenfassung:\n{state['global_summary']}\n\n"
@@ -73,17 +99,79 @@ class VectorAgent():
             f"Dies sind die letzten 3 Nachrichten. Falls der Kontext relevant ist, beachte diese mehr als die Zusammenfassung.{buffer_clause}"
             f"Benutzeranfrage: {state['question']}"
         )
-        response = self.model.invoke([
+        return [
             SystemMessage(content=self.system_content),
             HumanMessage(content=prompt)
-        ])
+        ]
+
+    # Generiert eine Antwort basierend auf Kontext und Verlauf
+    def generate_answer(self, state: State) -> State:
+        response = self.model.invoke(self.answer_messages(state))
+        state["answer"] = response.content
+        return state
+
+    async def agenerate_answer(self, state: State) -> State:
+        response = await self.model.ainvoke(self.answer_messages(state))
         state["answer"] = response.content
         return state
     
+# Erstellt und kompiliert den StateGraph für einen Agenten
+def build_vector_graph(agent: VectorAgent):
+    graph = (
+        StateGraph(State)
+        .add_sequence([agent.retrieve_context, agent.generate_answer])
+    )
+    graph.add_edge(START, "retrieve_context")
+    return graph.compile()
+
+# Asynchroner Graph für den ASGI-Modus (gleiche Knotennamen wie der synchrone Graph)
+def build_async_vector_graph(agent: VectorAgent):
+    graph = (
+        StateGraph(State)
+        .add_node("retrieve_context", agent.aretrieve_context)
+        .add_node("generate_answer", agent.agenerate_answer)
+        .add_edge("retrieve_context", "generate_answer")
+    )
+    graph.add_edge(START, "retrieve_context")
+    return graph.compile()
+
+# Prozessweite Instanzen: Agent, Processor und Graph werden beim ersten Aufruf
+# angelegt und danach für alle Anfragen wiederverwendet
+_vector_agent = None
+_vector_graph = None
+_async_vector_graph = None
+_init_lock = threading.Lock()
+
+def get_vector_agent() -> VectorAgent:
+    global _vector_agent
+    if _vector_agent is None:
+        with _init_lock:
+            if _vector_agent is None:
+                load_dotenv()
+                _vector_agent = VectorAgent()
+    return _vector_agent
+
+def get_vector_graph():
+    global _vector_graph
+    if _vector_graph is None:
+        agent = get_vector_agent()
+        with _init_lock:
+            if _vector_graph is None:
+                _vector_graph = build_vector_graph(agent)
+    return _vector_graph
+
+def get_async_vector_graph():
+    global _async_vector_graph
+    if _async_vector_graph is None:
+        agent = get_vector_agent()
+        with _init_lock:
+            if _async_vector_graph is None:
+                _async_vector_graph = build_async_vector_graph(agent)
+    return _async_vector_graph
+
 # Hauptfunktion zum Verarbeiten einer Nutzeranfrage
 def handle_vector_query(user_message: str, global_summary: str = "", global_buffer: str = "") -> str:
-    load_dotenv()
-    agent = VectorAgent()
+    graph = get_vector_graph()
     initial_state: State = {
         "question": user_message,
         "global_summary": global_summary,
@@ -91,13 +179,6 @@ def handle_vector_query(user_message: str, global_summary: str = "", global_buff
         "context": "",
         "answer": ""
     }
-    # Erstellt einen StateGraph für die Verarbeitung
-    graph = (
-        StateGraph(State)
-        .add_sequence([agent.retrieve_context, agent.generate_answer])
-    )
-    graph.add_edge(START, "retrieve_context")
-    graph = graph.compile()
     
     final_state = {}
     for step in graph.stream(initial_state, stream_mode="updates"):
@@ -108,6 +189,18 @@ def handle_vector_query(user_message: str, global_summary: str = "", global_buff
     else:
         return "Entschuldigung, ich konnte keine Antwort generieren. agent_vector"
 
+# Asynchrone Variante für den ASGI-Modus
+async def ahandle_vector_query(user_message: str, global_summary: str = "", global_buffer: str = "") -> str:
+    graph = get_async_vector_graph()
+    initial_state: State = {
+        "question": user_message,
+        "global_summary": global_summary,
+        "global_buffer": global_buffer,
+        "context": "",
+        "answer": ""
+    }
+    final_state = await graph.ainvoke(initial_state)
+    return final_state.get("answer") or "Entschuldigung, ich konnte keine Antwort generieren. agent_vector"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from operator import mul
+
+from orchestration import html_formatter
+
+# --------------------------------------------------------------------
+# Semantischer Antwort-Cache für wiederkehrende Support-Fragen
+#
+# Speichert die fertig aufbereiteten Antworten der Routen 'vector' und 'general',
+# Schlüssel ist das Embedding der Frage. Eine neue Frage, deren Kosinus-Ähnlichkeit
+# zu einer gespeicherten Frage über ANSWER_CACHE_THRESHOLD liegt, bekommt die
+# gespeicherte Antwort ohne Entscheidung, Retrieval, Generierung und Überarbeitung.
+# 'database'-Antworten (Kundendaten) werden nie gespeichert. Ändert sich der
+# Chunk-Korpus (Ingest-Manifest), werden die 'vector'-Einträge verworfen.
+# Die Agenten beziehen Zusammenfassung und letzte Nachrichten der Sitzung in die
+# Antwort ein; nachgeschlagen und gespeichert wird deshalb nur ohne Gesprächsverlauf,
+# sonst könnte eine Antwort mit persönlichem Verlauf an andere Nutzer gehen.
+# --------------------------------------------------------------------
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 500))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+# Wie oft (Sekunden) die Korpus-Version in Postgres geprüft wird
+ANSWER_CACHE_VERSION_INTERVAL = float(os.getenv("ANSWER_CACHE_VERSION_INTERVAL", 60))
+# Kurze Rückfragen ("Und das andere?") hängen vom Verlauf ab → nicht cachen
+ANSWER_CACHE_MIN_WORDS = int(os.getenv("ANSWER_CACHE_MIN_WORDS", 4))
+
+CACHEABLE_ROUTES = {"vector", "general"}
+# Fallback- und Fehlertexte der Agenten nicht speichern
+UNCACHEABLE_OUTPUT = re.compile(r"Entschuldigung, (ich|es) konnte|agent_\w+|Fehler", re.IGNORECASE)
+
+
+def _normalized(vector: list) -> list:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+class _CachedAnswer:
+
+    def __init__(self, embedding, question, decision, answer, agent_output, latency):
+        self.embedding = embedding
+        self.question = question
+        self.decision = decision
+        self.answer = answer
+        self.agent_output = agent_output
+        self.latency = latency
+        self.created_at = time.time()
+
+
+class SemanticAnswerCache:
+
+    def __init__(self, embed_query, aembed_query, corpus_version, threshold=ANSWER_CACHE_THRESHOLD,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL,
+                 version_interval=ANSWER_CACHE_VERSION_INTERVAL):
+        self.embed_query = embed_query
+        self.aembed_query = aembed_query
+        self.corpus_version = corpus_version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_interval = version_interval
+        self._entries = OrderedDict()  # laufende Nummer -> _CachedAnswer
+        self._next_id = 0
+        self._version = None
+        self._version_checked = float("-inf")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    # ---------------- Korpus-Version ----------------
+    def _check_corpus(self):
+        now = time.monotonic()
+        if now - self._version_checked < self.version_interval:
+            return
+        self._version_checked = now
+        try:
+            version = self.corpus_version()
+        except Exception as e:
+            logging.error(f"Korpus-Version für den Antwort-Cache nicht lesbar: {e}")
+            return
+        with self._lock:
+            if self._version is not None and version != self._version:
+                self._invalidate("vector")
+            self._version = version
+
+    def _invalidate(self, decision=None):
+        for key in [k for k, e in self._entries.items() if decision is None or e.decision == decision]:
+            del self._entries[key]
+        self.invalidations += 1
+
+    def invalidate(self, decision=None):
+        """Verwirft alle Einträge (oder nur die einer Route), z.B. direkt nach einem Ingest."""
+        with self._lock:
+            self._invalidate(decision)
+
+    # ---------------- Lookup / Store ----------------
+    def _best_match(self, embedding):
+        now = time.time()
+        with self._lock:
+            best, best_score = None, self.threshold
+            for key, entry in list(self._entries.items()):
+                if now - entry.created_at > self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                score = sum(map(mul, embedding, entry.embedding))
+                if score >= best_score:
+                    best, best_score = (key, entry), score
+            if best is None:
+                self.misses += 1
+                return None
+            key, entry = best
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry.latency
+            return entry
+
+    def lookup(self, question: str):
+        """Liefert (Treffer oder None, normalisiertes Embedding der Frage)."""
+        self._check_corpus()
+        embedding = _normalized(self.embed_query(question))
+        return self._best_match(embedding), embedding
+
+    async def alookup(self, question: str):
+        # Versionsprüfung ist ein synchroner Postgres-Zugriff → im Thread
+        await asyncio.to_thread(self._check_corpus)
+        embedding = _normalized(await self.aembed_query(question))
+        return self._best_match(embedding), embedding
+
+    def store(self, embedding, question, decision, answer, agent_output, latency):
+        with self._lock:
+            self._entries[self._next_id] = _CachedAnswer(embedding, question, decision, answer, agent_output, latency)
+            self._next_id += 1
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 2),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> SemanticAnswerCache:
+    # Embeddings und Korpus-Version kommen vom PDFProcessor des Vector-Agenten (inkl. Query-Embedding-Cache)
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from orchestration.agent_vector import get_vector_agent
+                processor = get_vector_agent().processor
+                _cache = SemanticAnswerCache(
+                    processor.embedding_client.embed_query,
+                    processor.embedding_client.aembed_query,
+                    processor.corpus_version
+                )
+    return _cache
+
+
+def has_history(memory) -> bool:
+    """True, wenn das Session-Memory bereits Nachrichten oder eine Zusammenfassung enthält."""
+    if not memory:
+        return False
+    memories = [memory.get("global_buffer"), memory.get("global_summary")] if isinstance(memory, dict) else [memory]
+    for item in memories:
+        if item is None:
+            continue
+        if getattr(item, "moving_summary_buffer", "") or getattr(getattr(item, "chat_memory", None), "messages", None):
+            return True
+    return False
+
+
+def eligible(question: str, decision: str = "", memory=None) -> bool:
+    # Bereits als 'database' klassifizierte Fragen gar nicht erst nachschlagen
+    if decision and decision not in CACHEABLE_ROUTES:
+        return False
+    # Antwort hängt vom Verlauf ab → weder nachschlagen noch (über embedding=None) speichern
+    if has_history(memory):
+        return False
+    return ANSWER_CACHE_ENABLED and len(question.split()) >= ANSWER_CACHE_MIN_WORDS
+
+
+def cacheable(decision: str, answer: str, agent_output: str) -> bool:
+    if decision not in CACHEABLE_ROUTES or not answer or not agent_output:
+        return False
+    if UNCACHEABLE_OUTPUT.search(agent_output):
+        return False
+    # Sicherheitsnetz: nichts speichern, was nach persönlichen Daten aussieht
+    return not html_formatter.EMAIL_PATTERN.search(answer)
+
+
+def lookup(question: str, decision: str = "", memory=None):
+    """(Treffer oder None, Embedding); bei Fehlern, ungeeigneten Fragen oder vorhandenem Verlauf (None, None)."""
+    if not eligible(question, decision, memory):
+        return None, None
+    try:
+        entry, embedding = get_cache().lookup(question)
+    except Exception as e:
+        logging.error(f"Fehler beim Lookup im Antwort-Cache: {e}")
+        return None, None
+    logging.debug("Antwort-Cache: %s", get_cache().stats())
+    return entry, embedding
+
+
+async def alookup(question: str, decision: str = "", memory=None):
+    if not eligible(question, decision, memory):
+        return None, None
+    try:
+        cache = await asyncio.to_thread(get_cache)
+        entry, embedding = await cache.alookup(question)
+    except Exception as e:
+        logging.error(f"Fehler beim Lookup im Antwort-Cache: {e}")
+        return None, None
+    logging.debug("Antwort-Cache: %s", cache.stats())
+    return entry, embedding
+
+
+def store(embedding, question, decision, answer, agent_output, latency) -> None:
+    if embedding is None or not cacheable(decision, answer, agent_output):
+        return
+    get_cache().store(embedding, question, decision, answer, agent_output, latency)
+    logging.debug("Antwort-Cache: %s", get_cache().stats())
@@ -0,0 +1,127 @@
+import os
+import re
+import threading
+import time
+
+# --------------------------------------------------------------------
+# Retry-Budget und Abbruchregeln für den Datenbank-Agenten
+#
+# Vorher konnten äußere Wiederholungen (ganzer Graph) und innere Wiederholungen
+# (Query schreiben + validieren) zusammen rund 24 LLM-Aufrufe für eine einzige
+# unbeantwortbare Frage auslösen. Jede Anfrage bekommt jetzt ein gemeinsames
+# Budget an LLM-Aufrufen und Laufzeit; Schleifen prüfen vor jedem Schritt, ob
+# es noch reicht. Deterministische Fehler (anonymer Zugriff auf Kundendaten,
+# Verbindungs-/Berechtigungsfehler der Datenbank) beenden die Anfrage sofort.
+# --------------------------------------------------------------------
+
+DB_AGENT_MAX_LLM_CALLS = int(os.getenv("DB_AGENT_MAX_LLM_CALLS", 8))
+DB_AGENT_MAX_SECONDS = float(os.getenv("DB_AGENT_MAX_SECONDS", 60))
+DB_AGENT_MAX_ATTEMPTS = int(os.getenv("DB_AGENT_MAX_ATTEMPTS", 2))
+DB_AGENT_MAX_QUERY_ATTEMPTS = int(os.getenv("DB_AGENT_MAX_QUERY_ATTEMPTS", 3))
+
+# Fehler der Datenbank, die ein neuer Query-Versuch nicht behebt
+FATAL_DB_ERRORS = re.compile(
+    r"login failed|permission|denied|communication link|timeout expired|"
+    r"tcp provider|unable to connect|network-related|connection (is )?(busy|closed)",
+    re.IGNORECASE
+)
+
+ANONYMOUS_MESSAGE = (
+    "Für Fragen zu Bestellungen oder Kundendaten gib bitte zuerst deine E-Mail-Adresse an, "
+    "damit ich die passenden Daten abrufen kann."
+)
+FAILURE_MESSAGE = "Entschuldigung, es konnte keine gültige Antwort generiert werden. agent_database"
+
+
+class RetryBudget:
+    """Budget einer einzelnen Anfrage an den Datenbank-Agenten."""
+
+    def __init__(self, max_llm_calls=DB_AGENT_MAX_LLM_CALLS, max_seconds=DB_AGENT_MAX_SECONDS):
+        self.max_llm_calls = max_llm_calls
+        self.max_seconds = max_seconds
+        self.started = time.monotonic()
+        self.llm_calls = 0
+        self.local_rejections = 0
+        self.local_accepts = 0
+
+    def spend(self, calls: int = 1) -> None:
+        self.llm_calls += calls
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def allows(self, calls: int = 1) -> bool:
+        """True, wenn noch `calls` LLM-Aufrufe in Budget und Zeit passen."""
+        return self.llm_calls + calls <= self.max_llm_calls and self.elapsed() < self.max_seconds
+
+
+def spend(state: dict, calls: int = 1) -> None:
+    budget = state.get("budget")
+    if budget is not None:
+        budget.spend(calls)
+
+
+def reject_locally(state: dict) -> None:
+    # Zählt Abfragen, die ohne LLM-Validator verworfen wurden
+    budget = state.get("budget")
+    if budget is not None:
+        budget.local_rejections += 1
+
+
+def accept_locally(state: dict) -> None:
+    # Zählt Abfragen, die ohne LLM-Validator freigegeben wurden
+    budget = state.get("budget")
+    if budget is not None:
+        budget.local_accepts += 1
+
+
+def allows(state: dict, calls: int = 1) -> bool:
+    budget = state.get("budget")
+    return budget is None or budget.allows(calls)
+
+
+def classify_result(result: str):
+    """None bei Erfolg, 'fatal' für nicht behebbare und 'sql' für behebbare Datenbankfehler."""
+    if not isinstance(result, str) or not result.startswith("Error:"):
+        return None
+    return "fatal" if FATAL_DB_ERRORS.search(result) else "sql"
+
+
+class PolicyStats:
+    """LLM-Aufrufe pro beantworteter Frage über alle Anfragen."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.answered = 0
+        self.early_exits = 0
+        self.llm_calls = 0
+        self.llm_calls_answered = 0
+        self.local_rejections = 0
+        self.local_accepts = 0
+
+    def record(self, budget: RetryBudget, answered: bool, early_exit: bool = False) -> None:
+        with self._lock:
+            self.requests += 1
+            self.llm_calls += budget.llm_calls
+            self.local_rejections += budget.local_rejections
+            self.local_accepts += budget.local_accepts
+            self.early_exits += early_exit
+            if answered:
+                self.answered += 1
+                self.llm_calls_answered += budget.llm_calls
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "answered": self.answered,
+                "early_exits": self.early_exits,
+                "llm_calls": self.llm_calls,
+                "local_rejections": self.local_rejections,
+                "local_accepts": self.local_accepts,
+                "llm_calls_per_answer": self.llm_calls_answered / self.answered if self.answered else 0.0,
+            }
+
+
+stats = PolicyStats()
@@ -0,0 +1,162 @@
+import os
+import re
+from html import escape
+
+# --------------------------------------------------------------------
+# Lokaler HTML-Formatter für Agenten-Antworten
+#
+# Wandelt Markdown-ähnlichen Text (Absätze, Überschriften, Listen, **fett**)
+# deterministisch in die HTML-Struktur um, die sonst der Process Agent erzeugt,
+# und hängt die Rückfrage am Ende an. Antworten, bei denen Ton oder Inhalt
+# angepasst werden müssen (interne Begriffe, E-Mail-Adressen, falsche Sprache,
+# rohes JSON), meldet needs_rewrite; diese gehen weiterhin an den Process Agent.
+# --------------------------------------------------------------------
+
+# "local" = lokaler Formatter mit LLM nur für markierte Fälle, "llm" = immer Process Agent
+POSTPROCESS_MODE = os.getenv("POSTPROCESS_MODE", "local").lower()
+
+# Maximale Anzahl Sätze pro Absatz
+MAX_SENTENCES_PER_PARAGRAPH = 3
+
+FOLLOWUP = {
+    "de": "<p>War diese Information hilfreich, oder benötigst du weitere Details? 😊</p>",
+    "en": "<p>Was this information helpful, or do you need more details? 😊</p>",
+}
+
+# Begriffe, die der Kunde nicht sehen soll bzw. Hinweise auf interne Fehlermeldungen
+REWRITE_TERMS = re.compile(r"\b(sql|datenbank|database|agent_\w+)\b", re.IGNORECASE)
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
+GERMAN_WORDS = {"der", "die", "das", "und", "ist", "ich", "wie", "was", "mein", "meine", "nicht", "mit",
+                "ein", "eine", "für", "kann", "habe", "welche", "bitte", "danke", "zu", "auf", "den"}
+ENGLISH_WORDS = {"the", "and", "is", "i", "how", "what", "my", "not", "with", "a", "an", "for", "can",
+                 "have", "which", "please", "thanks", "to", "on", "do", "does", "you"}
+
+BLOCK_TAG = re.compile(r"<(p|ul|ol|li|h[1-6]|table|div|br)\b", re.IGNORECASE)
+HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+BULLET = re.compile(r"^[-*•]\s+(.*)$")
+NUMBERED = re.compile(r"^\d+[.)]\s+(.*)$")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-ZÄÖÜ0-9])")
+
+
+def is_local_mode() -> bool:
+    return POSTPROCESS_MODE == "local"
+
+
+def _language_scores(text: str) -> tuple:
+    words = re.findall(r"[a-zäöüß]+", text.lower())
+    german = sum(1 for word in words if word in GERMAN_WORDS)
+    english = sum(1 for word in words if word in ENGLISH_WORDS)
+    return german, english
+
+
+def detect_language(text: str) -> str:
+    german, english = _language_scores(text)
+    return "en" if english > german else "de"
+
+
+def needs_rewrite(text: str, question: str = "") -> bool:
+    """True, wenn die Antwort inhaltlich oder im Ton durch den Process Agent überarbeitet werden muss."""
+    stripped = text.strip()
+    if not stripped:
+        return False
+    if REWRITE_TERMS.search(stripped) or EMAIL_PATTERN.search(stripped):
+        return True
+    if stripped.startswith(("{", "[")):
+        return True
+    # Sprache nur vergleichen, wenn beide Texte genug Anhaltspunkte enthalten
+    if question and any(_language_scores(question)) and any(_language_scores(stripped)):
+        if detect_language(question) != detect_language(stripped):
+            return True
+    return False
+
+
+def _inline(text: str) -> str:
+    text = escape(text, quote=False)
+    text = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", text)
+    text = re.sub(r"__(.+?)__", r"<b>\1</b>", text)
+    text = re.sub(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])", r"<i>\1</i>", text)
+    text = re.sub(r"`(.+?)`", r"<code>\1</code>", text)
+    return text
+
+
+def _paragraphs(lines: list) -> list:
+    # Lange Absätze in Blöcke zu höchstens MAX_SENTENCES_PER_PARAGRAPH Sätzen teilen
+    sentences = SENTENCE_END.split(" ".join(lines))
+    return [
+        f"<p>{_inline(' '.join(sentences[i:i + MAX_SENTENCES_PER_PARAGRAPH]))}</p>"
+        for i in range(0, len(sentences), MAX_SENTENCES_PER_PARAGRAPH)
+    ]
+
+
+def to_html(text: str) -> str:
+    """Wandelt Markdown-ähnlichen Text in HTML um; vorhandenes HTML bleibt unverändert."""
+    text = text.strip()
+    if not text or BLOCK_TAG.search(text):
+        return text
+
+    blocks, paragraph, items = [], [], []
+    list_tag = None
+
+    def flush_paragraph():
+        if paragraph:
+            blocks.extend(_paragraphs(paragraph))
+            paragraph.clear()
+
+    def flush_list():
+        nonlocal list_tag
+        if items:
+            blocks.append(f"<{list_tag}>" + "".join(f"<li>{_inline(item)}</li>" for item in items) + f"</{list_tag}>")
+            items.clear()
+        list_tag = None
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        heading = HEADING.match(line)
+        bullet = BULLET.match(line)
+        numbered = NUMBERED.match(line)
+        if not line:
+            flush_paragraph()
+            flush_list()
+        elif heading:
+            flush_paragraph()
+            flush_list()
+            level = 2 if len(heading.group(1)) <= 2 else 3
+            blocks.append(f"<h{level}>{_inline(heading.group(2))}</h{level}>")
+        elif bullet or numbered:
+            flush_paragraph()
+            tag = "ul" if bullet else "ol"
+            if list_tag and list_tag != tag:
+                flush_list()
+            list_tag = tag
+            items.append((bullet or numbered).group(1))
+        elif items and raw_line[:1].isspace():
+            # Eingerückte Zeile setzt den vorherigen Listenpunkt fort
+            items[-1] += " " + line
+        else:
+            flush_list()
+            paragraph.append(line)
+    flush_paragraph()
+    flush_list()
+    return "\n".join(blocks)
+
+
+def format_answer(text: str, question: str = "", table: str = "") -> str:
+    """Formatiert eine Einzelantwort: HTML-Text, optionale Tabelle und Rückfrage."""
+    parts = [part for part in (to_html(text), table) if part]
+    parts.append(FOLLOWUP[detect_language(question or text)])
+    return "\n".join(parts)
+
+
+def combine(answers: list, question: str = "") -> str:
+    """Fügt lokal formatierte Teilantworten zusammen; die Rückfrage erscheint nur einmal am Ende."""
+    followups = tuple(FOLLOWUP.values())
+    parts = []
+    for answer in answers:
+        answer = answer.strip()
+        for followup in followups:
+            if answer.endswith(followup):
+                answer = answer[:-len(followup)].rstrip()
+        parts.append(to_html(answer))
+    parts.append(FOLLOWUP[detect_language(question or " ".join(answers))])
+    return "\n".join(part for part in parts if part)
@@ -6,9 +6,19 @@ from langgraph.graph import StateGraph, START
 from dotenv import load_dotenv
 import json
 import re
+import threading
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+# .env vor den eigenen Modulen laden: sie lesen ihre Einstellungen beim Import
 load_dotenv()
 
+from orchestration import answer_cache, html_formatter, summary_worker
+
+# Maximale Anzahl parallel bearbeiteter Teilfragen pro Anfrage
+DISPATCH_MAX_WORKERS = int(os.getenv("DISPATCH_MAX_WORKERS", 4))
+
 # Initialisierung des Decision Agents (Router)
 decision_agent = AzureChatOpenAI(
     azure_endpoint=os.environ["OPENAI_ENDPOINT"],
@@ -117,15 +127,16 @@ def safe_json_parse(response_text):
         logging.error("Ungültige JSON-Antwort vom LLM: %s", response_text)
         return None  # Fallback
 
-def decision_node(state: dict) -> dict:
-    # Baut die Eingaben für den Decision Agent zusammen und wertet dessen JSON-Antwort aus
+def decision_messages(state: dict) -> list:
+    # Baut die Eingaben für den Decision Agent zusammen
     text = state.get("user_message", "")
-    messages = [
+    return [
         SystemMessage(content=decision_system_content),
         HumanMessage(content=f"Frage: {text}")
     ]
-    response = decision_agent.invoke(messages)
-    raw_response = response.content.strip()
+
+def apply_decision(state: dict, raw_response: str) -> dict:
+    # Wertet die JSON-Antwort des Decision Agents aus
     logging.debug("Decision Agent Raw Response: %s", raw_response)
 
     data = safe_json_parse(raw_response)
@@ -157,8 +168,44 @@ def decision_node(state: dict) -> dict:
                   state["decision"], rationale, confidence)
     return state
 
-def routing_node(state: dict) -> dict:
-    # Lädt Verlauf und Zusammenfassung aus dem Memory
+def decision_node(state: dict) -> dict:
+    response = decision_agent.invoke(decision_messages(state))
+    return apply_decision(state, response.content.strip())
+
+async def adecision_node(state: dict) -> dict:
+    response = await decision_agent.ainvoke(decision_messages(state))
+    return apply_decision(state, response.content.strip())
+
+def memory_lock(memory_dict: dict):
+    # Ein Lock pro Session-Memory serialisiert Schreibzugriffe paralleler Teilfragen
+    return memory_dict.setdefault("lock", threading.RLock())
+
+def save_to_memory(memory_dict: dict, text: str, answer: str) -> None:
+    # Speichert die Unterhaltung in beiden Memories
+    if not memory_dict:
+        return
+    global_buffer = memory_dict.get("global_buffer")
+    global_summary = memory_dict.get("global_summary")
+    background = global_summary is not None and summary_worker.is_background_mode()
+    with memory_lock(memory_dict):
+        if global_buffer:
+            global_buffer.save_context({"input": text}, {"output": answer})
+        if global_summary and background:
+            # Nur anhängen; das Zusammenfassen per summarizer_llm läuft nach der Antwort im Hintergrund
+            summary_worker.append_messages(global_summary, text, answer)
+        elif global_summary:
+            global_summary.save_context({"input": text}, {"output": answer})
+    if background:
+        summary_worker.schedule(memory_dict, memory_lock(memory_dict))
+
+async def asave_to_memory(memory_dict: dict, text: str, answer: str) -> None:
+    if summary_worker.is_background_mode():
+        save_to_memory(memory_dict, text, answer)
+    else:
+        await asyncio.to_thread(save_to_memory, memory_dict, text, answer)
+
+def prepare_routing(state: dict) -> str:
+    # Lädt Verlauf und Zusammenfassung aus dem Memory und liefert den Text für den Agenten
     memory_dict = state.get("memory_dict", {})
     global_buffer = memory_dict.get("global_buffer")
     global_summary = memory_dict.get("global_summary")
@@ -176,6 +223,12 @@ def routing_node(state: dict) -> dict:
     rationale = state.get("rationale", "")
     if rationale:
         text = f"Rationale: {rationale}\n{text}"
+    return text
+
+def routing_node(state: dict) -> dict:
+    text = prepare_routing(state)
+    summary_history = state["global_summary"]
+    buffer_history = state["global_buffer"]
     email = state.get("email", "")
 
     # Dispatch an den gewählten Agenten
@@ -191,144 +244,235 @@ def routing_node(state: dict) -> dict:
         agent_answer = handle_general_query(text, summary_history, buffer_history)
 
     state["agent_output"] = agent_answer
+    state["memory_input"] = text
 
-    # Speichert die Unterhaltung in beiden Memories
-    if global_buffer:
-        global_buffer.save_context({"input": text}, {"output": agent_answer})
-    if global_summary:
-        global_summary.save_context({"input": text}, {"output": agent_answer})
+    # Bei parallelen Teilfragen schreibt dispatch die Memories gesammelt in fester Reihenfolge
+    if not state.get("defer_memory"):
+        save_to_memory(state.get("memory_dict", {}), text, agent_answer)
 
     return state
 
-def postprocess_node(state: dict) -> dict:
-    # Holt die rohe Agenten-Antwort und startet das Post-Processing
-    raw_output = state.get("agent_output", "")
-    logging.debug("Postprocess Node, roher Agenten-Output: %s", raw_output)
+async def arouting_node(state: dict) -> dict:
+    text = prepare_routing(state)
+    summary_history = state["global_summary"]
+    buffer_history = state["global_buffer"]
+    email = state.get("email", "")
 
-    # Wenn Datenbank-Antwort (JSON) vorliegt, Tabelle aufbauen und Text formatieren
-    if state.get("decision") == "database":
-        try:
-            parsed_output = json.loads(raw_output)
-            # JSON mit 'result' und optional 'data'
-            if isinstance(parsed_output, dict) and "result" in parsed_output:
-                result_text = parsed_output["result"]
-                data = parsed_output.get("data", [])
-                # Text durch LLM formatieren lassen
-                messages = [
-                    SystemMessage(content=system_content),
-                    HumanMessage(content=f"Originalantwort des Agenten (Textteil): {result_text}")
-                ]
-                processed_text = process_agent.invoke(messages).content.strip()
-                # Tabellenfragmente entfernen, um Duplikate zu vermeiden
-                processed_text = re.sub(r'<table.*?>.*?</table>', '', processed_text, flags=re.DOTALL).strip()
-
-                # Wenn 'data' eine Liste von Dicts ist, erzeugen wir eine HTML-Tabelle
-                if isinstance(data, list) and data and all(isinstance(item, dict) for item in data):
-                    from tabulate import tabulate
-
-                    def format_value(val):
-                        if isinstance(val, float):
-                            return f"{val:.2f}"
-                        return val
-
-                    formatted_rows = []
-                    for row in data:
-                        formatted_row = {k: format_value(v) for k, v in row.items()}
-                        formatted_rows.append(formatted_row)
-
-                    html_table = tabulate(formatted_rows, headers="keys", tablefmt="html")
-                    # Ergebnis: Verarbeiteter Text plus die Tabelle (die Tabelle wird nur einmal angehängt)
-                    state["processed_output"] = f"{processed_text}\n{html_table}"
-                else:
-                    state["processed_output"] = processed_text
-
-            # Fallback: JSON-Liste von Dicts direkt als Tabelle
-            elif isinstance(parsed_output, list) and parsed_output and all(isinstance(item, dict) for item in parsed_output):
-                from tabulate import tabulate
-
-                def format_value(val):
-                    if isinstance(val, float):
-                        return f"{val:.2f}"
-                    return val
-
-                formatted_rows = []
-                for row in parsed_output:
-                    formatted_row = {k: format_value(v) for k, v in row.items()}
-                    formatted_rows.append(formatted_row)
-                html_table = tabulate(formatted_rows, headers="keys", tablefmt="html")
-                state["processed_output"] = html_table
-            else:
-                # Alles andere unverändert lassen
-                state["processed_output"] = raw_output
-
-        except Exception as json_err:
-            logging.debug("JSON Parsing fehlschlug: %s. Verwende Standard Postprocessing.", json_err)
-            try:
-                # Wenn JSON-Pfad scheitert, ganze Antwort noch einmal formatieren
-                messages = [
-                    SystemMessage(content=system_content),
-                    HumanMessage(content=f"Originalantwort des Agenten: {raw_output}")
-                ]
-                response = process_agent.invoke(messages)
-                processed = response.content.strip()
-                state["processed_output"] = processed
-            except Exception as e:
-                logging.error("Fehler beim Post-Processing: %s", e)
-                state["processed_output"] = f"Die folgende Antwort konnte nicht weiter überarbeitet werden: {raw_output}"
+    decision = state.get("decision", "general")
+    if decision == "database":
+        from orchestration.agent_database import ahandle_database_query
+        agent_answer = await ahandle_database_query(text, email, summary_history, buffer_history)
+    elif decision == "vector":
+        from orchestration.agent_vector import ahandle_vector_query
+        agent_answer = await ahandle_vector_query(text, summary_history, buffer_history)
     else:
-        raw_output = state.get("agent_output", "")
-        logging.debug("Postprocess Node, roher Agenten-Output: %s", raw_output)
-    messages = [
+        from orchestration.agent_general import ahandle_general_query
+        agent_answer = await ahandle_general_query(text, summary_history, buffer_history)
+
+    state["agent_output"] = agent_answer
+    state["memory_input"] = text
+
+    # Im Inline-Modus fasst ConversationSummaryBufferMemory synchron per LLM zusammen → im Thread ausführen
+    if not state.get("defer_memory"):
+        await asave_to_memory(state.get("memory_dict", {}), text, agent_answer)
+
+    return state
+
+def postprocess_messages(raw_output: str, text_part: bool = False) -> list:
+    # Prompt für die abschließende Überarbeitung einer Agenten-Antwort durch den Process Agent
+    label = "Originalantwort des Agenten (Textteil)" if text_part else "Originalantwort des Agenten"
+    return [
         SystemMessage(content=system_content),
-        HumanMessage(content=f"Originalantwort des Agenten: {raw_output}")
+        HumanMessage(content=f"{label}: {raw_output}")
     ]
+
+def fallback_output(raw_output: str) -> str:
+    return f"Die folgende Antwort konnte nicht weiter überarbeitet werden: {raw_output}"
+
+def is_table(data) -> bool:
+    return isinstance(data, list) and bool(data) and all(isinstance(item, dict) for item in data)
+
+def render_table(rows: list) -> str:
+    # Deterministische HTML-Tabelle, Nachkommastellen auf 2 Stellen gekürzt
+    from tabulate import tabulate
+
+    def format_value(val):
+        if isinstance(val, float):
+            return f"{val:.2f}"
+        return val
+
+    formatted_rows = [{k: format_value(v) for k, v in row.items()} for row in rows]
+    return tabulate(formatted_rows, headers="keys", tablefmt="html")
+
+def split_agent_output(decision: str, raw_output: str) -> tuple:
+    """
+    Trennt eine Agenten-Antwort in den Text, den der Process Agent formatieren soll,
+    und eine lokal erzeugte HTML-Tabelle.
+
+    Returns:
+        tuple: (text, table). Ist text leer, ist kein LLM-Aufruf nötig.
+    """
+    if decision != "database":
+        return raw_output, ""
     try:
-        response = process_agent.invoke(messages)
-        processed = response.content.strip()
-        state["processed_output"] = processed
-        logging.debug("Process Agent Antwort: %s", processed)
-    except Exception as e:
-        logging.error("Fehler beim Post-Processing: %s", e)
-        state["processed_output"] = f"Die folgende Antwort konnte nicht weiter überarbeitet werden: {raw_output}"
+        parsed_output = json.loads(raw_output)
+    except (TypeError, ValueError) as json_err:
+        logging.debug("JSON Parsing fehlschlug: %s. Verwende Standard Postprocessing.", json_err)
+        return raw_output, ""
+    # JSON mit 'result' und optional 'data': Text formatieren, Tabelle lokal bauen
+    if isinstance(parsed_output, dict) and "result" in parsed_output:
+        data = parsed_output.get("data", [])
+        return str(parsed_output["result"]), render_table(data) if is_table(data) else ""
+    # Reine JSON-Liste von Dicts: nur Tabelle, kein LLM-Aufruf
+    if is_table(parsed_output):
+        return "", render_table(parsed_output)
+    return raw_output, ""
+
+def format_locally(text: str, question: str) -> bool:
+    # Lokaler Formatter, solange die Antwort nicht für eine Überarbeitung durch das LLM markiert ist
+    return html_formatter.is_local_mode() and not html_formatter.needs_rewrite(text, question)
+
+def merge_output(processed_text: str, table: str) -> str:
+    if not table:
+        return processed_text
+    # Tabellenfragmente aus dem Text entfernen, damit die Tabelle nur einmal erscheint
+    processed_text = re.sub(r'<table.*?>.*?</table>', '', processed_text, flags=re.DOTALL).strip()
+    return f"{processed_text}\n{table}" if processed_text else table
+
+def postprocess_node(state: dict) -> dict:
+    # Holt die rohe Agenten-Antwort; pro Antwort höchstens ein Formatierungsaufruf
+    raw_output = state.get("agent_output", "")
+    logging.debug("Postprocess Node, roher Agenten-Output: %s", raw_output)
+
+    text, table = split_agent_output(state.get("decision"), raw_output)
+    if format_locally(text, state.get("user_message", "")):
+        state["processed_output"] = html_formatter.format_answer(text, state.get("user_message", ""), table)
+        return state
+    processed = ""
+    if text:
+        try:
+            response = process_agent.invoke(postprocess_messages(text, text_part=text != raw_output))
+            processed = response.content.strip()
+            logging.debug("Process Agent Antwort: %s", processed)
+        except Exception as e:
+            logging.error("Fehler beim Post-Processing: %s", e)
+            processed = fallback_output(text)
+    state["processed_output"] = merge_output(processed, table)
     logging.debug("State nach postprocess_node: %s", state)
     return state
 
+async def apostprocess_node(state: dict) -> dict:
+    raw_output = state.get("agent_output", "")
+    text, table = split_agent_output(state.get("decision"), raw_output)
+    if format_locally(text, state.get("user_message", "")):
+        state["processed_output"] = html_formatter.format_answer(text, state.get("user_message", ""), table)
+        return state
+    processed = ""
+    if text:
+        try:
+            response = await process_agent.ainvoke(postprocess_messages(text, text_part=text != raw_output))
+            processed = response.content.strip()
+        except Exception as e:
+            logging.error("Fehler beim Post-Processing: %s", e)
+            processed = fallback_output(text)
+    state["processed_output"] = merge_output(processed, table)
+    return state
+
+# Mindest-Confidence, ab der die Zuordnung aus extract_questions ohne eigenen Decision-Call übernommen wird
+EXTRACTION_CONFIDENCE_THRESHOLD = 0.5
+
+def entry_router(state: dict) -> str:
+    # Bereits bei der Extraktion klassifizierte Fragen überspringen den Decision Agent
+    if state.get("decision"):
+        return "routing_node"
+    return "decision_node"
+
 # Aufbau und Kompilierung des StateGraph-Orchestrators
 graph_orchestrator = (
     StateGraph(dict)
     .add_sequence([decision_node, routing_node, postprocess_node])
 )
-graph_orchestrator.add_edge(START, "decision_node")
+graph_orchestrator.add_conditional_edges(START, entry_router, ["decision_node", "routing_node"])
 graph_orchestrator = graph_orchestrator.compile()
 
+# Variante ohne Post-Processing: Beim Streaming wird der letzte LLM-Aufruf separat gestreamt
+graph_agent = (
+    StateGraph(dict)
+    .add_sequence([decision_node, routing_node])
+)
+graph_agent.add_conditional_edges(START, entry_router, ["decision_node", "routing_node"])
+graph_agent = graph_agent.compile()
+
+# Asynchroner Orchestrator für den ASGI-Modus (gleiche Knotennamen wie der synchrone Graph)
+agraph_orchestrator = (
+    StateGraph(dict)
+    .add_node("decision_node", adecision_node)
+    .add_node("routing_node", arouting_node)
+    .add_node("postprocess_node", apostprocess_node)
+    .add_edge("decision_node", "routing_node")
+    .add_edge("routing_node", "postprocess_node")
+)
+agraph_orchestrator.add_conditional_edges(START, entry_router, ["decision_node", "routing_node"])
+agraph_orchestrator = agraph_orchestrator.compile()
+
+agraph_agent = (
+    StateGraph(dict)
+    .add_node("decision_node", adecision_node)
+    .add_node("routing_node", arouting_node)
+    .add_edge("decision_node", "routing_node")
+)
+agraph_agent.add_conditional_edges(START, entry_router, ["decision_node", "routing_node"])
+agraph_agent = agraph_agent.compile()
+
 # --------------------------------------------------------------------
-# Hilfsfunktion: Extrahiere aus einem Text alle Fragen und kategorisiere sie
+# Hilfsfunktion: Extrahiere aus einem Text alle Fragen und ordne sie direkt einem Agenten zu
 # --------------------------------------------------------------------
-def extract_questions(text: str) -> list:
-    extraction_prompt = f"""Extrahiere aus dem folgenden Text alle Fragen.
+AGENTS = ("database", "vector", "general")
+
+def _unclassified(question: str) -> dict:
+    # Frage ohne Zuordnung: der Decision Agent entscheidet im Graphen
+    return {"question": question, "decision": "", "rationale": "", "confidence": 0.0}
+
+def _classified(question: str, agent: str, rationale: str = "", confidence=1.0) -> dict:
+    agent = str(agent).lower()
+    try:
+        confidence = float(confidence)
+    except (TypeError, ValueError):
+        confidence = 0.0
+    if agent not in AGENTS or confidence < EXTRACTION_CONFIDENCE_THRESHOLD:
+        return _unclassified(question)
+    return {"question": question, "decision": agent, "rationale": rationale, "confidence": confidence}
+
+def extraction_messages(text: str) -> list:
+    extraction_prompt = f"""Extrahiere aus dem folgenden Text alle Fragen und ordne jede Frage direkt einem Agenten zu.
         Achte darauf, dass 2 Fragen per verbunden sein können und trenne diese ebenfalls!
         Wenn die Frage sich auf Produkte, Bestellungen, Preise oder ähnliche Themen bezieht, wähle 'database'.
         Wähle 'vector' bei Abfragen, wo Anleitungen gebraucht werden.
         Nur wenn die vorherigen Bedingungen keinen Sinn ergeben nutze 'general'.
         Erstelle aus den Fragen zu 'database' und 'vector' jeweils eine gesamte Frage, die alle entsprechenden Fragen enthält.
-        Gib die Fragen als JSON-Liste aus. Achte darauf, dass alle Fragen vollständig sind.
+        Achte darauf, dass alle Fragen vollständig sind.
 
-        Nutze immer dieses Format:
+        Nutze immer dieses JSON-Format:
         {{
-            "database": [],
-            "vector": [],
-            "general": []
+            "questions": [
+                {{
+                    "question": "Die vollständige Frage",
+                    "agent": "database|vector|general",
+                    "rationale": "Begründung in 1-2 Sätzen, warum du dich so entschieden hast.",
+                    "confidence": "eine Zahl zwischen 0 und 1, die angibt, wie sicher du in deiner Entscheidung bist"
+                }}
+            ]
         }}
 
         Behalte jeweils Kontextinformationen bei, beispielsweise Produktnamen oder Kundeninformationen.
         Text:
         {text}"""
-    messages = [
-        SystemMessage(content="Du bist ein Assistent, der Fragen extrahiert."),
+    return [
+        SystemMessage(content="Du bist ein Assistent, der Fragen extrahiert und dem passenden Agenten zuordnet."),
         HumanMessage(content=extraction_prompt)
     ]
-    response = decision_agent.invoke(messages)
-    result_str = response.content.strip()
+
+def parse_extraction(text: str, result_str: str) -> list:
     logging.debug("Response from extraction prompt: %s", result_str)
 
     # Suche nach dem JSON-Anfang und bereinige Code-Fences
@@ -337,7 +481,7 @@ def extract_questions(text: str) -> list:
         result_str = result_str[json_start:]
     else:
         logging.error("Kein JSON-Teil in der Antwort gefunden.")
-        return [text]
+        return [_unclassified(text)]
 
     if result_str.startswith("```"):
         result_str = result_str.replace("```json", "").replace("```", "").strip()
@@ -345,48 +489,196 @@ def extract_questions(text: str) -> list:
 
     if not result_str:
         logging.error("Die Antwort des LLM ist leer. Fallback wird aktiviert.")
-        return [text]
+        return [_unclassified(text)]
 
     try:
         parsed = json.loads(result_str)
+        questions = []
         # Verschiedene JSON-Layouts unterstützen
-        if isinstance(parsed, dict):
-            if "questions" in parsed:
-                questions = parsed["questions"]
-            elif all(key in parsed for key in ["database", "vector", "general"]):
-                questions = parsed["database"] + parsed["vector"] + parsed["general"]
-            else:
-                questions = []
-        else:
-            questions = parsed
-
-        if isinstance(questions, list) and questions:
+        if isinstance(parsed, dict) and isinstance(parsed.get("questions"), list):
+            for item in parsed["questions"]:
+                if isinstance(item, dict) and item.get("question"):
+                    questions.append(_classified(item["question"], item.get("agent", ""),
+                                                 item.get("rationale", ""), item.get("confidence", 0.0)))
+                elif isinstance(item, str) and item:
+                    questions.append(_unclassified(item))
+        elif isinstance(parsed, dict) and any(key in parsed for key in AGENTS):
+            for agent in AGENTS:
+                questions.extend(_classified(q, agent) for q in parsed.get(agent, []) if q)
+        elif isinstance(parsed, list):
+            questions = [_unclassified(q) for q in parsed if isinstance(q, str) and q]
+
+        if questions:
             logging.info("Extracted questions: %s", questions)
             return questions
         else:
             logging.info("Keine Fragen extrahiert. Ursprünglicher Text wird als Liste zurückgegeben.")
-            return [text]
+            return [_unclassified(text)]
     except Exception as e:
         logging.error("Fehler beim Extrahieren der Fragen: %s", e)
         logging.debug("Ungültige JSON-Antwort: %s", result_str)
-        return [text]
+        return [_unclassified(text)]
+
+def extract_questions(text: str) -> list:
+    """
+    Zerlegt den Text in Teilfragen und klassifiziert jede in einem einzigen LLM-Aufruf.
+
+    Returns:
+        list: Dicts mit "question", "decision" (leer, falls der Decision Agent
+        noch entscheiden muss), "rationale" und "confidence".
+    """
+    response = decision_agent.invoke(extraction_messages(text))
+    return parse_extraction(text, response.content.strip())
+
+async def aextract_questions(text: str) -> list:
+    response = await decision_agent.ainvoke(extraction_messages(text))
+    return parse_extraction(text, response.content.strip())
 
 # --------------------------------------------------------------------
 # Hilfsfunktion: Kombiniert mehrere Teilsantworten zu einer finalen Antwort
 # --------------------------------------------------------------------
-def combine_answers(answers: list) -> str:
+def combine_messages(answers: list) -> list:
     combined_text = "\n".join([f"{i+1}. {ans}" for i, ans in enumerate(answers)])
     prompt = (
         "Kombiniere bitte die folgenden Antworten zu einer einzigen, kohärenten Antwort. "
         "Stelle sicher, dass die finale Antwort fließend, verständlich und konsistent ist:\n" + combined_text
     )
-    messages = [
+    return [
         SystemMessage(content=system_content),
         HumanMessage(content=prompt)
     ]
-    response = process_agent.invoke(messages)
+
+def combine_answers(answers: list, question: str = "") -> str:
+    if html_formatter.is_local_mode():
+        return html_formatter.combine(answers, question)
+    response = process_agent.invoke(combine_messages(answers))
     return response.content.strip()
 
+# --------------------------------------------------------------------
+# Hilfsfunktion: Führt eine einzelne (Teil-)Frage durch den Orchestrator-Graphen
+# --------------------------------------------------------------------
+def build_state(item: dict, email: str, memory, defer_memory: bool = False) -> dict:
+    # Ist die Frage bereits klassifiziert, entfällt der Decision-Call im Graphen
+    return {
+        "user_message": item["question"],
+        "email": email,
+        "memory_dict": memory,
+        "decision": item["decision"],
+        "rationale": item["rationale"],
+        "confidence": item["confidence"],
+        "defer_memory": defer_memory,
+        "agent_output": "",
+        "processed_output": ""
+    }
+
+def question_result(node_state: dict, state: dict) -> dict:
+    answer = node_state.get("processed_output", "")
+    if not answer:
+        answer = node_state.get("agent_output") or "Entschuldigung, es konnte keine Antwort generiert werden."
+    return {
+        "answer": answer,
+        "decision": node_state.get("decision") or state.get("decision"),
+        "memory_input": node_state.get("memory_input", ""),
+        "agent_output": node_state.get("agent_output", "")
+    }
+
+def cached_result(entry, item: dict) -> dict:
+    # Treffer im semantischen Antwort-Cache: gleiche Struktur wie question_result, ohne Graph-Durchlauf
+    return {
+        "answer": entry.answer,
+        "decision": entry.decision,
+        "memory_input": item["question"],
+        "agent_output": entry.agent_output
+    }
+
+def run_question(item: dict, email: str, memory, defer_memory: bool = False) -> dict:
+    entry, embedding = answer_cache.lookup(item["question"], item["decision"], memory)
+    if entry is not None:
+        result = cached_result(entry, item)
+        if not defer_memory:
+            save_to_memory(memory or {}, result["memory_input"], result["agent_output"])
+        return result
+
+    start = time.perf_counter()
+    state = build_state(item, email, memory, defer_memory)
+    final_state = {}
+    for step in graph_orchestrator.stream(state, stream_mode="updates"):
+        final_state = step
+    result = question_result(final_state.get("postprocess_node", {}), state)
+    answer_cache.store(embedding, item["question"], result["decision"], result["answer"],
+                       result["agent_output"], time.perf_counter() - start)
+    return result
+
+async def arun_question(item: dict, email: str, memory, defer_memory: bool = False) -> dict:
+    entry, embedding = await answer_cache.alookup(item["question"], item["decision"], memory)
+    if entry is not None:
+        result = cached_result(entry, item)
+        if not defer_memory:
+            await asave_to_memory(memory or {}, result["memory_input"], result["agent_output"])
+        return result
+
+    start = time.perf_counter()
+    state = build_state(item, email, memory, defer_memory)
+    final_state = await agraph_orchestrator.ainvoke(state)
+    result = question_result(final_state or {}, state)
+    answer_cache.store(embedding, item["question"], result["decision"], result["answer"],
+                       result["agent_output"], time.perf_counter() - start)
+    return result
+
+def message_text_and_email(user_message):
+    # Extrahiere reinen Text aus user_message-Objekt
+    if hasattr(user_message, "content"):
+        text = user_message.content
+    else:
+        text = str(user_message)
+    email = getattr(user_message, "email", "")
+    return text, email
+
+def split_questions(text: str) -> list:
+    # Zerlege bei Bedarf in mehrere Fragen; kurze Einzelanliegen umgehen den Extraktions-Call
+    from orchestration import split_classifier
+    questions = split_classifier.fast_path(text)
+    if questions is None:
+        questions = extract_questions(text)
+    logging.debug("Fast-Path-Statistik: %s", split_classifier.stats.snapshot())
+    return questions
+
+async def asplit_questions(text: str) -> list:
+    from orchestration import split_classifier
+    questions = split_classifier.fast_path(text)
+    if questions is None:
+        questions = await aextract_questions(text)
+    logging.debug("Fast-Path-Statistik: %s", split_classifier.stats.snapshot())
+    return questions
+
+def run_questions(questions: list, email: str, memory) -> list:
+    # Mehrere Teilfragen laufen parallel (max. DISPATCH_MAX_WORKERS); map erhält die Reihenfolge
+    if len(questions) == 1:
+        return [run_question(questions[0], email, memory)]
+    with ThreadPoolExecutor(max_workers=min(DISPATCH_MAX_WORKERS, len(questions))) as executor:
+        results = list(executor.map(lambda item: run_question(item, email, memory, defer_memory=True), questions))
+    # Memory-Updates erst nach Abschluss aller Teilfragen, serialisiert und in Fragereihenfolge
+    for result in results:
+        if result["memory_input"]:
+            save_to_memory(memory, result["memory_input"], result["agent_output"])
+    return results
+
+async def arun_questions(questions: list, email: str, memory) -> list:
+    if len(questions) == 1:
+        return [await arun_question(questions[0], email, memory)]
+    # Gleiche Obergrenze wie im Thread-Modus, aber ohne Threads: gather erhält die Reihenfolge
+    limit = asyncio.Semaphore(DISPATCH_MAX_WORKERS)
+
+    async def run_limited(item):
+        async with limit:
+            return await arun_question(item, email, memory, defer_memory=True)
+
+    results = await asyncio.gather(*(run_limited(item) for item in questions))
+    for result in results:
+        if result["memory_input"]:
+            await asave_to_memory(memory, result["memory_input"], result["agent_output"])
+    return list(results)
+
 # --------------------------------------------------------------------
 # Haupt-Funktion: Übergibt die Nutzeranfrage durch den Workflow und liefert die Antwort
 # --------------------------------------------------------------------
@@ -407,46 +699,185 @@ def dispatch(user_message, history="", memory=None) -> dict:
         current_global_summary = ""
         current_global_buffer = history
 
-    # Extrahiere reinen Text aus user_message-Objekt
-    if hasattr(user_message, "content"):
-        text = user_message.content
-    else:
-        text = str(user_message)
-    email = getattr(user_message, "email", "")
-
-    # Zerlege bei Bedarf in mehrere Fragen
-    questions = extract_questions(text)
+    text, email = message_text_and_email(user_message)
+    questions = split_questions(text)
+    results = run_questions(questions, email, memory)
 
-    all_answers = []
-    # Für jede Frage den Orchestrator durchlaufen
-    for question in questions:
-        current_global_summary = ""
-        if memory and "global_buffer" in memory and "global_summary" in memory:
-            current_global_buffer = memory["global_buffer"].load_memory_variables({}).get("history", "")
-            current_global_summary = memory["global_summary"].load_memory_variables({}).get("history", "")
-        state = {
-            "user_message": question,
-            "email": email,
-            "memory_dict": memory,
-            "decision": "",
-            "agent_output": "",
-            "processed_output": ""
-        }
-        final_state = {}
-        for step in graph_orchestrator.stream(state, stream_mode="updates"):
-            final_state = step
-        answer = final_state.get("processed_output", "")
-        if not answer and "postprocess_node" in final_state:
-            answer = final_state["postprocess_node"].get("processed_output", "")
-        if not answer:
-            answer = final_state.get("agent_output", "Entschuldigung, es konnte keine Antwort generiert werden.")
-        all_answers.append(answer)
+    all_answers = [result["answer"] for result in results]
+    decisions = [result["decision"] for result in results]
 
     # Einzeln oder kombiniert zurückgeben
     if len(all_answers) == 1:
         final_answer = all_answers[0]
-        decision = state.get("decision")
+        decision = decisions[0]
     else:
-        final_answer = combine_answers(all_answers)
+        final_answer = combine_answers(all_answers, text)
         decision = "multiple"
     return {"answer": final_answer, "decision": decision}
+
+async def adispatch(user_message, memory=None) -> dict:
+    """Asynchrone Variante von dispatch für den ASGI-Modus."""
+    text, email = message_text_and_email(user_message)
+    questions = await asplit_questions(text)
+    results = await arun_questions(questions, email, memory)
+
+    all_answers = [result["answer"] for result in results]
+    if len(all_answers) == 1:
+        return {"answer": all_answers[0], "decision": results[0]["decision"]}
+    if html_formatter.is_local_mode():
+        return {"answer": html_formatter.combine(all_answers, text), "decision": "multiple"}
+    response = await process_agent.ainvoke(combine_messages(all_answers))
+    return {"answer": response.content.strip(), "decision": "multiple"}
+
+# --------------------------------------------------------------------
+# Streaming-Variante von dispatch für Server-Sent Events
+# --------------------------------------------------------------------
+def stream_llm(messages: list, fallback: str):
+    # Streamt die Tokens des Process Agents als Events und liefert den Gesamttext zurück
+    parts = []
+    try:
+        for chunk in process_agent.stream(messages):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield {"type": "token", "content": chunk.content}
+    except Exception as e:
+        logging.error("Fehler beim Post-Processing: %s", e)
+        if not parts:
+            parts.append(fallback)
+            yield {"type": "token", "content": fallback}
+    return "".join(parts).strip()
+
+def dispatch_stream(user_message, memory=None):
+    """
+    Wie dispatch, liefert aber Events, sobald sie entstehen.
+
+    Yields:
+        dict: {"type": "routing", "decisions": [...]} sobald die Agenten feststehen,
+        {"type": "token", "content": ...} für jedes Token der finalen Antwort und
+        abschließend {"type": "done", "answer": ..., "decision": ...}.
+    """
+    text, email = message_text_and_email(user_message)
+    questions = split_questions(text)
+
+    entry, embedding = None, None
+    if len(questions) == 1:
+        entry, embedding = answer_cache.lookup(questions[0]["question"], questions[0]["decision"], memory)
+
+    if entry is not None:
+        # Treffer im Antwort-Cache: Antwort als ein Block
+        result = cached_result(entry, questions[0])
+        save_to_memory(memory or {}, result["memory_input"], result["agent_output"])
+        yield {"type": "routing", "decisions": [result["decision"]]}
+        yield {"type": "token", "content": result["answer"]}
+        answer, decision = result["answer"], result["decision"]
+    elif len(questions) == 1:
+        item = questions[0]
+        start = time.perf_counter()
+        if item["decision"]:
+            yield {"type": "routing", "decisions": [item["decision"]]}
+        agent_state = {}
+        for step in graph_agent.stream(build_state(item, email, memory), stream_mode="updates"):
+            if "decision_node" in step:
+                yield {"type": "routing", "decisions": [step["decision_node"].get("decision")]}
+            agent_state = step.get("routing_node", agent_state)
+        decision = agent_state.get("decision") or "general"
+        raw_output = agent_state.get("agent_output", "")
+        answer_text, table = split_agent_output(decision, raw_output)
+        answer = ""
+        if format_locally(answer_text, item["question"]):
+            # Lokal formatierte Antwort geht als ein Block raus
+            answer = html_formatter.format_answer(answer_text, item["question"], table)
+            yield {"type": "token", "content": answer}
+            table = ""
+        elif answer_text:
+            messages = postprocess_messages(answer_text, text_part=answer_text != raw_output)
+            answer = yield from stream_llm(messages, fallback_output(answer_text))
+        # Lokal gebaute Tabelle als letzter Block
+        if table:
+            suffix = f"\n{table}" if answer else table
+            yield {"type": "token", "content": suffix}
+            answer += suffix
+        answer_cache.store(embedding, item["question"], decision, answer, raw_output, time.perf_counter() - start)
+    else:
+        results = run_questions(questions, email, memory)
+        yield {"type": "routing", "decisions": [result["decision"] for result in results]}
+        all_answers = [result["answer"] for result in results]
+        if html_formatter.is_local_mode():
+            answer = html_formatter.combine(all_answers, text)
+            yield {"type": "token", "content": answer}
+        else:
+            answer = yield from stream_llm(combine_messages(all_answers), "\n".join(all_answers))
+        decision = "multiple"
+
+    yield {"type": "done", "answer": answer, "decision": decision}
+
+async def astream_llm(messages: list, fallback: str, parts: list):
+    # Async-Generatoren können keinen Wert zurückgeben: der Text wird in parts gesammelt
+    try:
+        async for chunk in process_agent.astream(messages):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield {"type": "token", "content": chunk.content}
+    except Exception as e:
+        logging.error("Fehler beim Post-Processing: %s", e)
+        if not parts:
+            parts.append(fallback)
+            yield {"type": "token", "content": fallback}
+
+async def adispatch_stream(user_message, memory=None):
+    """Asynchrone Variante von dispatch_stream für den ASGI-Modus (gleiche Events)."""
+    text, email = message_text_and_email(user_message)
+    questions = await asplit_questions(text)
+    parts = []
+
+    entry, embedding = None, None
+    if len(questions) == 1:
+        entry, embedding = await answer_cache.alookup(questions[0]["question"], questions[0]["decision"], memory)
+
+    if entry is not None:
+        result = cached_result(entry, questions[0])
+        await asave_to_memory(memory or {}, result["memory_input"], result["agent_output"])
+        yield {"type": "routing", "decisions": [result["decision"]]}
+        parts.append(result["answer"])
+        yield {"type": "token", "content": result["answer"]}
+        decision = result["decision"]
+    elif len(questions) == 1:
+        item = questions[0]
+        start = time.perf_counter()
+        if item["decision"]:
+            yield {"type": "routing", "decisions": [item["decision"]]}
+        agent_state = {}
+        async for step in agraph_agent.astream(build_state(item, email, memory), stream_mode="updates"):
+            if "decision_node" in step:
+                yield {"type": "routing", "decisions": [step["decision_node"].get("decision")]}
+            agent_state = step.get("routing_node", agent_state)
+        decision = agent_state.get("decision") or "general"
+        raw_output = agent_state.get("agent_output", "")
+        answer_text, table = split_agent_output(decision, raw_output)
+        if format_locally(answer_text, item["question"]):
+            parts.append(html_formatter.format_answer(answer_text, item["question"], table))
+            yield {"type": "token", "content": parts[-1]}
+            table = ""
+        elif answer_text:
+            messages = postprocess_messages(answer_text, text_part=answer_text != raw_output)
+            async for event in astream_llm(messages, fallback_output(answer_text), parts):
+                yield event
+        if table:
+            suffix = f"\n{table}" if parts else table
+            parts.append(suffix)
+            yield {"type": "token", "content": suffix}
+        answer_cache.store(embedding, item["question"], decision, "".join(parts).strip(), raw_output,
+                           time.perf_counter() - start)
+    else:
+        results = await arun_questions(questions, email, memory)
+        yield {"type": "routing", "decisions": [result["decision"] for result in results]}
+        all_answers = [result["answer"] for result in results]
+        if html_formatter.is_local_mode():
+            parts.append(html_formatter.combine(all_answers, text))
+            yield {"type": "token", "content": parts[-1]}
+        else:
+            async for event in astream_llm(combine_messages(all_answers), "\n".join(all_answers), parts):
+                yield event
+        decision = "multiple"
+
+    yield {"type": "done", "answer": "".join(parts).strip(), "decision": decision}
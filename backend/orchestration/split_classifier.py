@@ -0,0 +1,152 @@
+import re
+import threading
+
+# --------------------------------------------------------------------
+# Lokaler Vor-Klassifikator: Muss eine Nachricht überhaupt in Teilfragen zerlegt werden?
+#
+# Kurze Nachrichten mit nur einer Absicht ("Danke!", eine einzelne Frage) werden ohne
+# den extract_questions-LLM-Aufruf direkt weitergereicht und nach Möglichkeit auch
+# lokal einem Agenten zugeordnet, sodass für sie gar kein Routing-Aufruf anfällt.
+# Die Heuristik ist bewusst vorsichtig: Im Zweifel wird die LLM-Extraktion verwendet
+# bzw. entscheidet der Decision Agent.
+# --------------------------------------------------------------------
+
+# Ab dieser Wortanzahl wird immer die LLM-Extraktion genutzt
+MAX_FAST_PATH_WORDS = 25
+
+# Konjunktionen, die zwei Anliegen verbinden können
+CONJUNCTIONS = {"und", "sowie", "außerdem", "ausserdem", "zusätzlich", "zudem", "dazu", "ebenfalls",
+                "auch", "and", "also", "plus", "oder", "or"}
+
+# Wörter, die typischerweise eine (Teil-)Frage einleiten
+QUESTION_WORDS = {"wie", "was", "wann", "wo", "wohin", "woher", "welche", "welcher", "welches", "welchen",
+                  "warum", "wieso", "weshalb", "wieviel", "wie viel", "wer", "kann", "können", "gibt",
+                  "habe", "hat", "ist", "sind", "how", "what", "when", "where", "which", "why", "who",
+                  "can", "is", "are", "do", "does"}
+
+# Reine Höflichkeits- oder Grußnachrichten gehen direkt an den allgemeinen Agenten
+SMALLTALK_PATTERN = re.compile(
+    r"^\s*(danke|vielen dank|dankeschön|danke schön|merci|thx|thanks|thank you|hallo|hi|hey|moin|"
+    r"guten (morgen|tag|abend)|tschüss|tschüs|ciao|bye|ok|okay|super|perfekt|alles klar|prima|top)"
+    r"[\s!.,:)\-]*(nova)?[\s!.,:)\-]*$",
+    re.IGNORECASE
+)
+
+# Bestellungen, Kundendaten, Preise und Sortiment → Datenbank-Agent
+DATABASE_PATTERN = re.compile(
+    r"\b(bestell\w*|auftr[aä]g\w*|rechnung\w*|(liefer|rechnungs|versand|e-?mail-?|meine )adressen?|hinterlegt|"
+    r"meine daten|"
+    r"kundendaten|kundennummer|preis\w*|kostet|kosten|teuer\w*|günstig\w*|billig\w*|produktnummer|"
+    r"sortiment|welche produkte|orders?|order history|invoices?|prices?|costs?|expensive|cheap\w*)\b",
+    re.IGNORECASE
+)
+
+# Einrichtung, Bedienung und Fehlerbehebung → Handbücher (Vector-Agent)
+VECTOR_PATTERN = re.compile(
+    r"\b(anleitung\w*|handbuch\w*|bedienungsanleitung\w*|einricht\w*|richte\w*|verbind\w*|koppel\w*|"
+    r"montier\w*|montage|anschlie(ß|ss)\w*|schlie(ß|ss)e|zurücksetz\w*|setze|reset\w*|install\w*|firmware|"
+    r"aktualisier\w*|fehler\w*|blinkt|leuchtet|funktioniert nicht|kein ton|einstell\w*|fernbedienung|"
+    r"bluetooth|wlan|wi-?fi|setup|connect\w*|pair(ing|ed)?|mount(ing|ed)?|manual|troubleshoot\w*|how do i|how to)\b",
+    re.IGNORECASE
+)
+
+
+def _words(text: str) -> list:
+    return re.findall(r"[\wäöüß]+", text.lower())
+
+
+def is_smalltalk(text: str) -> bool:
+    return bool(SMALLTALK_PATTERN.match(text))
+
+
+def needs_split(text: str) -> bool:
+    """Gibt True zurück, wenn die Nachricht mehrere Anliegen enthalten könnte."""
+    words = _words(text)
+    if len(words) > MAX_FAST_PATH_WORDS:
+        return True
+    if text.count("?") > 1:
+        return True
+    # Mehrere Sätze mit Inhalt deuten auf mehrere Anliegen hin
+    sentences = [s for s in re.split(r"[.!?;\n]+", text) if len(_words(s)) > 2]
+    if len(sentences) > 1:
+        return True
+    # Konjunktion plus mehr als ein Fragewort: z.B. "Was kostet X und wie verbinde ich X"
+    question_words = sum(1 for word in words if word in QUESTION_WORDS)
+    has_conjunction = any(word in CONJUNCTIONS for word in words)
+    return has_conjunction and question_words > 1
+
+
+def needs_extraction(text: str) -> bool:
+    """
+    needs_split plus Nachrichten, die lokal nicht sicher einer einzigen Absicht zuzuordnen sind:
+    Signale für Datenbank und Handbuch zugleich ("Preis von X und wie verbinde ich X") oder
+    eine Konjunktion ohne eindeutige Zuordnung.
+    """
+    if needs_split(text):
+        return True
+    database = DATABASE_PATTERN.search(text) is not None
+    vector = VECTOR_PATTERN.search(text) is not None
+    if database and vector:
+        return True
+    has_conjunction = any(word in CONJUNCTIONS for word in _words(text))
+    return has_conjunction and not (database or vector)
+
+
+def local_decision(text: str) -> str:
+    """'database' oder 'vector' bei eindeutigem Signal, sonst '' (dann entscheidet der Decision Agent)."""
+    database = DATABASE_PATTERN.search(text) is not None
+    vector = VECTOR_PATTERN.search(text) is not None
+    if database == vector:
+        return ""
+    return "database" if database else "vector"
+
+
+class FastPathStats:
+    """Zählt, wie oft der Fast Path genommen wurde."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fast_path = 0
+        self.smalltalk = 0
+        self.local_routes = 0
+        self.extraction = 0
+
+    def record(self, fast: bool, smalltalk: bool = False, routed: bool = False) -> None:
+        with self._lock:
+            if fast:
+                self.fast_path += 1
+                self.smalltalk += smalltalk
+                self.local_routes += routed
+            else:
+                self.extraction += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = self.fast_path + self.extraction
+            return {
+                "fast_path": self.fast_path,
+                "smalltalk": self.smalltalk,
+                "local_routes": self.local_routes,
+                "extraction": self.extraction,
+                "fast_path_rate": self.fast_path / total if total else 0.0,
+            }
+
+
+stats = FastPathStats()
+
+
+def fast_path(text: str):
+    """
+    Liefert die Frageliste im Format von extract_questions, wenn keine Zerlegung nötig ist,
+    sonst None (dann entscheidet die LLM-Extraktion).
+    """
+    if is_smalltalk(text):
+        stats.record(True, smalltalk=True)
+        return [{"question": text, "decision": "general", "rationale": "", "confidence": 1.0}]
+    if needs_extraction(text):
+        stats.record(False)
+        return None
+    decision = local_decision(text)
+    stats.record(True, routed=bool(decision))
+    # Ohne eindeutige Zuordnung klassifiziert der Decision Agent die einzelne Frage im Graphen
+    return [{"question": text, "decision": decision, "rationale": "", "confidence": 0.8 if decision else 0.0}]
@@ -0,0 +1,78 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# --------------------------------------------------------------------
+# Kurzlebiger Ergebnis-Cache für SQL-Abfragen des Datenbank-Agenten
+#
+# Schlüssel ist die normalisierte SQL-Abfrage (Whitespace/Groß-Kleinschreibung
+# außerhalb von String-Literalen vereinheitlicht) plus E-Mail des Kunden und
+# gebundene Parameter. Die TTL ist bewusst kurz: Bestellungen und Preise können
+# sich ändern, wiederholte Fragen innerhalb einer Sitzung sparen aber den Round Trip.
+# Fehlermeldungen des Datenbank-Tools werden nicht gespeichert.
+# --------------------------------------------------------------------
+
+SQL_RESULT_CACHE_SIZE = int(os.getenv("SQL_RESULT_CACHE_SIZE", 256))
+SQL_RESULT_CACHE_TTL = float(os.getenv("SQL_RESULT_CACHE_TTL", 60))
+
+STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+def normalize_sql(query: str) -> str:
+    # String-Literale (z.B. E-Mail-Adressen, Produktnamen) bleiben unverändert
+    parts = STRING_LITERAL.split(query.strip().rstrip(";").strip())
+    return "".join(
+        part if index % 2 else re.sub(r"\s+", " ", part).lower()
+        for index, part in enumerate(parts)
+    ).strip()
+
+
+class SQLResultCache:
+
+    def __init__(self, max_entries=SQL_RESULT_CACHE_SIZE, ttl_seconds=SQL_RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (created_at, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, email: str, parameters=None) -> tuple:
+        return normalize_sql(query), (email or "").strip().lower(), tuple(sorted((parameters or {}).items()))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result: str) -> None:
+        if result.startswith("Error:"):
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+result_cache = SQLResultCache()
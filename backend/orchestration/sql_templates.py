@@ -0,0 +1,98 @@
+import re
+import threading
+
+# --------------------------------------------------------------------
+# Parametrisierte SQL-Vorlagen für häufige Anliegen an den Datenbank-Agenten
+#
+# Passt eine Frage eindeutig auf eine Vorlage (eigene Bestellungen, Preis eines
+# Produkts), wird die vorbereitete Abfrage mit gebundenen Parametern ausgeführt,
+# ohne SQL-Generierung und -Validierung per LLM. Die Muster sind bewusst eng:
+# Im Zweifel übernimmt der bisherige LLM-Weg. Die E-Mail des Kunden wird als
+# Parameter gebunden, nie in den SQL-Text eingesetzt.
+# --------------------------------------------------------------------
+
+# Längere Fragen enthalten meist zusätzliche Bedingungen → LLM
+MAX_TEMPLATE_WORDS = 10
+
+ORDER_HISTORY_SQL = """
+SELECT TOP 20 h.SalesOrderNumber, h.OrderDate, h.Status, h.TotalDue
+FROM SalesLT.SalesOrderHeader AS h
+JOIN SalesLT.Customer AS c ON c.CustomerID = h.CustomerID
+WHERE c.EmailAddress = :email
+ORDER BY h.OrderDate DESC
+""".strip()
+
+PRODUCT_PRICE_SQL = """
+SELECT TOP 10 Name, ProductNumber, ListPrice
+FROM SalesLT.Product
+WHERE Name LIKE :pattern
+ORDER BY Name
+""".strip()
+
+ORDER_HISTORY_PATTERN = re.compile(
+    r"^\s*(zeig(e)?( mir)?|liste( mir)?|was sind|welche sind|show( me)?|list|what are)?\s*"
+    r"(alle\s+|all\s+)?(meine|my)\s+(bisherigen\s+|letzten\s+|past\s+|recent\s+|previous\s+)?"
+    r"(bestellungen|bestellhistorie|aufträge|orders|order history)\s*[?.!]*\s*$",
+    re.IGNORECASE
+)
+
+PRODUCT_PRICE_PATTERN = re.compile(
+    r"^\s*(was kostet|wie viel kostet|wieviel kostet|wie teuer ist|preis (von|für|des|der)|"
+    r"was ist der preis (von|für|des|der)|how much is|how much does|what is the price of|price of)\s+"
+    r"(der |die |das |den |dem |the |a |an )?(?P<product>[\w\-./, ]+?)(\s+cost)?\s*[?.!]*\s*$",
+    re.IGNORECASE
+)
+
+# Vergleiche und Aggregationen lassen sich nicht per LIKE auf den Namen beantworten
+NOT_A_PRODUCT_NAME = re.compile(
+    r"\b(teuerste\w*|günstigste\w*|billigste\w*|meiste\w*|alle|produkte?|artikel|bestellung\w*|"
+    r"most|cheapest|expensive|all|products?|order\w*|mein\w*|my)\b",
+    re.IGNORECASE
+)
+
+
+class QueryTemplate:
+
+    def __init__(self, name, pattern, sql, build_params):
+        self.name = name
+        self.pattern = pattern
+        self.sql = sql
+        self.build_params = build_params  # (match, email) -> dict oder None
+
+
+def _order_history_params(match, email):
+    if not email or email.lower() == "anonymous":
+        return None
+    return {"email": email}
+
+
+def _product_price_params(match, email):
+    product = match.group("product").strip(" ,.")
+    if len(product) < 3 or NOT_A_PRODUCT_NAME.search(product):
+        return None
+    return {"pattern": f"%{product}%"}
+
+
+TEMPLATES = [
+    QueryTemplate("order_history", ORDER_HISTORY_PATTERN, ORDER_HISTORY_SQL, _order_history_params),
+    QueryTemplate("product_price", PRODUCT_PRICE_PATTERN, PRODUCT_PRICE_SQL, _product_price_params),
+]
+
+_stats_lock = threading.Lock()
+stats = {template.name: 0 for template in TEMPLATES}
+
+
+def match_template(question: str, email: str = ""):
+    """Liefert (Vorlage, Parameter) für eine eindeutig passende Frage, sonst None."""
+    if len(question.split()) > MAX_TEMPLATE_WORDS:
+        return None
+    for template in TEMPLATES:
+        match = template.pattern.match(question)
+        if not match:
+            continue
+        params = template.build_params(match, email.strip())
+        if params is not None:
+            with _stats_lock:
+                stats[template.name] += 1
+            return template, params
+    return None
@@ -0,0 +1,591 @@
+import re
+import threading
+
+# --------------------------------------------------------------------
+# Lokale statische Prüfung generierter SQL-Abfragen des Datenbank-Agenten
+#
+# Ersetzt den LLM-Validator für alle eindeutigen Fälle: Die T-SQL-Abfrage wird
+# in Tokens zerlegt, Tabellen und Aliase werden aufgelöst und jede Spalte gegen
+# das Schema aus database_structure geprüft. Erlaubt sind nur einzelne, lesende
+# SELECT-Abfragen; auf Kundentabellen muss nach der E-Mail des Kunden gefiltert
+# werden. Ergebnis ist ein Urteil:
+#   ok        – Abfrage kann ohne LLM ausgeführt werden
+#   invalid   – eindeutige Fehler, strukturiertes Feedback für query_feedback
+#   ambiguous – lokal nicht sicher prüfbar (abgeleitete Tabellen, E-Mail-Filter
+#               nicht als UND-Bedingung im äußeren WHERE, Kundentabellen nicht
+#               per Equi-Join über die Schlüsselkette am gefilterten Kunden,
+#               Outer/Cross/Komma-Joins oder Unterabfragen auf Kundentabellen,
+#               unbekannte Bezeichner, ...)
+#               → LLM-Validator
+#   fatal     – anonymer Zugriff auf Kundendaten, kein Versuch kann das beheben
+# --------------------------------------------------------------------
+
+CUSTOMER_TABLE = "saleslt.customer"
+# Tabellen mit Kundendaten: nur mit WHERE-Filter auf die E-Mail des Kunden
+CUSTOMER_TABLES = {
+    CUSTOMER_TABLE, "saleslt.customeraddress", "saleslt.address",
+    "saleslt.salesorderheader", "saleslt.salesorderdetail",
+}
+# Schlüsselkette der Kundentabellen: nur über diese Equi-Joins gehören Zeilen sicher zum gefilterten Kunden
+CUSTOMER_KEYS = {
+    frozenset(pair) for pair in (
+        (("saleslt.customer", "customerid"), ("saleslt.salesorderheader", "customerid")),
+        (("saleslt.customer", "customerid"), ("saleslt.customeraddress", "customerid")),
+        (("saleslt.salesorderheader", "customerid"), ("saleslt.customeraddress", "customerid")),
+        (("saleslt.customeraddress", "addressid"), ("saleslt.address", "addressid")),
+        (("saleslt.salesorderheader", "salesorderid"), ("saleslt.salesorderdetail", "salesorderid")),
+        (("saleslt.salesorderheader", "shiptoaddressid"), ("saleslt.address", "addressid")),
+        (("saleslt.salesorderheader", "billtoaddressid"), ("saleslt.address", "addressid")),
+    )
+}
+
+FORBIDDEN_KEYWORDS = re.compile(
+    r"\b(insert|update|delete|merge|drop|alter|create|truncate|exec|execute|grant|revoke|deny|into|"
+    r"openrowset|opendatasource|openquery|openxml|bulk|waitfor|dbcc|backup|restore|shutdown)\b|\b(xp|sp)_\w+",
+    re.IGNORECASE
+)
+STRING_LITERAL = re.compile(r"(?:(?<!\w)N)?'(?:[^']|'')*'")
+# Kommentare entfernen, String-Literale dabei unverändert lassen
+COMMENT_OR_LITERAL = re.compile(r"((?:(?<!\w)N)?'(?:[^']|'')*')|--[^\n]*|/\*.*?\*/", re.DOTALL)
+# String-Literale bleiben als ein Token erhalten (für den Vergleich mit der E-Mail des Kunden)
+TOKEN = re.compile(r"(?:(?<!\w)N)?'(?:[^']|'')*'|\[[^\]]+\]|\"[^\"]+\"|@@?\w+|\d+(?:\.\d+)?|\w+|<>|!=|<=|>=|\S")
+NAME = re.compile(r"[A-Za-z_]\w*$")
+CTE_NAME = re.compile(r"(?:\bwith|,)\s*([\[\"]?\w+[\]\"]?)\s*(?:\([^()]*\))?\s+as\s*\(", re.IGNORECASE)
+
+EMAIL_COLUMN = r"((?:[\[\"]?\w+[\]\"]?\.)*)[\[\"]?emailaddress[\]\"]?"
+EMAIL_LITERAL = r"((?:(?<!\w)N)?'(?:[^']|'')*')"
+EMAIL_COMPARISON = re.compile(EMAIL_COLUMN + r"\s*(=|<>|!=|\blike\b|\bin\b)\s*\(?\s*" + EMAIL_LITERAL, re.IGNORECASE)
+EMAIL_COMPARISON_REVERSED = re.compile(EMAIL_LITERAL + r"\s*(=|<>|!=)\s*" + EMAIL_COLUMN, re.IGNORECASE)
+
+# Reservierte Wörter: weder Spalte noch Alias
+KEYWORDS = {
+    "select", "distinct", "top", "percent", "ties", "from", "where", "and", "or", "not", "in", "is", "null",
+    "like", "escape", "between", "exists", "any", "all", "some", "as", "on", "join", "inner", "left", "right",
+    "full", "outer", "cross", "apply", "group", "by", "having", "order", "asc", "desc", "union", "except",
+    "intersect", "with", "case", "when", "then", "else", "end", "offset", "fetch", "next", "first", "rows",
+    "row", "only", "over", "partition", "range", "unbounded", "preceding", "following", "current", "within",
+    "collate", "nolock", "current_timestamp",
+}
+# Ende der WHERE-Klausel im äußeren SELECT
+WHERE_END = {"group", "order", "having", "union", "except", "intersect", "option", "for"}
+# Ende einer ON-Bedingung auf derselben Klammerebene
+ON_END = WHERE_END | {"join", "inner", "left", "right", "full", "cross", "outer", "where"}
+# Datumsteile (DATEADD/DATEDIFF) und Typnamen (CONVERT) sind keine Spalten, aber erlaubte Aliase wie "d"
+NON_COLUMNS = KEYWORDS | {
+    "year", "yy", "yyyy", "quarter", "qq", "q", "month", "mm", "m", "dayofyear", "dy", "y", "day", "dd", "d",
+    "week", "wk", "ww", "weekday", "dw", "hour", "hh", "minute", "mi", "n", "second", "ss", "s",
+    "int", "bigint", "smallint", "tinyint", "bit", "decimal", "numeric", "money", "smallmoney", "float", "real",
+    "date", "datetime", "datetime2", "smalldatetime", "time", "char", "varchar", "nchar", "nvarchar", "max",
+}
+
+
+class Issue:
+    """Ein eindeutiger Fehler der Abfrage mit optionalem Hinweis zur Korrektur."""
+
+    def __init__(self, code: str, message: str, hint: str = ""):
+        self.code = code
+        self.message = message
+        self.hint = hint
+
+    def __str__(self):
+        return f"{self.message} {self.hint}".strip()
+
+    def as_dict(self) -> dict:
+        return {"code": self.code, "message": self.message, "hint": self.hint}
+
+
+class ValidationResult:
+
+    def __init__(self, problems=None, uncertainties=None, fatal=False):
+        self.problems = problems or []
+        self.uncertainties = uncertainties or []
+        self.fatal = fatal
+
+    @property
+    def verdict(self) -> str:
+        if self.fatal:
+            return "fatal"
+        if self.problems:
+            return "invalid"
+        return "ambiguous" if self.uncertainties else "ok"
+
+    @property
+    def ok(self) -> bool:
+        return self.verdict == "ok"
+
+    @property
+    def valid(self) -> bool:
+        """Keine eindeutigen Fehler (kann trotzdem unklar sein)."""
+        return self.verdict in ("ok", "ambiguous")
+
+    @property
+    def ambiguous(self) -> bool:
+        return self.verdict == "ambiguous"
+
+    def feedback(self) -> str:
+        """Text für query_feedback: alle eindeutigen Fehler samt Korrekturhinweis."""
+        return "Lokale SQL-Prüfung: " + " ".join(str(problem) for problem in self.problems)
+
+    def hints(self) -> str:
+        """Gründe, warum die lokale Prüfung kein eindeutiges Urteil fällen konnte."""
+        return " ".join(self.uncertainties)
+
+    def as_dict(self) -> dict:
+        return {
+            "verdict": self.verdict,
+            "problems": [problem.as_dict() for problem in self.problems],
+            "uncertainties": list(self.uncertainties),
+        }
+
+
+def parse_schema(structure: str) -> dict:
+    """Liest 'Schema.Tabelle(Spalte, ...)'-Einträge in {tabelle: {spalten}} (alles klein)."""
+    return {
+        table.lower(): {column.strip().lower() for column in columns.split(",")}
+        for table, columns in re.findall(r"([\w]+\.[\w]+)\(([^)]*)\)", structure)
+    }
+
+
+def strip_comments(query: str) -> str:
+    return COMMENT_OR_LITERAL.sub(lambda match: match.group(1) or " ", query)
+
+
+def _identifier(token: str) -> str:
+    if token[0] in "[\"":
+        return token[1:-1].lower()
+    return token.lower()
+
+
+def _is_name(token: str) -> bool:
+    return token[0] in "[\"" or NAME.match(token) is not None
+
+
+def _read_name(tokens: list, i: int):
+    """Liest einen mehrteiligen Bezeichner (a.b.c) ab Position i: (Teile, nächste Position)."""
+    parts = []
+    while i < len(tokens) and _is_name(tokens[i]):
+        parts.append(_identifier(tokens[i]))
+        i += 1
+        if i + 1 < len(tokens) and tokens[i] == "." and _is_name(tokens[i + 1]):
+            i += 1
+            continue
+        break
+    return parts, i
+
+
+def _closing_paren(tokens: list, i: int) -> int:
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j] == "(":
+            depth += 1
+        elif tokens[j] == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(tokens) - 1
+
+
+def _depths(tokens: list) -> list:
+    """Klammertiefe je Token; Klammern selbst zählen zur äußeren Ebene."""
+    depths, depth = [], 0
+    for token in tokens:
+        if token == ")":
+            depth -= 1
+        depths.append(depth)
+        if token == "(":
+            depth += 1
+    return depths
+
+
+def _is_literal(token: str) -> bool:
+    return token.endswith("'") and len(token) > 1
+
+
+def _literal_value(literal: str) -> str:
+    return literal.lstrip("Nn")[1:-1].replace("''", "'").strip().lower()
+
+
+class _QueryScope:
+    """Tabellen, Aliase und Befunde einer Abfrage (ein gemeinsamer Scope für alle Unterabfragen)."""
+
+    def __init__(self, schema: dict, ctes: set):
+        self.schema = schema
+        self.ctes = ctes
+        self.tables = set()
+        self.qualifiers = {}  # Alias/Tabellenname -> Schlüssel im Schema, None für CTEs und abgeleitete Tabellen
+        self.consumed = set()  # Token-Positionen von Tabellennamen und Aliasen
+        self.nested_customer_tables = False  # Kundentabellen in Unterabfragen, CTEs oder abgeleiteten Tabellen
+        self.instances = []  # je Vorkommen einer Tabelle: Name, Tabelle, Tiefe, Join-Art und ON-Tokens
+        self.problems = {}
+        self.uncertainties = []
+
+    def problem(self, code, message, hint=""):
+        self.problems.setdefault(message, Issue(code, message, hint))
+
+    def uncertain(self, message):
+        if message not in self.uncertainties:
+            self.uncertainties.append(message)
+
+    def add_qualifier(self, name, table):
+        if name in self.qualifiers and self.qualifiers[name] != table:
+            self.uncertain(f"Der Alias {name} wird für verschiedene Tabellen verwendet.")
+        self.qualifiers[name] = table
+
+    def resolve_table(self, parts: list):
+        if len(parts) == 1 and parts[0] in self.ctes:
+            return None
+        if len(parts) == 1:
+            matches = [table for table in self.schema if table.split(".", 1)[1] == parts[0]]
+            if len(matches) == 1:
+                return matches[0]
+            name = parts[0]
+        else:
+            name = ".".join(parts[-2:])
+            if name in self.schema:
+                return name
+        self.problem(
+            "unknown_table", f"Die Tabelle {name} existiert nicht im Schema.",
+            "Verfügbare Tabellen: " + ", ".join(sorted(self.schema)) + "."
+        )
+        return None
+
+    def add_table(self, parts: list, alias: str, depth: int = 0, kind: str = "from", on=None):
+        table = self.resolve_table(parts)
+        if table in CUSTOMER_TABLES and depth > 0:
+            self.nested_customer_tables = True
+        if table:
+            self.tables.add(table)
+            self.instances.append({
+                "alias": alias, "table": table, "depth": depth, "kind": kind, "on": on or [],
+            })
+            self.add_qualifier(table, table)
+            self.add_qualifier(table.split(".", 1)[1], table)
+        elif parts[-1] in self.ctes:
+            self.add_qualifier(parts[-1], None)
+        if alias:
+            self.add_qualifier(alias, table)
+
+
+def _alias_at(tokens: list, i: int):
+    """Optionaler Alias (mit oder ohne AS) ab Position i: (Alias oder '', nächste Position)."""
+    if i < len(tokens) and tokens[i].lower() == "as":
+        i += 1
+    if i < len(tokens) and _is_name(tokens[i]) and _identifier(tokens[i]) not in KEYWORDS:
+        return _identifier(tokens[i]), i + 1
+    return "", i
+
+
+def _join_kind(tokens: list, i: int) -> str:
+    """Art des JOIN an Position i: inner, outer oder cross."""
+    before = tokens[i - 1].lower() if i > 0 else ""
+    if before == "cross":
+        return "cross"
+    if before in ("left", "right", "full", "outer"):
+        return "outer"
+    return "inner"
+
+
+def _on_condition(tokens: list, depths: list, i: int, depth: int) -> list:
+    """Tokens der ON-Bedingung ab Position i (leer ohne ON)."""
+    if i >= len(tokens) or tokens[i].lower() != "on":
+        return []
+    end = i + 1
+    while end < len(tokens) and depths[end] >= depth and not (depths[end] == depth and tokens[end].lower() in ON_END):
+        end += 1
+    return tokens[i + 1:end]
+
+
+def _collect_tables(tokens: list, depths: list, scope: _QueryScope) -> None:
+    i = 0
+    while i < len(tokens):
+        word = tokens[i].lower()
+        if word == "apply":
+            scope.uncertain("CROSS/OUTER APPLY wird lokal nicht geprüft.")
+        if word not in ("from", "join"):
+            i += 1
+            continue
+        depth = depths[i]
+        kind = "from" if word == "from" else _join_kind(tokens, i)
+        i += 1
+        while i < len(tokens):
+            if tokens[i] == "(":
+                # Abgeleitete Tabelle: innere FROM-Klauseln werden im weiteren Durchlauf erfasst
+                end = _closing_paren(tokens, i)
+                alias, after = _alias_at(tokens, end + 1)
+                if alias:
+                    scope.add_qualifier(alias, None)
+                    scope.consumed.update(range(end + 1, after))
+                scope.uncertain("Spalten abgeleiteter Tabellen werden lokal nicht geprüft.")
+                break
+            start = i
+            parts, i = _read_name(tokens, i)
+            if not parts:
+                break
+            if i < len(tokens) and tokens[i] == "(":
+                scope.uncertain(f"Die Tabellenfunktion {'.'.join(parts)} wird lokal nicht geprüft.")
+                break
+            alias, i = _alias_at(tokens, i)
+            scope.consumed.update(range(start, i))
+            scope.add_table(parts, alias, depth, kind, _on_condition(tokens, depths, i, depth))
+            # Komma-Joins: FROM a x, b y
+            if word == "from" and i < len(tokens) and tokens[i] == ",":
+                kind = "comma"
+                i += 1
+                continue
+            break
+
+
+def _check_columns(tokens: list, scope: _QueryScope) -> None:
+    # Bezeichner nach AS sind Spalten-Aliase (oder Typnamen in CAST) und dürfen später wieder vorkommen
+    output_aliases = {
+        _identifier(tokens[i + 1]) for i in range(len(tokens) - 1)
+        if tokens[i].lower() == "as" and _is_name(tokens[i + 1])
+    }
+    i = 0
+    while i < len(tokens):
+        if i in scope.consumed or not _is_name(tokens[i]) or (i > 0 and tokens[i - 1] == "."):
+            i += 1
+            continue
+        parts, j = _read_name(tokens, i)
+        star = j + 1 < len(tokens) and tokens[j] == "." and tokens[j + 1] == "*"
+        if j < len(tokens) and tokens[j] == "(":
+            # Funktionsaufruf
+            i = j
+            continue
+        if star:
+            qualifier, column = parts, "*"
+            j += 2
+        else:
+            qualifier, column = parts[:-1], parts[-1]
+        i = j
+
+        if not qualifier:
+            if column in NON_COLUMNS or column in output_aliases or column in scope.qualifiers or column in scope.ctes:
+                continue
+            if not any(column in scope.schema[table] for table in scope.tables):
+                scope.uncertain(f"Die Spalte {column} ist keiner verwendeten Tabelle zuzuordnen.")
+            continue
+
+        name = ".".join(qualifier[-2:])
+        if name not in scope.qualifiers:
+            scope.problem(
+                "unknown_alias", f"Der Alias oder die Tabelle {name} ist in der Abfrage nicht definiert.",
+                "Jeder Präfix muss in FROM oder JOIN eingeführt werden."
+            )
+            continue
+        table = scope.qualifiers[name]
+        if table and column != "*" and column not in scope.schema[table]:
+            scope.problem(
+                "unknown_column", f"Die Spalte {column} existiert nicht in {table}.",
+                f"Verfügbare Spalten in {table}: " + ", ".join(sorted(scope.schema[table])) + "."
+            )
+
+
+def _outer_where(tokens: list, depths: list) -> list:
+    """Tokens der WHERE-Klausel des äußeren SELECT (Tiefe 0), leer ohne WHERE."""
+    for i, token in enumerate(tokens):
+        if depths[i] == 0 and token.lower() == "where":
+            end = i + 1
+            while end < len(tokens) and not (depths[end] == 0 and tokens[end].lower() in WHERE_END):
+                end += 1
+            return tokens[i + 1:end]
+    return []
+
+
+def _conjuncts(tokens: list) -> list:
+    """Zerlegt eine Bedingung an UND auf oberster Ebene; None bei OR auf oberster Ebene."""
+    depths = _depths(tokens)
+    parts, current, between = [], [], False
+    for token, depth in zip(tokens, depths):
+        word = token.lower()
+        if depth == 0 and word == "or":
+            return None
+        if depth == 0 and word == "between":
+            between = True
+        elif depth == 0 and word == "and":
+            if between:
+                between = False
+            else:
+                parts.append(current)
+                current = []
+                continue
+        current.append(token)
+    parts.append(current)
+    return parts
+
+
+def _outer_tables(scope: _QueryScope):
+    """Tabellen des äußeren SELECT und ihre Namen (Alias bzw. Tabellenname) -> Index."""
+    instances = [instance for instance in scope.instances if instance["depth"] == 0]
+    names = {}
+    for index, instance in enumerate(instances):
+        if instance["alias"]:
+            names[instance["alias"]] = index
+        else:
+            names[instance["table"]] = index
+            names[instance["table"].split(".", 1)[1]] = index
+    return instances, names
+
+
+def _qualified_column(tokens: list, names: dict):
+    """(Index der Tabelle, Spalte) für genau einen qualifizierten Spaltennamen, sonst None."""
+    parts, end = _read_name(tokens, 0)
+    if end != len(tokens) or len(parts) < 2:
+        return None
+    index = names.get(".".join(parts[:-1][-2:]))
+    return None if index is None else (index, parts[-1])
+
+
+def _own_email_filter(condition: list, email: str, instances: list, names: dict):
+    """Index der Customer-Tabelle für genau <Customer-Alias>.EmailAddress = '<email>' (auch umgedreht
+    oder geklammert), sonst None."""
+    while len(condition) > 2 and condition[0] == "(" and _closing_paren(condition, 0) == len(condition) - 1:
+        condition = condition[1:-1]
+    if len(condition) >= 3 and _is_literal(condition[0]) and condition[1] == "=":
+        literal, column = condition[0], condition[2:]
+    elif len(condition) >= 3 and _is_literal(condition[-1]) and condition[-2] == "=":
+        literal, column = condition[-1], condition[:-2]
+    else:
+        return None
+    if _literal_value(literal) != email.lower():
+        return None
+    customers = [index for index, instance in enumerate(instances) if instance["table"] == CUSTOMER_TABLE]
+    parts, end = _read_name(column, 0)
+    if end != len(column) or not parts or parts[-1] != "emailaddress":
+        return None
+    if len(parts) == 1:
+        return customers[0] if len(customers) == 1 else None
+    resolved = _qualified_column(column, names)
+    return resolved[0] if resolved and resolved[0] in customers else None
+
+
+def _key_join(condition: list, instances: list, names: dict):
+    """Indexpaar für eine Equi-Join-Bedingung auf der Schlüsselkette (a.Spalte = b.Spalte), sonst None."""
+    while len(condition) > 2 and condition[0] == "(" and _closing_paren(condition, 0) == len(condition) - 1:
+        condition = condition[1:-1]
+    if "=" not in condition:
+        return None
+    split = condition.index("=")
+    left = _qualified_column(condition[:split], names)
+    right = _qualified_column(condition[split + 1:], names)
+    if not left or not right or left[0] == right[0]:
+        return None
+    key = frozenset({(instances[left[0]]["table"], left[1]), (instances[right[0]]["table"], right[1])})
+    return (left[0], right[0]) if key in CUSTOMER_KEYS else None
+
+
+def _check_customer_joins(instances: list, names: dict, filtered, scope: _QueryScope) -> None:
+    """Jede Kundentabelle im äußeren SELECT muss per INNER JOIN über die Schlüsselkette am gefilterten Kunden hängen."""
+    if sum(instance["table"] == CUSTOMER_TABLE for instance in instances) > 1:
+        scope.uncertain("SalesLT.Customer kommt mehrfach vor.")
+    if any(instance["kind"] in ("comma", "cross") for instance in instances):
+        scope.uncertain("Komma-Joins und CROSS JOIN auf Kundentabellen werden lokal nicht geprüft.")
+    if filtered is None:
+        return
+
+    edges = {index: set() for index in range(len(instances))}
+    for instance in instances:
+        if instance["kind"] != "inner":
+            continue
+        # Zusätzliche UND-Bedingungen schränken nur weiter ein; bei OR zählt keine Kante
+        for condition in _conjuncts(instance["on"]) or []:
+            pair = _key_join(condition, instances, names)
+            if pair:
+                edges[pair[0]].add(pair[1])
+                edges[pair[1]].add(pair[0])
+
+    reached, pending = {filtered}, [filtered]
+    while pending:
+        for neighbour in edges[pending.pop()] - reached:
+            reached.add(neighbour)
+            pending.append(neighbour)
+    for index, instance in enumerate(instances):
+        if instance["table"] in CUSTOMER_TABLES and index not in reached:
+            name = instance["alias"] or instance["table"]
+            scope.uncertain(
+                f"{instance['table']} ({name}) ist nicht per Equi-Join über die Schlüssel "
+                "(CustomerID, SalesOrderID, AddressID) mit dem gefilterten Kunden verbunden."
+            )
+
+
+def _check_email_filter(tokens: list, depths: list, query: str, email: str, scope: _QueryScope) -> None:
+    if CUSTOMER_TABLE not in scope.tables:
+        scope.problem(
+            "customer_join", "Kundentabellen dürfen nur zusammen mit SalesLT.Customer abgefragt werden.",
+            f"JOIN auf SalesLT.Customer und WHERE EmailAddress = '{email}' ergänzen."
+        )
+        return
+    comparisons = [(operator.lower(), literal) for _, operator, literal in EMAIL_COMPARISON.findall(query)]
+    comparisons += [(operator, literal) for literal, operator, _ in EMAIL_COMPARISON_REVERSED.findall(query)]
+    mentioned = False
+    for operator, literal in comparisons:
+        if operator in ("=", "in") and _literal_value(literal) == email.lower():
+            mentioned = True
+        else:
+            scope.problem(
+                "foreign_email", "Die Abfrage filtert auf eine andere als die E-Mail-Adresse des Kunden.",
+                f"Nur WHERE EmailAddress = '{email}' ist erlaubt."
+            )
+    if not mentioned:
+        scope.problem(
+            "missing_email_filter", "Bei Kundentabellen ist ein Filter auf die E-Mail des Kunden erforderlich.",
+            f"WHERE EmailAddress = '{email}' (SalesLT.Customer) ergänzen."
+        )
+        return
+
+    # Freigabe ohne LLM nur, wenn der Filter die Zeilen des äußeren SELECT sicher einschränkt
+    instances, names = _outer_tables(scope)
+    filtered = None
+    for condition in _conjuncts(_outer_where(tokens, depths)) or []:
+        filtered = _own_email_filter(condition, email, instances, names)
+        if filtered is not None:
+            break
+    if filtered is None:
+        scope.uncertain(
+            "Der E-Mail-Filter ist keine UND-Bedingung im äußeren WHERE (z.B. OR, NOT, ON-Klausel, CASE oder Unterabfrage)."
+        )
+    _check_customer_joins(instances, names, filtered, scope)
+    if scope.nested_customer_tables:
+        scope.uncertain("Kundentabellen in Unterabfragen oder CTEs werden lokal nicht geprüft.")
+    if any(depths[i] == 0 and token.lower() in ("left", "right", "full") and tokens[i + 1].lower() in ("join", "outer")
+           for i, token in enumerate(tokens[:-1])):
+        scope.uncertain("Outer Joins auf Kundentabellen werden lokal nicht geprüft.")
+    if any(depths[i] == 0 and token.lower() in ("union", "except", "intersect") for i, token in enumerate(tokens)):
+        scope.uncertain("Mengenoperationen müssen in jedem Teil nach der E-Mail filtern.")
+
+
+_stats_lock = threading.Lock()
+stats = {"ok": 0, "invalid": 0, "ambiguous": 0, "fatal": 0}
+
+
+def _record(result: ValidationResult) -> ValidationResult:
+    with _stats_lock:
+        stats[result.verdict] += 1
+    return result
+
+
+def check_query(query: str, email: str, schema: dict) -> ValidationResult:
+    if not query or not query.strip():
+        return _record(ValidationResult([Issue("empty", "Es wurde keine SQL-Abfrage erzeugt.")]))
+    query = strip_comments(query).strip().rstrip(";").strip()
+    code = STRING_LITERAL.sub("''", query)
+    if ";" in code:
+        return _record(ValidationResult([Issue("multiple_statements", "Nur eine einzelne Abfrage ist erlaubt.")]))
+    if not re.match(r"^\s*(select|with)\b", code, re.IGNORECASE) or FORBIDDEN_KEYWORDS.search(code):
+        return _record(ValidationResult([Issue("not_select", "Nur lesende SELECT-Abfragen sind erlaubt.")]))
+
+    ctes = {_identifier(name) for name in CTE_NAME.findall(code)} if code.lstrip()[:4].lower() == "with" else set()
+    tokens = TOKEN.findall(query)
+    depths = _depths(tokens)
+    scope = _QueryScope(schema, ctes)
+    _collect_tables(tokens, depths, scope)
+    _check_columns(tokens, scope)
+
+    if scope.tables & CUSTOMER_TABLES:
+        email = (email or "").strip()
+        if not email or email.lower() == "anonymous":
+            return _record(ValidationResult(
+                [Issue("anonymous", "Kundendaten sind für anonyme Nutzer nicht abrufbar.")], fatal=True
+            ))
+        _check_email_filter(tokens, depths, query, email, scope)
+    return _record(ValidationResult(list(scope.problems.values()), scope.uncertainties))
@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --------------------------------------------------------------------
+# Hintergrund-Zusammenfassung für ConversationSummaryBufferMemory
+#
+# save_context der Summary-Memory ruft summarizer_llm synchron auf, sobald das
+# Token-Limit überschritten ist. Im Request-Pfad werden die neuen Nachrichten nur
+# noch angehängt (kein LLM); das Kürzen samt Zusammenfassung übernimmt ein
+# Hintergrund-Worker nach dem Versand der Antwort. Bis dahin sieht der nächste
+# Turn die noch ungekürzten Nachrichten plus die letzte fertige Zusammenfassung.
+# Pro Session läuft höchstens ein Job; vor dem Übernehmen des Ergebnisses wird
+# geprüft, ob Zusammenfassung und Nachrichten noch dem Stand beim Start entsprechen.
+# --------------------------------------------------------------------
+
+# "background" = Zusammenfassung im Worker, "inline" = wie bisher im Request
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "background").lower()
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", 2))
+
+_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+
+
+class SummaryStats:
+    """Zählt Hintergrund-Zusammenfassungen und verworfene Ergebnisse."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.scheduled = 0
+        self.summarized = 0
+        self.stale = 0
+        self.errors = 0
+
+    def record(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "scheduled": self.scheduled,
+                "summarized": self.summarized,
+                "stale": self.stale,
+                "errors": self.errors,
+            }
+
+
+stats = SummaryStats()
+
+
+def is_background_mode() -> bool:
+    return SUMMARY_MODE == "background"
+
+
+def append_messages(global_summary, text: str, answer: str) -> None:
+    # Entspricht save_context ohne das anschließende prune()
+    global_summary.chat_memory.add_user_message(text)
+    global_summary.chat_memory.add_ai_message(answer)
+
+
+def _overflow(global_summary) -> list:
+    # Älteste Nachrichten, die über max_token_limit hinausgehen (wie in prune())
+    buffer = list(global_summary.chat_memory.messages)
+    count = 0
+    while buffer[count:] and global_summary.llm.get_num_tokens_from_messages(buffer[count:]) > global_summary.max_token_limit:
+        count += 1
+    return buffer[:count]
+
+
+def _summarize(memory_dict: dict, lock) -> None:
+    global_summary = memory_dict["global_summary"]
+    try:
+        while True:
+            with lock:
+                pruned = _overflow(global_summary)
+                if not pruned:
+                    memory_dict["summary_scheduled"] = False
+                    return
+                previous = global_summary.moving_summary_buffer
+
+            # LLM-Aufruf ohne Lock: der nächste Request kann währenddessen lesen und anhängen
+            summary = global_summary.predict_new_summary(pruned, previous)
+
+            with lock:
+                messages = global_summary.chat_memory.messages
+                current = messages[:len(pruned)]
+                # Versionsprüfung: nur übernehmen, wenn sich der Ausgangsstand nicht geändert hat
+                if global_summary.moving_summary_buffer != previous or any(a is not b for a, b in zip(current, pruned)):
+                    stats.record("stale")
+                    continue
+                del messages[:len(pruned)]
+                global_summary.moving_summary_buffer = summary
+                memory_dict["summary_version"] = memory_dict.get("summary_version", 0) + 1
+                stats.record("summarized")
+    except Exception as e:
+        # Nachrichten bleiben ungekürzt erhalten; der nächste Turn startet einen neuen Versuch
+        logging.error(f"Fehler bei der Hintergrund-Zusammenfassung: {e}")
+        stats.record("errors")
+        with lock:
+            memory_dict["summary_scheduled"] = False
+
+
+def schedule(memory_dict: dict, lock) -> None:
+    """Startet die Zusammenfassung für diese Session, falls nicht bereits ein Job läuft."""
+    with lock:
+        if memory_dict.get("summary_scheduled"):
+            return
+        memory_dict["summary_scheduled"] = True
+    stats.record("scheduled")
+    _executor.submit(_summarize, memory_dict, lock)
@@ -0,0 +1,351 @@
+# Session-Memory-Store für die Conversation Memories pro Chat-ID
+#
+# Ersetzt das unbegrenzte Modul-Dict `memory_store`. Aktive Sitzungen liegen in
+# einem LRU-Cache im Prozess (Obergrenze für Anzahl und serialisierte Größe,
+# Idle-TTL). Optional wird der Zustand jeder Sitzung serialisiert in einem
+# gemeinsamen Backend abgelegt (SQLite-Datei oder Redis), sodass mehrere Worker
+# dieselben Memories sehen und Neustarts überstehen. Fehlt eine Sitzung überall,
+# wird sie lazy aus dem Chat-Dokument in Cosmos wieder aufgebaut: aus dem dort
+# gespeicherten Memory-Zustand, sodass nur neue Nachrichten zusammengefasst werden.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain.schema import messages_from_dict, messages_to_dict
+
+try:
+    import redis
+except ImportError:  # Redis ist optional
+    redis = None
+
+# Konfiguration über .env
+SESSION_MEMORY_BACKEND = os.getenv("SESSION_MEMORY_BACKEND", "memory").lower()  # memory | sqlite | redis
+SESSION_MEMORY_SQLITE_PATH = os.getenv("SESSION_MEMORY_SQLITE_PATH", "session_memory.sqlite3")
+SESSION_MEMORY_REDIS_URL = os.getenv("SESSION_MEMORY_REDIS_URL", "redis://localhost:6379/0")
+SESSION_MEMORY_MAX_SESSIONS = int(os.getenv("SESSION_MEMORY_MAX_SESSIONS", 1000))
+SESSION_MEMORY_MAX_BYTES = int(os.getenv("SESSION_MEMORY_MAX_BYTES", 64 * 1024 * 1024))
+SESSION_MEMORY_IDLE_TTL = float(os.getenv("SESSION_MEMORY_IDLE_TTL", 3600))
+SESSION_MEMORY_BACKEND_TTL = float(os.getenv("SESSION_MEMORY_BACKEND_TTL", 7 * 24 * 3600))
+
+
+# --------------------------------------------------------------------
+# Serialisierung der Memories (Buffer-Nachrichten und laufende Zusammenfassung)
+# --------------------------------------------------------------------
+def memory_state(memory: dict) -> dict:
+    state = {}
+    global_buffer = memory.get("global_buffer")
+    if global_buffer is not None:
+        # ConversationBufferWindowMemory kürzt chat_memory nie (k begrenzt nur das Laden):
+        # nur die letzten k Runden speichern, sonst wächst der Zustand mit dem ganzen Verlauf
+        messages = global_buffer.chat_memory.messages
+        window = getattr(global_buffer, "k", None)
+        if window:
+            messages = messages[-2 * window:]
+        state["global_buffer"] = {"messages": messages_to_dict(messages)}
+    global_summary = memory.get("global_summary")
+    if global_summary is not None:
+        state["global_summary"] = {
+            "messages": messages_to_dict(global_summary.chat_memory.messages),
+            "summary": global_summary.moving_summary_buffer,
+        }
+    if "message_count" in memory:
+        state["message_count"] = memory["message_count"]
+    return state
+
+
+def dump_memory(memory: dict) -> str:
+    return json.dumps(memory_state(memory), ensure_ascii=False)
+
+
+def apply_memory_state(memory: dict, state: dict) -> dict:
+    if "global_buffer" in state and memory.get("global_buffer") is not None:
+        memory["global_buffer"].chat_memory.messages = messages_from_dict(state["global_buffer"]["messages"])
+    if "global_summary" in state and memory.get("global_summary") is not None:
+        memory["global_summary"].chat_memory.messages = messages_from_dict(state["global_summary"]["messages"])
+        memory["global_summary"].moving_summary_buffer = state["global_summary"].get("summary", "")
+    if "message_count" in state:
+        memory["message_count"] = state["message_count"]
+    return memory
+
+
+def load_memory(memory: dict, payload: str) -> dict:
+    return apply_memory_state(memory, json.loads(payload))
+
+
+def restore_history(memory: dict, messages: list) -> dict:
+    # Vollständigen Verlauf ins Memory übertragen (für Re‑Prompting)
+    for i, m in enumerate(messages):
+        if i < len(messages) - 3:
+            memory["global_summary"].save_context({"input": m["content"]}, {"output": ""})
+        memory["global_buffer"].save_context({"input": m["content"]}, {"output": ""})
+    memory["message_count"] = len(messages)
+    return memory
+
+
+# --------------------------------------------------------------------
+# Persistenz im Cosmos-Chat-Dokument: Memory-Zustand plus Anzahl abgedeckter Nachrichten
+# --------------------------------------------------------------------
+def document_memory_state(memory: dict, covered: int) -> dict:
+    """Wert für das Feld `memory_state` des Chat-Dokuments."""
+    return {"state": memory_state(memory), "covered": covered}
+
+
+def restorable(chat_doc) -> bool:
+    """True, wenn das Chat-Dokument Verlauf oder gespeicherten Memory-Zustand enthält."""
+    return bool(chat_doc and (chat_doc.get("messages") or chat_doc.get("memory_state")))
+
+
+def restore_document(memory: dict, chat_doc: dict) -> dict:
+    """
+    Baut die Memories aus einem Chat-Dokument auf. Liegt ein gespeicherter
+    Zustand vor, wird er direkt übernommen und nur das Delta seit der letzten
+    Speicherung nachgetragen; ältere Dokumente fallen auf den vollständigen Replay zurück.
+    """
+    messages = chat_doc.get("messages", [])
+    saved = chat_doc.get("memory_state")
+    if not saved:
+        return restore_history(memory, messages)
+    apply_memory_state(memory, saved.get("state", {}))
+    for m in messages[saved.get("covered", 0):]:
+        memory["global_summary"].save_context({"input": m["content"]}, {"output": ""})
+        memory["global_buffer"].save_context({"input": m["content"]}, {"output": ""})
+    memory["message_count"] = len(messages)
+    return memory
+
+
+# --------------------------------------------------------------------
+# Backends: gemeinsamer, serialisierter Zustand mit Versionszähler
+# --------------------------------------------------------------------
+class SQLiteBackend:
+    """Gemeinsame SQLite-Datei für alle Worker auf demselben Host."""
+
+    def __init__(self, path=SESSION_MEMORY_SQLITE_PATH, ttl_seconds=SESSION_MEMORY_BACKEND_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS session_memory "
+            "(chat_id TEXT PRIMARY KEY, state TEXT NOT NULL, version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def version(self, chat_id):
+        with self._lock:
+            row = self._db.execute("SELECT version FROM session_memory WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else None
+
+    def load(self, chat_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state, version, updated_at FROM session_memory WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        if not row or time.time() - row[2] > self.ttl_seconds:
+            return None
+        return row[0], row[1]
+
+    def save(self, chat_id, payload):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO session_memory (chat_id, state, version, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET state = excluded.state, "
+                "version = session_memory.version + 1, updated_at = excluded.updated_at",
+                (chat_id, payload, now)
+            )
+            # Abgelaufene Sitzungen gleich mit aufräumen
+            self._db.execute("DELETE FROM session_memory WHERE updated_at < ?", (now - self.ttl_seconds,))
+            self._db.commit()
+            row = self._db.execute("SELECT version FROM session_memory WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0]
+
+    def delete(self, chat_id):
+        with self._lock:
+            self._db.execute("DELETE FROM session_memory WHERE chat_id = ?", (chat_id,))
+            self._db.commit()
+
+
+class RedisBackend:
+    """Redis (oder kompatibler Dienst) für Worker auf mehreren Hosts."""
+
+    def __init__(self, url=SESSION_MEMORY_REDIS_URL, ttl_seconds=SESSION_MEMORY_BACKEND_TTL):
+        if redis is None:
+            raise RuntimeError("SESSION_MEMORY_BACKEND=redis erfordert das Paket 'redis'.")
+        self.ttl_seconds = int(ttl_seconds)
+        self._client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _key(chat_id):
+        return f"nova:memory:{chat_id}"
+
+    def version(self, chat_id):
+        value = self._client.hget(self._key(chat_id), "version")
+        return int(value) if value is not None else None
+
+    def load(self, chat_id):
+        state, version = self._client.hmget(self._key(chat_id), "state", "version")
+        if state is None:
+            return None
+        return state.decode("utf-8"), int(version)
+
+    def save(self, chat_id, payload):
+        key = self._key(chat_id)
+        pipe = self._client.pipeline()
+        pipe.hset(key, "state", payload)
+        pipe.hincrby(key, "version", 1)
+        pipe.expire(key, self.ttl_seconds)
+        return pipe.execute()[1]
+
+    def delete(self, chat_id):
+        self._client.delete(self._key(chat_id))
+
+
+def create_backend(kind=SESSION_MEMORY_BACKEND):
+    if kind == "sqlite":
+        return SQLiteBackend()
+    if kind == "redis":
+        return RedisBackend()
+    return None
+
+
+# --------------------------------------------------------------------
+# Store: LRU-Cache im Prozess vor dem optionalen Backend
+# --------------------------------------------------------------------
+class _Entry:
+    __slots__ = ("memory", "version", "size", "last_access")
+
+    def __init__(self, memory, version=0, size=0):
+        self.memory = memory
+        self.version = version
+        self.size = size
+        self.last_access = time.monotonic()
+
+
+class SessionMemoryStore:
+
+    def __init__(self, factory, backend="default", max_sessions=SESSION_MEMORY_MAX_SESSIONS,
+                 max_bytes=SESSION_MEMORY_MAX_BYTES, idle_ttl=SESSION_MEMORY_IDLE_TTL):
+        # factory() liefert ein neues Memory-Dict ({"global_buffer": ..., "global_summary": ...})
+        self.factory = factory
+        self.backend = create_backend() if backend == "default" else backend
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.stats = {"hits": 0, "backend_hits": 0, "rehydrated": 0, "created": 0, "evicted": 0}
+
+    def _remember(self, chat_id, entry):
+        with self._lock:
+            old = self._entries.pop(chat_id, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[chat_id] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def _evict(self):
+        # Erst abgelaufene, dann die am längsten ungenutzten Sitzungen entfernen
+        now = time.monotonic()
+        for chat_id in [cid for cid, e in self._entries.items() if now - e.last_access > self.idle_ttl]:
+            self._drop(chat_id)
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, chat_id):
+        entry = self._entries.pop(chat_id)
+        self._bytes -= entry.size
+        self.stats["evicted"] += 1
+
+    def _load_backend(self, chat_id):
+        if self.backend is None:
+            return None
+        loaded = self.backend.load(chat_id)
+        if loaded is None:
+            return None
+        payload, version = loaded
+        memory = load_memory(self.factory(), payload)
+        self._remember(chat_id, _Entry(memory, version, len(payload)))
+        self.stats["backend_hits"] += 1
+        return memory
+
+    def get(self, chat_id):
+        """Memory aus dem Cache bzw. Backend, sonst None."""
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is not None and time.monotonic() - entry.last_access > self.idle_ttl:
+                self._drop(chat_id)
+                entry = None
+            if entry is not None:
+                # Ein anderer Worker hat die Sitzung inzwischen weitergeschrieben
+                if self.backend is not None and (self.backend.version(chat_id) or 0) > entry.version:
+                    return self._load_backend(chat_id)
+                entry.last_access = time.monotonic()
+                self._entries.move_to_end(chat_id)
+                self.stats["hits"] += 1
+                return entry.memory
+            return self._load_backend(chat_id)
+
+    def create(self, chat_id):
+        memory = self.factory()
+        self._remember(chat_id, _Entry(memory))
+        self.stats["created"] += 1
+        return memory
+
+    def restore(self, chat_id, chat_doc):
+        """Baut die Memories aus dem gespeicherten Chat-Dokument neu auf."""
+        memory = restore_document(self.factory(), chat_doc)
+        self._remember(chat_id, _Entry(memory))
+        self.stats["rehydrated"] += 1
+        self.save(chat_id)
+        return memory
+
+    def get_or_create(self, chat_id, document_loader=None):
+        memory = self.get(chat_id)
+        if memory is not None:
+            return memory
+        # Ausgelagerte Sitzung: Chat-Dokument nachladen, sonst leer beginnen
+        chat_doc = document_loader(chat_id) if document_loader else None
+        if restorable(chat_doc):
+            return self.restore(chat_id, chat_doc)
+        return self.create(chat_id)
+
+    def save(self, chat_id):
+        """Schreibt den aktuellen Zustand ins Backend und aktualisiert die Größenabschätzung."""
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None:
+                return
+            memory = entry.memory
+        payload = dump_memory(memory)
+        version = self.backend.save(chat_id, payload) if self.backend is not None else entry.version
+        with self._lock:
+            if self._entries.get(chat_id) is entry:
+                self._bytes += len(payload) - entry.size
+                entry.size = len(payload)
+                entry.version = version
+                self._evict()
+
+    def rename(self, old_chat_id, new_chat_id):
+        memory = self.get(old_chat_id)
+        self.discard(old_chat_id)
+        if memory is not None:
+            self._remember(new_chat_id, _Entry(memory))
+            self.save(new_chat_id)
+
+    def discard(self, chat_id):
+        with self._lock:
+            if chat_id in self._entries:
+                entry = self._entries.pop(chat_id)
+                self._bytes -= entry.size
+        if self.backend is not None:
+            self.backend.delete(chat_id)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "sessions": len(self._entries), "bytes": self._bytes}
@@ -3,13 +3,38 @@
 import os
 import sys
 import base64
-import psycopg2
+import hashlib
+import time
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_values
 import nltk
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import AnalyzeDocumentRequest
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
+
+# Lade Umgebungsvariablen aus .env (vor den eigenen Modulen, die ihre Einstellungen beim Import lesen)
+load_dotenv()
+
+try:
+    from backend.textprocessing import psql_pool
+    from backend.textprocessing import psql_async_pool
+    from backend.textprocessing import embedding_batcher
+    from backend.textprocessing import vector_index
+    from backend.textprocessing import embedding_cache
+    from backend.textprocessing.keyword_matcher import KEYWORDS_LIST, KeywordMatcher
+    from backend.textprocessing.ingest_pipeline import IngestPipeline, Stage, RateLimiter
+except ImportError:  # Direkter Skriptaufruf aus dem textprocessing-Ordner
+    import psql_pool
+    import psql_async_pool
+    import embedding_batcher
+    import vector_index
+    import embedding_cache
+    from keyword_matcher import KEYWORDS_LIST, KeywordMatcher
+    from ingest_pipeline import IngestPipeline, Stage, RateLimiter
 
 # NLTK-Modell für Tokenisierung laden
 nltk.download('punkt')
@@ -17,8 +42,16 @@ nltk.download('punkt')
 # Arbeitsverzeichnis auf Skriptverzeichnis setzen
 os.chdir(sys.path[0])
 
-# Lade Umgebungsvariablen aus .env
-load_dotenv()
+# Parallelität, Queue-Größe und Rate-Limits (Aufrufe/s, 0 = unbegrenzt) der Ingestion-Pipeline
+INGEST_OCR_WORKERS = int(os.getenv("INGEST_OCR_WORKERS", 4))
+INGEST_KEYWORD_FILE_WORKERS = int(os.getenv("INGEST_KEYWORD_FILE_WORKERS", 2))
+INGEST_KEYWORD_WORKERS = int(os.getenv("INGEST_KEYWORD_WORKERS", 8))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", 2))
+INGEST_WRITE_WORKERS = int(os.getenv("INGEST_WRITE_WORKERS", 2))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 4))
+INGEST_OCR_RATE = float(os.getenv("INGEST_OCR_RATE", 0))
+INGEST_KEYWORD_RATE = float(os.getenv("INGEST_KEYWORD_RATE", 0))
+INGEST_EMBED_RATE = float(os.getenv("INGEST_EMBED_RATE", 0))
 
 # Klasse zum Erstellen von Embeddings via Azure OpenAI
 class AzureOpenAIEmbeddings:
@@ -29,10 +62,36 @@ class AzureOpenAIEmbeddings:
         self.api_base = os.getenv("ADA_ENDPOINT")
         self.model = "text-embedding-ada-002"
         self.client = AzureOpenAI(api_key=self.api_key, azure_endpoint=self.api_base, api_version="2024-08-01-preview")
+        # Asynchroner Client für den ASGI-Modus, wird erst bei Bedarf angelegt
+        self._async_client = None
+        # Prozessweiter Cache für Query-Embeddings (LRU + TTL, optional SQLite)
+        self.query_cache = embedding_cache.shared_cache()
 
     def embed_query(self, text: str) -> list[float]:
+        key = self.query_cache.make_key(self.model, text)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return cached
         response = self.client.embeddings.create(input=text, model=self.model)
-        return response.data[0].embedding
+        embedding = response.data[0].embedding
+        self.query_cache.put(key, embedding)
+        return embedding
+
+    async def aembed_query(self, text: str) -> list[float]:
+        key = self.query_cache.make_key(self.model, text)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return cached
+        if self._async_client is None:
+            self._async_client = AsyncAzureOpenAI(api_key=self.api_key, azure_endpoint=self.api_base, api_version="2024-08-01-preview")
+        response = await self._async_client.embeddings.create(input=text, model=self.model)
+        embedding = response.data[0].embedding
+        self.query_cache.put(key, embedding)
+        return embedding
+
+    # Gebündelte Embeddings für viele Texte (Reihenfolge bleibt erhalten)
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return embedding_batcher.embed_in_batches(self.client, self.model, texts)
 
 
 # Hauptklasse zur Verarbeitung von PDF-Dateien
@@ -102,12 +161,7 @@ class PDFProcessor:
     def get_keywords_with_gpt(self, chunk):
 
         #Vordefinierte Keyword-Liste
-        keywordsList = ["Bose", "Acoustimass", "Loudspeaker",
-                        "Subwoofer", "Surround", "Bluetooth", "Wi-Fi",
-                        "DSP", "Amplifier", "Crossover", "Bass",
-                        "Treble", "Mounting", "Wireless", "Impedance", "Dolby",
-                        "EQ", "Frequency", "Signal", "Audio"
-                        ]
+        keywordsList = KEYWORDS_LIST
         prompt = (
             f"Select 1 to 3 keywords from the following predefined list that best describe the given text:\n\n"
             f"Keyword List: {', '.join(keywordsList)}\n\n"
@@ -141,29 +195,152 @@ class PDFProcessor:
                 if file.endswith(".pdf"):
                     self.pdf_files.append(os.path.join(root, file))
 
-    # Einfügen der Daten in die PostgreSQL-Datenbank
-    def insert_into_db(self, filename, chunk_number, chunk_text, keywords, embedding):
+    # Schreibt alle Chunks einer PDF in einer einzigen Transaktion (execute_values).
+    # Scheitert ein Teil, wird alles zurückgerollt, sodass nie ein halb eingelesenes
+    # Handbuch in den Suchergebnissen auftaucht.
+    # Mit content_hash wird im selben Schritt das Manifest aktualisiert.
+    def insert_chunks_into_db(self, filename, rows, content_hash=None):
+        query = """
+        INSERT INTO chunks (filename, chunk_number, chunk_text, keywords, embedding, chunk_hash)
+        VALUES %s
+        """
+        values = [
+            (filename, chunk_number, chunk_text,
+             keywords.split(", ") if isinstance(keywords, str) else keywords,
+             embedding, self.text_hash(chunk_text))
+            for chunk_number, chunk_text, keywords, embedding in rows
+        ]
         try:
-            conn = psycopg2.connect(**self.db_config)
-            cursor = conn.cursor()
-
-            query = """
-            INSERT INTO chunks (filename, chunk_number, chunk_text, keywords, embedding)
-            VALUES (%s, %s, %s, %s, %s)
-            """
-
-            # Keywords als Liste für PostgreSQL-Array vorbereiten
-            formatted_keywords = keywords.split(", ") if isinstance(keywords, str) else keywords
-
-            cursor.execute(query, (filename, chunk_number, chunk_text, formatted_keywords, embedding))
+            with psql_pool.connection(self.db_config) as conn:
+                with conn.cursor() as cursor:
+                    # Alte Chunks der Datei (inkl. nicht mehr vorhandener) ersetzen
+                    cursor.execute("DELETE FROM chunks WHERE filename = %s;", (filename,))
+                    execute_values(cursor, query, values,
+                                   template="(%s, %s, %s, %s, %s::vector, %s)", page_size=200)
+                    if content_hash:
+                        self._upsert_manifest(cursor, filename, content_hash, len(values))
+            print(f"Inserted {len(values)} chunks from {filename} into the database.")
+            return True
+        except Exception as e:
+            print(f"Error inserting chunks of {filename}, transaction rolled back:", e)
+            return False
 
-            conn.commit()
-            cursor.close()
-            conn.close()
-            print(f"Inserted chunk {chunk_number} from {filename} into the database.")
+    # ------------------------------------------------------------------
+    # Manifest für inkrementelle Ingestion (Datei-Hash und Chunk-Hash)
+    # ------------------------------------------------------------------
 
-        except Exception as e:
-            print("Error inserting into the database:", e)
+    # SHA-256 über den Dateiinhalt
+    @staticmethod
+    def file_content_hash(pdf_path):
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    # SHA-256 über den Chunk-Text (identisch zu sha256(convert_to(chunk_text, 'UTF8')) in PostgreSQL)
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    # Legt Manifest-Tabelle und Chunk-Hash-Spalte an und befüllt Hashes bestehender Chunks
+    def ensure_manifest_schema(self):
+        with psql_pool.connection(self.db_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_manifest (
+                    filename TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    chunk_count INTEGER NOT NULL DEFAULT 0,
+                    ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+                """)
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_ingest_manifest_hash ON ingest_manifest (content_hash);")
+                cur.execute("ALTER TABLE chunks ADD COLUMN IF NOT EXISTS chunk_hash TEXT;")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_chunks_chunk_hash ON chunks (chunk_hash);")
+                cur.execute("""
+                UPDATE chunks SET chunk_hash = encode(sha256(convert_to(chunk_text, 'UTF8')), 'hex')
+                WHERE chunk_hash IS NULL;
+                """)
+
+    # Liefert {filename: content_hash} sowie Dateien, die vor dem Manifest eingelesen wurden
+    def load_manifest(self):
+        with psql_pool.connection(self.db_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT filename, content_hash FROM ingest_manifest;")
+                manifest = dict(cur.fetchall())
+                cur.execute("""
+                SELECT DISTINCT filename FROM chunks
+                WHERE filename NOT IN (SELECT filename FROM ingest_manifest);
+                """)
+                legacy_files = {row[0] for row in cur.fetchall()}
+        return manifest, legacy_files
+
+    @staticmethod
+    def _upsert_manifest(cursor, filename, content_hash, chunk_count):
+        cursor.execute("""
+        INSERT INTO ingest_manifest (filename, content_hash, chunk_count, ingested_at)
+        VALUES (%s, %s, %s, now())
+        ON CONFLICT (filename) DO UPDATE
+        SET content_hash = EXCLUDED.content_hash, chunk_count = EXCLUDED.chunk_count, ingested_at = now();
+        """, (filename, content_hash, chunk_count))
+
+    # Trägt eine bereits eingelesene Datei ohne Neuverarbeitung ins Manifest ein
+    def register_in_manifest(self, filename, content_hash):
+        with psql_pool.connection(self.db_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT count(*) FROM chunks WHERE filename = %s;", (filename,))
+                self._upsert_manifest(cur, filename, content_hash, cur.fetchone()[0])
+
+    # Umbenannte Datei (alter Name nicht mehr im Ordner): Chunks samt Embeddings unter dem neuen
+    # Namen übernehmen; Chunks und Manifest-Eintrag des alten Namens entfallen
+    def move_chunks(self, source_filename, filename, content_hash):
+        with psql_pool.connection(self.db_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM chunks WHERE filename = %s;", (filename,))
+                cur.execute("UPDATE chunks SET filename = %s WHERE filename = %s;", (filename, source_filename))
+                chunk_count = cur.rowcount
+                cur.execute("DELETE FROM ingest_manifest WHERE filename = %s;", (source_filename,))
+                self._upsert_manifest(cur, filename, content_hash, chunk_count)
+
+    # Inhaltsgleiche Kopie einer weiterhin vorhandenen Datei: Chunks samt Embeddings kopieren statt neu zu verarbeiten
+    def copy_chunks(self, source_filename, filename, content_hash):
+        with psql_pool.connection(self.db_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM chunks WHERE filename = %s;", (filename,))
+                cur.execute("""
+                INSERT INTO chunks (filename, chunk_number, chunk_text, keywords, embedding, chunk_hash)
+                SELECT %s, chunk_number, chunk_text, keywords, embedding, chunk_hash
+                FROM chunks WHERE filename = %s;
+                """, (filename, source_filename))
+                self._upsert_manifest(cur, filename, content_hash, cur.rowcount)
+
+    # Entfernt alle Chunks und den Manifest-Eintrag einer nicht mehr vorhandenen Datei
+    def delete_file(self, filename):
+        with psql_pool.connection(self.db_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM chunks WHERE filename = %s;", (filename,))
+                cur.execute("DELETE FROM ingest_manifest WHERE filename = %s;", (filename,))
+
+    # Kennung des eingelesenen Korpus; ändert sich bei jedem Einlesen oder Entfernen einer Datei
+    def corpus_version(self):
+        with psql_pool.connection(self.db_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT count(*), max(ingested_at) FROM ingest_manifest;")
+                count, latest = cur.fetchone()
+        return f"{count}:{latest}"
+
+    # Sucht bereits gespeicherte Keywords und Embeddings zu unveränderten Chunk-Texten
+    def lookup_known_chunks(self, chunk_hashes):
+        if not chunk_hashes:
+            return {}
+        with psql_pool.connection(self.db_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                SELECT DISTINCT ON (chunk_hash) chunk_hash, keywords, embedding::text
+                FROM chunks WHERE chunk_hash = ANY(%s);
+                """, (list(chunk_hashes),))
+                return {chunk_hash: (keywords, embedding) for chunk_hash, keywords, embedding in cur.fetchall()}
 
     # Vektorbasierte Suche in der Datenbank mit optionalem Keyword-Filter
     def search_chunks(self, query_text, keywords_filter=None, limit=3):
@@ -171,8 +348,6 @@ class PDFProcessor:
         query_embedding = self.embedding_client.embed_query(query_text)
 
         try:
-            conn = psycopg2.connect(**self.db_config)
-            cur = conn.cursor()
             if keywords_filter:
                 # Wenn ein Keyword-Filter gesetzt ist, wird dieser in der WHERE-Klausel verwendet.
                 query = """
@@ -193,77 +368,200 @@ class PDFProcessor:
                 """
                 params = (query_embedding, limit)
             
-            cur.execute(query, params)
-            results = cur.fetchall()
-            cur.close()
-            conn.close()
+            with psql_pool.connection(self.db_config) as conn:
+                with conn.cursor() as cur:
+                    # probes / ef_search des Vektorindex für diese Abfrage setzen
+                    vector_index.apply_search_settings(cur)
+                    cur.execute(query, params)
+                    results = cur.fetchall()
     
             return results
 
         except Exception as e:
             print("Error querying the database:", e)
+
+    # Asynchrone Suche für den ASGI-Modus: ohne psycopg 3 läuft die synchrone Suche in einem Thread
+    async def asearch_chunks(self, query_text, keywords_filter=None, limit=3):
+        if not psql_async_pool.available():
+            return await asyncio.to_thread(self.search_chunks, query_text, keywords_filter, limit)
+
+        query_embedding = await self.embedding_client.aembed_query(query_text)
+        # pgvector erwartet das Literal '[x, y, ...]'
+        vector_literal = str(query_embedding)
+        try:
+            if keywords_filter:
+                query = """
+                SELECT id, chunk_text, keywords
+                FROM chunks
+                WHERE keywords && %s::text[]
+                ORDER BY embedding <=> %s::vector
+                LIMIT %s;
+                """
+                params = (keywords_filter, vector_literal, limit)
+            else:
+                query = """
+                SELECT id, chunk_text, keywords
+                FROM chunks
+                ORDER BY embedding <=> %s::vector
+                LIMIT %s;
+                """
+                params = (vector_literal, limit)
+
+            async with psql_async_pool.connection(self.db_config) as conn:
+                async with conn.cursor() as cur:
+                    await vector_index.aapply_search_settings(cur)
+                    await cur.execute(query, params)
+                    return await cur.fetchall()
+
+        except Exception as e:
+            print("Error querying the database:", e)
     
-    # Hauptverarbeitungsschritt für PDF-Ordner
-    def process_pdfs(self, pdf_folder):
+    # Hauptverarbeitungsschritt für PDF-Ordner.
+    # Mit prune_missing=True werden Dateien, die nicht mehr im Ordner liegen, aus der DB entfernt.
+    def process_pdfs(self, pdf_folder, prune_missing=False):
         self.set_pdf_files(pdf_folder)
-        filenames_array = []
+        manifest, legacy_files = {}, set()
         try:
-            conn = psycopg2.connect(**self.db_config)
-            cur = conn.cursor()
-            # SQL-Abfrage: Eindeutige Filenames als Array abfragen
-            cur.execute("DROP INDEX IF EXISTS idx_chunks_embedding;")
-            print("Index dropped for performance increase.")
-            cur.execute("SELECT array_agg(DISTINCT filename) FROM chunks;")
-            filenames_array = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
+            self.ensure_manifest_schema()
+            manifest, legacy_files = self.load_manifest()
         except Exception as e:
-            print("Error extracting filenames from database:", e)
+            print("Error loading ingest manifest from database:", e)
 
-        for pdf_path in self.pdf_files:
+        # Kennzahlen für den Durchsatz
+        run_start = time.perf_counter()
+        stats = {"chunks": 0, "files": 0, "write_seconds": 0.0, "keyword_fallbacks": 0}
+        stats_lock = threading.Lock()
 
+        # Nur Dateien mit geändertem Inhalt werden per OCR neu verarbeitet
+        documents = []
+        seen_files = {os.path.basename(pdf_path) for pdf_path in self.pdf_files}
+        hash_to_file = {content_hash: name for name, content_hash in manifest.items()}
+        for pdf_path in self.pdf_files:
             filename=os.path.basename(pdf_path)
-            if filename in filenames_array:
-                print(f"File {filename} already processed, skipping...")
-                continue
-
-            print(f"Processing file: {pdf_path}")
-            text = self.extract_text(pdf_path)
-            chunks = self.chunk_text(text, self.max_tokens)
-
-            for i, chunk in enumerate(chunks):
-                keywords = self.get_keywords_with_gpt(chunk)
+            content_hash = self.file_content_hash(pdf_path)
 
-                # **Separates Embedding für Chunk-Text und Keywords**
-                chunk_embedding = self.embedding_client.embed_query(chunk)
-
-                # **Datenbank speichern**
-                self.insert_into_db(
-                    filename=filename,
-                    chunk_number=i + 1,
-                    chunk_text=chunk, 
-                    keywords=keywords,
-                    embedding=chunk_embedding
-                )
+            if manifest.get(filename) == content_hash:
+                print(f"File {filename} unchanged, skipping...")
+                continue
+            if filename in legacy_files:
+                # Vor Einführung des Manifests eingelesen: Stand übernehmen statt neu zu verarbeiten
+                self.register_in_manifest(filename, content_hash)
+                print(f"File {filename} already processed, registered in manifest.")
+                continue
+            source = hash_to_file.get(content_hash)
+            if source and source != filename and source not in seen_files:
+                self.move_chunks(source, filename, content_hash)
+                # Weitere Kopien desselben Inhalts beziehen sich ab jetzt auf den neuen Namen
+                hash_to_file[content_hash] = filename
+                manifest.pop(source, None)
+                print(f"File {source} was renamed to {filename}, moved its chunks.")
+                continue
+            if source and source != filename:
+                self.copy_chunks(source, filename, content_hash)
+                print(f"File {filename} is identical to {source}, reused its chunks.")
+                continue
+            documents.append({"path": pdf_path, "filename": filename, "content_hash": content_hash})
+
+        if prune_missing:
+            for filename in set(manifest) - seen_files:
+                self.delete_file(filename)
+                print(f"File {filename} no longer present, removed its chunks.")
+
+        # Keyword-Aufrufe laufen pro Chunk parallel, begrenzt durch Pool-Größe und Rate-Limit
+        keyword_executor = ThreadPoolExecutor(max_workers=INGEST_KEYWORD_WORKERS)
+        keyword_limiter = RateLimiter(INGEST_KEYWORD_RATE)
+        keyword_matcher = KeywordMatcher()
+
+        def limited_keywords(chunk):
+            keyword_limiter.wait()
+            try:
+                return self.get_keywords_with_gpt(chunk)
+            except Exception as e:
+                # Ein fehlgeschlagener Aufruf verwirft nicht die ganze Datei: lokale Alias-Zuordnung (ggf. leer)
+                print("Keyword generation failed, using local keyword matching:", e)
+                with stats_lock:
+                    stats["keyword_fallbacks"] += 1
+                return keyword_matcher.match_aliases(chunk)
+
+        # **Stufe 1: OCR über Document Intelligence**
+        def ocr_stage(doc):
+            print(f"Processing file: {doc['path']}")
+            doc["text"] = self.extract_text(doc["path"])
+            return doc
+
+        # **Stufe 2: Chunking und Abgleich mit bereits gespeicherten Chunk-Texten**
+        def chunk_stage(doc):
+            doc["chunks"] = self.chunk_text(doc.pop("text"), self.max_tokens)
+            known = self.lookup_known_chunks({self.text_hash(chunk) for chunk in doc["chunks"]})
+            cached = [known.get(self.text_hash(chunk)) for chunk in doc["chunks"]]
+            doc["keywords"] = [entry[0] if entry else None for entry in cached]
+            doc["embeddings"] = [entry[1] if entry else None for entry in cached]
+            doc["new"] = [i for i, entry in enumerate(cached) if entry is None]
+            print(f"{doc['filename']}: {len(doc['new'])} of {len(doc['chunks'])} chunks changed.")
+            return doc
+
+        # **Stufe 3: Keywords nur für geänderte Chunks (Reihenfolge bleibt durch map erhalten)**
+        def keyword_stage(doc):
+            new_chunks = [doc["chunks"][i] for i in doc["new"]]
+            for i, keywords in zip(doc["new"], keyword_executor.map(limited_keywords, new_chunks)):
+                doc["keywords"][i] = keywords
+            return doc
+
+        # **Stufe 4: Embeddings der geänderten Chunks gebündelt abrufen**
+        def embed_stage(doc):
+            new_chunks = [doc["chunks"][i] for i in doc["new"]]
+            if new_chunks:
+                for i, embedding in zip(doc["new"], self.embedding_client.embed_documents(new_chunks)):
+                    doc["embeddings"][i] = embedding
+            return doc
+
+        # **Stufe 5: Chunks der Datei gesammelt in einer Transaktion speichern**
+        def write_stage(doc):
+            rows = [(i + 1, chunk, keywords, embedding)
+                    for i, (chunk, keywords, embedding)
+                    in enumerate(zip(doc["chunks"], doc["keywords"], doc["embeddings"]))]
+            write_start = time.perf_counter()
+            success = self.insert_chunks_into_db(doc["filename"], rows, doc["content_hash"])
+            with stats_lock:
+                stats["write_seconds"] += time.perf_counter() - write_start
+                if success:
+                    stats["chunks"] += len(rows)
+                    stats["files"] += 1
+            if not success:
+                # Als Fehler der Stufe zählen (failed in den Pipeline-Statistiken)
+                raise RuntimeError(f"writing chunks of {doc['filename']} failed")
+            return doc
+
+        pipeline = IngestPipeline([
+            Stage("ocr", ocr_stage, INGEST_OCR_WORKERS, INGEST_QUEUE_SIZE, INGEST_OCR_RATE),
+            Stage("chunk", chunk_stage, 1, INGEST_QUEUE_SIZE),
+            Stage("keywords", keyword_stage, INGEST_KEYWORD_FILE_WORKERS, INGEST_QUEUE_SIZE),
+            Stage("embed", embed_stage, INGEST_EMBED_WORKERS, INGEST_QUEUE_SIZE, INGEST_EMBED_RATE),
+            Stage("write", write_stage, INGEST_WRITE_WORKERS, INGEST_QUEUE_SIZE),
+        ])
+        try:
+            pipeline.run(documents)
+        finally:
+            keyword_executor.shutdown()
+        pipeline.print_stats()
 
+        # Index bleibt während der Ingestion bestehen und wird nur bei Bedarf neu aufgebaut
         try:
-            conn = psycopg2.connect(**self.db_config)
-            cur = conn.cursor()
-            cur.execute("""CREATE INDEX IF NOT EXISTS idx_chunks_embedding
-                        ON chunks USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
-                        """)
-            conn.commit()
-            cur.close()
-            conn.close()
-            print("Index created succesfully.")
+            vector_index.ensure_index(self.db_config)
         except Exception as e:
-            print("Error creating index:", e)
+            print("Error maintaining index:", e)
                 
 
 
         print("All PDFs have been processed and stored in the database.")
 
+        total_seconds = time.perf_counter() - run_start
+        print(f"Ingested {stats['chunks']} chunks from {stats['files']} files in {total_seconds:.1f}s "
+              f"({stats['chunks'] / total_seconds if total_seconds else 0:.1f} chunks/s end-to-end, "
+              f"{stats['chunks'] / stats['write_seconds'] if stats['write_seconds'] else 0:.1f} chunks/s database write).")
+        if stats["keyword_fallbacks"]:
+            print(f"{stats['keyword_fallbacks']} chunks got locally matched keywords after a failed keyword call.")
+
 
 if __name__ == "__main__":
  
@@ -19,6 +19,11 @@ nltk.download('punkt_tab')
 os.chdir(sys.path[0])
 import yake
 
+try:
+    from backend.textprocessing import embedding_batcher
+except ImportError:  # Direkter Skriptaufruf aus dem textprocessing-Ordner
+    import embedding_batcher
+
 class AzureOpenAIEmbeddings(Embeddings):
     def __init__(self, api_key: str, api_base: str, model: str):
         self.api_key = api_key
@@ -27,14 +32,8 @@ class AzureOpenAIEmbeddings(Embeddings):
         self.client = AzureOpenAI(api_key=self.api_key, azure_endpoint=self.api_base, api_version="2024-08-01-preview")
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
-        embeddings = []
-        for text in texts:
-            response = self.client.embeddings.create(
-                input=text,
-                model=self.model
-            )
-            embeddings.append(response.data[0].embedding)
-        return embeddings
+        # Mehrere Texte pro Anfrage, Retry bei Drosselung, Reihenfolge bleibt erhalten
+        return embedding_batcher.embed_in_batches(self.client, self.model, texts)
 
     def embed_query(self, text: str) -> list[float]:
         response = self.client.embeddings.create(
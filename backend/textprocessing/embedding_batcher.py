@@ -0,0 +1,85 @@
+# Gebündelte Embedding-Anfragen an Azure OpenAI
+#
+# Statt pro Text eine HTTP-Anfrage zu senden, werden viele Texte in eine Anfrage
+# gepackt (begrenzt durch Anzahl und geschätzte Tokens). Bei Drosselung (429) oder
+# temporären Serverfehlern wird mit exponentiellem Backoff erneut versucht.
+# Die Reihenfolge der Embeddings entspricht immer der Reihenfolge der Eingabetexte.
+
+import os
+import random
+import time
+
+import openai
+
+# Limits pro Anfrage über .env konfigurierbar
+MAX_BATCH_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", 64))
+MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", 50000))
+MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 6))
+
+# Fehler, bei denen sich ein erneuter Versuch lohnt
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+# Grobe Token-Schätzung (ca. 4 Zeichen pro Token), reicht für die Batch-Grenzen
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# Teilt die Texte in Batches auf, die beide Limits einhalten; liefert Index-Listen
+def make_batches(texts: list[str], max_items: int = MAX_BATCH_ITEMS, max_tokens: int = MAX_BATCH_TOKENS) -> list[list[int]]:
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+# Wartezeit vor dem nächsten Versuch: Retry-After-Header oder exponentieller Backoff mit Jitter
+def _retry_delay(error, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return min(60.0, 2 ** attempt) + random.uniform(0, 1)
+
+
+# Eine Embedding-Anfrage mit Retry bei Drosselung
+def _create_with_retry(client, model: str, inputs: list[str]):
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return client.embeddings.create(input=inputs, model=model)
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _retry_delay(e, attempt)
+            print(f"Embedding request throttled/failed ({type(e).__name__}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+
+# Erzeugt Embeddings für alle Texte mit möglichst wenigen Anfragen
+def embed_in_batches(client, model: str, texts: list[str]) -> list[list[float]]:
+    embeddings = [None] * len(texts)
+    for batch in make_batches(texts):
+        response = _create_with_retry(client, model, [texts[i] for i in batch])
+        # Die API liefert einen Index je Eingabe; darüber wird die Reihenfolge gesichert
+        for item in response.data:
+            embeddings[batch[item.index]] = item.embedding
+    return embeddings
@@ -0,0 +1,120 @@
+# Cache für Query-Embeddings
+#
+# Häufig wiederholte Support-Fragen ("Wie verbinde ich ... Bluetooth") müssen nicht
+# jedes Mal neu über das Netzwerk eingebettet werden. Schlüssel ist der normalisierte
+# Fragetext. Erste Stufe ist ein LRU-Cache im Prozess mit TTL, optional ergänzt um
+# eine SQLite-Datei, die Neustarts übersteht.
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Konfiguration über .env (leerer Pfad = ohne Festplatten-Stufe)
+CACHE_MAX_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 1024))
+CACHE_TTL_SECONDS = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", 7 * 24 * 3600))
+CACHE_SQLITE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "")
+
+
+# Normalisiert eine Frage, damit nahezu identische Formulierungen denselben Schlüssel ergeben
+def normalize_query(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower().strip()
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip("?!.,;: ")
+
+
+class QueryEmbeddingCache:
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, sqlite_path=CACHE_SQLITE_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (created_at, embedding)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings "
+                "(key TEXT PRIMARY KEY, embedding TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return f"{model}:{normalize_query(text)}"
+
+    def _expired(self, created_at):
+        return time.time() - created_at > self.ttl_seconds
+
+    def _remember(self, key, created_at, embedding):
+        self._entries[key] = (created_at, embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not self._expired(entry[0]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT embedding, created_at FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[1]):
+                    embedding = json.loads(row[0])
+                    self._remember(key, row[1], embedding)
+                    self.disk_hits += 1
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def put(self, key, embedding):
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, created_at, embedding)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, embedding, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(embedding), created_at)
+                )
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+# Prozessweiter Cache, den alle Embedding-Clients teilen
+def shared_cache() -> QueryEmbeddingCache:
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = QueryEmbeddingCache()
+    return _shared_cache
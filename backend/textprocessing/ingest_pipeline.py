@@ -0,0 +1,115 @@
+# Gestufte, nebenläufige Verarbeitungspipeline für die PDF-Ingestion
+#
+# Jede Stufe (z.B. OCR -> Chunking -> Keywords -> Embeddings -> Schreiben) läuft
+# mit eigener Anzahl an Worker-Threads und liest aus einer begrenzten Queue.
+# Ist eine nachgelagerte Stufe ausgelastet, blockiert das Einstellen in ihre Queue
+# (Backpressure), sodass nie beliebig viele Zwischenergebnisse im Speicher liegen.
+# Optional begrenzt ein Rate-Limiter die Aufrufe pro Sekunde einer Stufe.
+
+import queue
+import threading
+import time
+
+# Markiert das Ende des Datenstroms
+_STOP = object()
+
+
+# Einfacher thread-sicherer Rate-Limiter (gleichmäßiger Abstand zwischen Aufrufen)
+class RateLimiter:
+
+    def __init__(self, calls_per_second):
+        self.interval = 1.0 / calls_per_second if calls_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Eine Pipeline-Stufe: Funktion, Parallelität, Queue-Größe und optionales Rate-Limit.
+# Gibt die Funktion None zurück, wird das Element nicht weitergereicht.
+class Stage:
+
+    def __init__(self, name, func, workers=1, queue_size=4, calls_per_second=0):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.rate_limiter = RateLimiter(calls_per_second)
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._finished_workers = 0
+
+
+class IngestPipeline:
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    def _worker(self, index):
+        stage = self.stages[index]
+        next_queue = self.stages[index + 1].queue if index + 1 < len(self.stages) else None
+
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                # Signal für die übrigen Worker dieser Stufe erhalten
+                stage.queue.put(_STOP)
+                break
+
+            stage.rate_limiter.wait()
+            start = time.perf_counter()
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                print(f"[{stage.name}] Error processing item, skipping:", e)
+                result = None
+                with stage._lock:
+                    stage.failed += 1
+            with stage._lock:
+                stage.busy_seconds += time.perf_counter() - start
+                if result is not None:
+                    stage.processed += 1
+
+            if result is not None and next_queue is not None:
+                next_queue.put(result)  # blockiert bei voller Queue (Backpressure)
+
+        # Der letzte beendete Worker gibt das Ende an die nächste Stufe weiter
+        with stage._lock:
+            stage._finished_workers += 1
+            last = stage._finished_workers == stage.workers
+        if last and next_queue is not None:
+            next_queue.put(_STOP)
+
+    def _feed(self, items):
+        first = self.stages[0].queue
+        for item in items:
+            first.put(item)
+        first.put(_STOP)
+
+    # Verarbeitet alle Elemente und wartet, bis jede Stufe leergelaufen ist
+    def run(self, items):
+        threads = [threading.Thread(target=self._feed, args=(items,), daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                threads.append(threading.Thread(target=self._worker, args=(index,),
+                                                name=f"{stage.name}-{n}", daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def print_stats(self):
+        for stage in self.stages:
+            print(f"Stage {stage.name:<10} workers={stage.workers:<3} processed={stage.processed:<5} "
+                  f"failed={stage.failed:<3} busy={stage.busy_seconds:.1f}s")
@@ -0,0 +1,132 @@
+# Lokale Keyword-Zuordnung für den Keyword-Filter der Vektorsuche
+#
+# Ersetzt den GPT-Aufruf pro Nutzerfrage: Die Frage wird über ein Alias-Wörterbuch
+# (deutsch/englisch) mit einfachem Stemming auf die feste Keyword-Liste abgebildet.
+# Findet sich kein Alias, kann optional über die Ähnlichkeit zwischen dem
+# Query-Embedding und vorab berechneten Keyword-Embeddings zugeordnet werden.
+
+import math
+import os
+import re
+import threading
+import unicodedata
+
+# Vordefinierte Keyword-Liste (identisch zur Liste bei der Ingestion)
+KEYWORDS_LIST = ["Bose", "Acoustimass", "Loudspeaker",
+                 "Subwoofer", "Surround", "Bluetooth", "Wi-Fi",
+                 "DSP", "Amplifier", "Crossover", "Bass",
+                 "Treble", "Mounting", "Wireless", "Impedance", "Dolby",
+                 "EQ", "Frequency", "Signal", "Audio"
+                 ]
+
+# Aliase je Keyword; mehrteilige Aliase werden als Wortfolge gesucht
+KEYWORD_ALIASES = {
+    "Bose": ["bose", "quietcomfort", "soundlink", "soundtouch", "sounddock", "soundsport", "freespace", "l1 pro", "s1 pro"],
+    "Acoustimass": ["acoustimass", "acousti mass"],
+    "Loudspeaker": ["loudspeaker", "lautsprecher", "speaker", "box", "boxen", "soundbar"],
+    "Subwoofer": ["subwoofer", "sub", "bassmodul", "bass module"],
+    "Surround": ["surround", "raumklang", "heimkino", "home cinema", "home theater", "5.1"],
+    "Bluetooth": ["bluetooth", "koppeln", "kopplung", "gekoppelt", "pairing", "pair"],
+    "Wi-Fi": ["wi-fi", "wifi", "wlan", "netzwerk", "network", "router"],
+    "DSP": ["dsp", "signalprozessor", "signal processor"],
+    "Amplifier": ["amplifier", "verstärker", "amp", "endstufe"],
+    "Crossover": ["crossover", "frequenzweiche", "weiche"],
+    "Bass": ["bass", "tiefton", "tieftöner", "tiefen"],
+    "Treble": ["treble", "höhen", "hochton", "hochtöner"],
+    "Mounting": ["mounting", "mount", "montage", "montieren", "wandhalterung", "halterung", "befestigen", "aufhängen", "wandmontage"],
+    "Wireless": ["wireless", "kabellos", "drahtlos", "funk"],
+    "Impedance": ["impedance", "impedanz", "ohm"],
+    "Dolby": ["dolby", "atmos"],
+    "EQ": ["eq", "equalizer", "klangregelung", "klangeinstellung"],
+    "Frequency": ["frequency", "frequenz", "frequenzgang", "hz", "hertz"],
+    "Signal": ["signal", "eingangssignal", "audiosignal", "input", "eingang"],
+    "Audio": ["audio", "ton", "sound", "klang"],
+}
+
+# Beschreibungen für die Embedding-Ähnlichkeit (Fallback)
+KEYWORD_DESCRIPTIONS = {keyword: f"{keyword}: {', '.join(aliases)}" for keyword, aliases in KEYWORD_ALIASES.items()}
+
+MAX_KEYWORDS = 3
+EMBEDDING_MIN_SIMILARITY = float(os.getenv("KEYWORD_MATCHER_MIN_SIMILARITY", 0.78))
+EMBEDDING_FALLBACK_KEYWORDS = int(os.getenv("KEYWORD_MATCHER_FALLBACK_KEYWORDS", 2))
+
+_SUFFIXES = ("ungen", "ung", "ern", "en", "er", "es", "em", "e", "n", "s")
+
+
+# Sehr einfaches Stemming für deutsche und englische Wortformen
+def stem(token: str) -> str:
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    text = unicodedata.normalize("NFKC", text).lower()
+    return [stem(token) for token in re.findall(r"[\w.\-]+", text)]
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class KeywordMatcher:
+
+    def __init__(self, embedding_client=None):
+        # Optionaler Client mit embed_query/embed_documents für den Ähnlichkeits-Fallback
+        self.embedding_client = embedding_client
+        self._keyword_vectors = None
+        self._lock = threading.Lock()
+        # Aliase vorab in Stamm-Folgen übersetzen
+        self._alias_stems = [
+            (keyword, tuple(tokenize(alias)))
+            for keyword, aliases in KEYWORD_ALIASES.items()
+            for alias in aliases
+        ]
+
+    # Alias-Treffer: Keywords nach Anzahl Treffer und erster Fundstelle sortiert
+    def match_aliases(self, text: str) -> list[str]:
+        tokens = tokenize(text)
+        scores = {}
+        for keyword, alias in self._alias_stems:
+            n = len(alias)
+            for position in range(len(tokens) - n + 1):
+                if tuple(tokens[position:position + n]) == alias:
+                    count, first = scores.get(keyword, (0, position))
+                    scores[keyword] = (count + 1, min(first, position))
+        ranked = sorted(scores, key=lambda keyword: (-scores[keyword][0], scores[keyword][1]))
+        return ranked[:MAX_KEYWORDS]
+
+    # Keyword-Embeddings werden einmal pro Prozess in einem gebündelten Aufruf berechnet
+    def _get_keyword_vectors(self):
+        if self._keyword_vectors is None:
+            with self._lock:
+                if self._keyword_vectors is None:
+                    vectors = self.embedding_client.embed_documents(list(KEYWORD_DESCRIPTIONS.values()))
+                    self._keyword_vectors = dict(zip(KEYWORD_DESCRIPTIONS, vectors))
+        return self._keyword_vectors
+
+    def match_embedding(self, text: str) -> list[str]:
+        if self.embedding_client is None:
+            return []
+        # Das Query-Embedding wird ohnehin für die Suche benötigt und liegt danach im Cache
+        query_vector = self.embedding_client.embed_query(text)
+        similarities = sorted(
+            ((_cosine(query_vector, vector), keyword) for keyword, vector in self._get_keyword_vectors().items()),
+            reverse=True
+        )
+        return [keyword for similarity, keyword in similarities[:EMBEDDING_FALLBACK_KEYWORDS]
+                if similarity >= EMBEDDING_MIN_SIMILARITY]
+
+    # Liefert 0 bis 3 Keywords aus KEYWORDS_LIST für den Filter
+    def match(self, text: str) -> list[str]:
+        keywords = self.match_aliases(text)
+        if not keywords:
+            try:
+                keywords = self.match_embedding(text)
+            except Exception as e:
+                print("Embedding fallback for keyword matching failed:", e)
+                keywords = []
+        return keywords
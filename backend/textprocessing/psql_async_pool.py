@@ -0,0 +1,77 @@
+# Asynchroner Connection-Pool für die PostgreSQL-Vektordatenbank (ASGI-Modus).
+#
+# Gegenstück zu psql_pool für den asynchronen Serving-Stack: Die Vektorsuche
+# wartet auf die Datenbank, ohne einen Worker-Thread zu blockieren. Benötigt
+# psycopg 3 mit psycopg_pool; fehlt das Paket, bleibt `available()` False und
+# die Aufrufer weichen auf den synchronen Pool in einem Thread aus.
+
+import os
+import asyncio
+from contextlib import asynccontextmanager
+
+try:
+    from psycopg.conninfo import make_conninfo
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:  # psycopg 3 ist optional
+    make_conninfo = None
+    AsyncConnectionPool = None
+
+try:
+    from backend.textprocessing.psql_pool import KEEPALIVE_KWARGS
+except ImportError:  # Direkter Skriptaufruf aus dem textprocessing-Ordner
+    from psql_pool import KEEPALIVE_KWARGS
+
+POOL_MIN_CONN = int(os.getenv("PSQL_ASYNC_POOL_MIN_CONN", 1))
+POOL_MAX_CONN = int(os.getenv("PSQL_ASYNC_POOL_MAX_CONN", 20))
+# Sekunden, nach denen ungenutzte Verbindungen über min_size hinaus geschlossen werden
+POOL_MAX_IDLE = float(os.getenv("PSQL_ASYNC_POOL_MAX_IDLE", 300))
+
+_pools = {}
+_pools_lock = asyncio.Lock()
+
+
+def available() -> bool:
+    return AsyncConnectionPool is not None
+
+
+def _conninfo(db_config) -> str:
+    # make_conninfo quotet Werte mit Leerzeichen oder Sonderzeichen (z.B. Passwörter);
+    # nicht gesetzte Werte (None) fallen weg, statt als "None" übergeben zu werden
+    params = {**db_config, **KEEPALIVE_KWARGS}
+    return make_conninfo(**{key: value for key, value in params.items() if value is not None})
+
+
+async def get_pool(db_config):
+    # Ein Pool pro Datenbank-Konfiguration und Event-Loop-Prozess
+    key = tuple(sorted(db_config.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        async with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = AsyncConnectionPool(
+                    _conninfo(db_config),
+                    min_size=POOL_MIN_CONN,
+                    max_size=POOL_MAX_CONN,
+                    max_idle=POOL_MAX_IDLE,
+                    # Verbindung vor jeder Ausgabe prüfen, damit gekappte Verbindungen ersetzt werden
+                    check=AsyncConnectionPool.check_connection,
+                    open=False,
+                )
+                await pool.open()
+                _pools[key] = pool
+    return pool
+
+
+@asynccontextmanager
+async def connection(db_config):
+    """Leiht eine Verbindung aus; Commit bzw. Rollback übernimmt psycopg beim Verlassen."""
+    pool = await get_pool(db_config)
+    async with pool.connection() as conn:
+        yield conn
+
+
+async def close_all():
+    while _pools:
+        _, pool = _pools.popitem()
+        await pool.close()
@@ -0,0 +1,151 @@
+# Prozessweiter, thread-sicherer Connection-Pool für die PostgreSQL-Vektordatenbank.
+#
+# Statt bei jeder Suche und jedem eingefügten Chunk eine neue Verbindung
+# (TCP + TLS + Authentifizierung) aufzubauen, werden Verbindungen hier einmal
+# geöffnet und wiederverwendet. Alle Such- und Ingest-Pfade holen sich ihre
+# Verbindung über `connection(db_config)`.
+
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+# Poolgrößen und Health-Check-Intervall über .env konfigurierbar
+POOL_MIN_CONN = int(os.getenv("PSQL_POOL_MIN_CONN", 1))
+POOL_MAX_CONN = int(os.getenv("PSQL_POOL_MAX_CONN", 10))
+HEALTHCHECK_INTERVAL = float(os.getenv("PSQL_POOL_HEALTHCHECK_SECONDS", 30))
+
+# TCP-Keepalives, damit Azure inaktive Verbindungen nicht stillschweigend kappt
+KEEPALIVE_KWARGS = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 5,
+}
+
+# Fehler, nach denen eine Verbindung nicht mehr vertrauenswürdig ist
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class PSQLConnectionPool:
+
+    def __init__(self, db_config, minconn=POOL_MIN_CONN, maxconn=POOL_MAX_CONN):
+        self.db_config = dict(db_config)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **self.db_config, **KEEPALIVE_KWARGS)
+        # Begrenzt gleichzeitige Ausleihen, damit bei vollem Pool gewartet statt PoolError geworfen wird
+        self._slots = threading.BoundedSemaphore(maxconn)
+        # Zeitpunkt der letzten erfolgreichen Nutzung je Verbindung (für Health-Checks)
+        self._last_used = {}
+
+    # Prüft eine Verbindung, die länger als HEALTHCHECK_INTERVAL ungenutzt war
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn), 0)
+        if time.monotonic() - last_used < HEALTHCHECK_INTERVAL:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except CONNECTION_ERRORS:
+            return False
+
+    def getconn(self):
+        self._slots.acquire()
+        try:
+            # Auch die Ersatzverbindung prüfen: Nach einem Netzwerkausfall können mehrere
+            # gekappte Verbindungen im Pool liegen; spätestens nach maxconn Versuchen wird neu verbunden
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                # Defekte Verbindung verwerfen und neu aufbauen (Reconnect)
+                print("Discarding broken database connection, reconnecting...")
+                self._discard(conn)
+            raise psycopg2.OperationalError("No healthy database connection available")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, broken=False):
+        try:
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def closeall(self):
+        self._last_used.clear()
+        self._pool.closeall()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Liefert den prozessweiten Pool für eine Datenbankkonfiguration (lazy angelegt)
+def get_pool(db_config):
+    key = tuple(sorted(db_config.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = PSQLConnectionPool(db_config)
+                _pools[key] = pool
+    return pool
+
+
+# Leiht eine Verbindung aus dem Pool aus; Commit bei Erfolg, Rollback bei Fehler.
+# autocommit=True wird für Befehle benötigt, die keine Transaktion erlauben
+# (z.B. CREATE INDEX CONCURRENTLY).
+@contextmanager
+def connection(db_config, autocommit=False):
+    pool = get_pool(db_config)
+    conn = pool.getconn()
+    broken = False
+    try:
+        if autocommit:
+            conn.autocommit = True
+        yield conn
+        conn.commit()
+    except CONNECTION_ERRORS:
+        broken = True
+        raise
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        if autocommit and not conn.closed:
+            try:
+                conn.autocommit = False
+            except CONNECTION_ERRORS:
+                broken = True
+        pool.putconn(conn, broken=broken)
+
+
+# Schließt alle Pools, z.B. beim Beenden des Prozesses
+def close_all():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
+
+atexit.register(close_all)
@@ -0,0 +1,123 @@
+# Verwaltung des Vektorindex auf chunks.embedding
+#
+# Der Index wird nicht mehr bei jedem Ingest-Lauf gelöscht und neu erstellt,
+# sondern nur, wenn er fehlt, die Methode gewechselt wurde oder (bei ivfflat)
+# die Zeilenzahl seit dem letzten Aufbau deutlich gewachsen ist. Neue Indizes
+# werden mit CREATE INDEX CONCURRENTLY unter einem temporären Namen gebaut und
+# erst danach gegen den alten getauscht, sodass die Suche nie ohne Index läuft.
+
+import math
+import os
+
+try:
+    from backend.textprocessing import psql_pool
+except ImportError:  # Direkter Skriptaufruf aus dem textprocessing-Ordner
+    import psql_pool
+
+INDEX_NAME = "idx_chunks_embedding"
+BUILD_NAME = "idx_chunks_embedding_build"
+
+# Konfiguration über .env
+INDEX_METHOD = os.getenv("VECTOR_INDEX_METHOD", "ivfflat").lower()  # ivfflat | hnsw
+REBUILD_GROWTH = float(os.getenv("VECTOR_INDEX_REBUILD_GROWTH", 0.3))  # Anteil Zuwachs bis zum Neuaufbau
+IVFFLAT_PROBES = int(os.getenv("VECTOR_INDEX_IVFFLAT_PROBES", 10))
+HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", 16))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", 64))
+HNSW_EF_SEARCH = int(os.getenv("VECTOR_INDEX_HNSW_EF_SEARCH", 40))
+
+
+# Anzahl der ivfflat-Listen nach pgvector-Empfehlung: rows/1000 bis 1 Mio. Zeilen, darüber sqrt(rows)
+def ivfflat_lists(row_count):
+    if row_count <= 1_000_000:
+        return max(1, row_count // 1000)
+    return int(math.sqrt(row_count))
+
+
+def _index_sql(name, method, row_count):
+    if method == "hnsw":
+        return (f"CREATE INDEX CONCURRENTLY {name} ON chunks USING hnsw (embedding vector_cosine_ops) "
+                f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});"), None
+    lists = ivfflat_lists(row_count)
+    return (f"CREATE INDEX CONCURRENTLY {name} ON chunks USING ivfflat (embedding vector_cosine_ops) "
+            f"WITH (lists = {lists});"), lists
+
+
+def _ensure_state_table(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS vector_index_state (
+        index_name TEXT PRIMARY KEY,
+        method TEXT NOT NULL,
+        lists INTEGER,
+        row_count BIGINT NOT NULL,
+        built_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """)
+
+
+# Prüft, ob ein (Neu-)Aufbau nötig ist; liefert den Grund oder None
+def rebuild_reason(index_exists, state, method, row_count):
+    if not index_exists:
+        return "index missing"
+    if state is None or state[0] != method:
+        return f"method changed to {method}"
+    # HNSW wächst beim Einfügen mit, nur ivfflat-Listen veralten mit der Datenmenge
+    if method == "ivfflat" and row_count > state[1] * (1 + REBUILD_GROWTH):
+        return f"row count grew from {state[1]} to {row_count}"
+    return None
+
+
+# Stellt sicher, dass ein passender Vektorindex existiert; baut ihn nur bei Bedarf neu
+def ensure_index(db_config, method=INDEX_METHOD, force=False):
+    with psql_pool.connection(db_config) as conn:
+        with conn.cursor() as cur:
+            _ensure_state_table(cur)
+            cur.execute("SELECT count(*) FROM chunks;")
+            row_count = cur.fetchone()[0]
+            cur.execute("SELECT 1 FROM pg_indexes WHERE tablename = 'chunks' AND indexname = %s;", (INDEX_NAME,))
+            index_exists = cur.fetchone() is not None
+            cur.execute("SELECT method, row_count FROM vector_index_state WHERE index_name = %s;", (INDEX_NAME,))
+            state = cur.fetchone()
+
+    reason = "forced" if force else rebuild_reason(index_exists, state, method, row_count)
+    if reason is None:
+        print(f"Vector index {INDEX_NAME} is up to date ({method}, {row_count} rows), no rebuild needed.")
+        return False
+
+    print(f"Building vector index {INDEX_NAME} ({method}) concurrently: {reason}.")
+    create_sql, lists = _index_sql(BUILD_NAME, method, row_count)
+    # CONCURRENTLY ist nur außerhalb einer Transaktion erlaubt
+    with psql_pool.connection(db_config, autocommit=True) as conn:
+        with conn.cursor() as cur:
+            # Reste eines abgebrochenen Aufbaus (ungültiger Index) entfernen
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {BUILD_NAME};")
+            cur.execute(create_sql)
+            # Alter Index bleibt bis hierhin aktiv; danach übernimmt der neue
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME};")
+            cur.execute(f"ALTER INDEX {BUILD_NAME} RENAME TO {INDEX_NAME};")
+
+    with psql_pool.connection(db_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            INSERT INTO vector_index_state (index_name, method, lists, row_count, built_at)
+            VALUES (%s, %s, %s, %s, now())
+            ON CONFLICT (index_name) DO UPDATE
+            SET method = EXCLUDED.method, lists = EXCLUDED.lists, row_count = EXCLUDED.row_count, built_at = now();
+            """, (INDEX_NAME, method, lists, row_count))
+    print(f"Vector index {INDEX_NAME} built ({method}, lists={lists}, {row_count} rows).")
+    return True
+
+
+# Setzt die Suchparameter des Index für die laufende Transaktion (vor der Vektorsuche aufrufen)
+def apply_search_settings(cursor, method=INDEX_METHOD):
+    if method == "hnsw":
+        cursor.execute("SET LOCAL hnsw.ef_search = %s;", (HNSW_EF_SEARCH,))
+    else:
+        cursor.execute("SET LOCAL ivfflat.probes = %s;", (IVFFLAT_PROBES,))
+
+
+# Variante für asynchrone psycopg-3-Cursor (serverseitige Parameter sind bei SET nicht erlaubt)
+async def aapply_search_settings(cursor, method=INDEX_METHOD):
+    if method == "hnsw":
+        await cursor.execute(f"SET LOCAL hnsw.ef_search = {int(HNSW_EF_SEARCH)};")
+    else:
+        await cursor.execute(f"SET LOCAL ivfflat.probes = {int(IVFFLAT_PROBES)};")